@@ -27,7 +27,9 @@ def get_args():
     return parse.parse_args()
 
 
-def bic_calculation(ds, features_in_ds, z_dim, var_name_mdl, nk, corr_dist, coord_dict, first_date):
+def bic_calculation(ds, features_in_ds, z_dim, var_name_mdl, nk, corr_dist, coord_dict, first_date,
+                    backend='serial', n_jobs=None, random_state=0, warm_start=False, early_stopping=False,
+                    patience=3, band=1., coarse_step=1, shared_preprocessing=False, validate_warm_start=False):
     """
     The BIC (Bayesian Information Criteria) can be used to optimize the number of classes in the model, trying not to
     over-fit or under-fit the data. To compute this index, the model is fitted to the training dataset for a range of K
@@ -40,6 +42,16 @@ def bic_calculation(ds, features_in_ds, z_dim, var_name_mdl, nk, corr_dist, coor
     z_dim : z axis dimension (depth)
     var_name_mdl : name of the variable in the model
     nk : number of K to explore (always starts at 1 up to nk)
+    backend : parallel backend used for the model fits: 'serial', 'thread', 'process' or 'joblib'
+    n_jobs : number of workers, None to use all the available cores
+    random_state : seed for reproducible BIC curves (default 0), None for a random one
+    warm_start : if True, use a warm-started sweep over K instead of independent fits
+    early_stopping : if True, stop increasing K once the BIC minimum is confirmed
+    patience : number of consecutive K significantly above the minimum needed to stop (early stopping)
+    band : significance threshold in standard deviations of the per-run BIC differences (early stopping)
+    coarse_step : step of the coarse grid of K, refined around its minimum (early stopping)
+    shared_preprocessing : if True, fit the preprocessing once on the training set and gather the rows of each run
+    validate_warm_start : if True, compare the warm-started sweep of the first run with cold-start fits
 
     Returns
     -------
@@ -55,7 +67,12 @@ def bic_calculation(ds, features_in_ds, z_dim, var_name_mdl, nk, corr_dist, coor
     bic, bic_min = utils.BIC_calculation.BIC_calculation(ds=ds, coords_dict=coord_dict,
                                                          corr_dist=corr_dist, time_steps=time_steps,
                                                          pcm_features=pcm_features, features_in_ds=features_in_ds, z_dim=z_dim,
-                                                         Nrun=nrun, NK=nk)
+                                                         Nrun=nrun, NK=nk, backend=backend, n_jobs=n_jobs,
+                                                         random_state=random_state, warm_start=warm_start,
+                                                         early_stopping=early_stopping, patience=patience, band=band,
+                                                         coarse_step=coarse_step,
+                                                         shared_preprocessing=shared_preprocessing,
+                                                         validate_warm_start=validate_warm_start)
     return bic, bic_min
 
 
@@ -183,6 +200,17 @@ def main_bic_computation(args):
         var_name_ds: string, name var in dataset
         var_name_mdl: string, name var in model
         corr_dist: int, correlation distance
+        bic_backend: string, optional, parallel backend ('serial', 'thread', 'process', 'joblib'), default 'serial'
+        n_jobs: int, optional, number of workers, default all the available cores
+        random_state: int, optional, seed of the BIC curve (default 0, None for a random one)
+        bic_warm_start: bool, optional, warm-started sweep over K (default False)
+        bic_validate_warm_start: bool, optional, compare the warm-started sweep with cold starts (default False)
+        bic_early_stopping: bool, optional, stop increasing K once the minimum is confirmed (default False)
+        bic_patience: int, optional, early stopping patience (default 3)
+        bic_band: float, optional, early stopping threshold in standard deviations (default 1)
+        bic_coarse_step: int, optional, early stopping coarse grid step (default 1, no coarse grid)
+        bic_shared_preprocessing: bool, optional, fit the preprocessing once for all the runs (default False)
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
     """
     file_name = args['file']
     nk = args['nk']
@@ -190,7 +218,7 @@ def main_bic_computation(args):
     var_name_mdl = args['id_field']
     corr_dist = args['corr_dist']
     features_in_ds = {var_name_mdl: var_name_ds}
-    arguments_str = f"file_name: {file_name} " \
+    arguments_str = f"file_name: {describe_files(file_name)} " \
                     f"nk: {nk}" \
                     f"var_name_ds: {var_name_ds} " \
                     f"var_name_mdl: {var_name_mdl} " \
@@ -200,7 +228,8 @@ def main_bic_computation(args):
     # ---------------- Load data --------------- #
     logging.info("loading the dataset")
     start_time = time.time()
-    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds,
+                                           **get_load_options(args))
     z_dim = coord_dict['depth']
     load_time = time.time() - start_time
     logging.info("load finished in " + str(load_time) + "sec")
@@ -209,7 +238,15 @@ def main_bic_computation(args):
     logging.info("starting computation")
     start_time = time.time()
     bic, bic_min = bic_calculation(ds=ds, features_in_ds=features_in_ds, z_dim=z_dim, var_name_mdl=var_name_mdl, nk=nk,
-                                   corr_dist=corr_dist, coord_dict=coord_dict, first_date=first_date)
+                                   corr_dist=corr_dist, coord_dict=coord_dict, first_date=first_date,
+                                   backend=args.get('bic_backend', 'serial'), n_jobs=args.get('n_jobs'),
+                                   random_state=args.get('random_state', 0),
+                                   warm_start=args.get('bic_warm_start', False),
+                                   early_stopping=args.get('bic_early_stopping', False),
+                                   patience=int(args.get('bic_patience', 3)), band=float(args.get('bic_band', 1.)),
+                                   coarse_step=int(args.get('bic_coarse_step', 1)),
+                                   shared_preprocessing=args.get('bic_shared_preprocessing', False),
+                                   validate_warm_start=args.get('bic_validate_warm_start', False))
     bic_time = time.time() - start_time
     logging.info("computation finished in " + str(bic_time) + "sec")
 
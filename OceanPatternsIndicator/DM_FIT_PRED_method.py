@@ -1,7 +1,7 @@
 import logging
 import time
 import numpy as np
-from utils.data_loader_utils import load_data
+from utils.data_loader_utils import load_data, get_load_options, describe_files
 from utils.model_train_utils import train_model
 from utils.prediction_utils import predict, robustness, quantiles, generate_plots
 
@@ -36,13 +36,15 @@ def main_fit_predict(args):
         k: int, number of class
         var_name: string, name var in dataset
         id_field: string, standard name of var
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
+        quantile_method: string, optional, 'exact' (default), 'sketch' (approximate) or 'pyxpcm'
     """        
     var_name_ds = args['var_name']
     var_name_mdl = args['id_field']
     features_in_ds = {var_name_mdl: var_name_ds}
     k = args['k']
     file_name = args['file']
-    arguments_str = f"file_name: {file_name} " \
+    arguments_str = f"file_name: {describe_files(file_name)} " \
                     f"var_name_ds: {var_name_ds} " \
                     f"var_name_mdl: {var_name_mdl} "
     logging.info(f"Ocean patterns fit predict method launched with the following arguments:\n {arguments_str}")
@@ -50,7 +52,8 @@ def main_fit_predict(args):
     # ---------------- Load data --------------- #
     logging.info("loading the dataset")
     start_time = time.time()
-    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds,
+                                           **get_load_options(args))
     zmax = int(args['working_domain']['depth_layers'][0][1])
     ds = ds.where(np.abs(ds.depth)<zmax,drop=True)
 
@@ -70,7 +73,7 @@ def main_fit_predict(args):
     start_time = time.time()
     ds = predict(m=m, ds=ds, var_name_mdl=var_name_mdl, var_name_ds=var_name_ds, z_dim=z_dim)
     ds = robustness(m=m, ds=ds, features_in_ds=features_in_ds, z_dim=z_dim)
-    ds = quantiles(ds=ds, m=m, var_name_ds=var_name_ds)
+    ds = quantiles(ds=ds, m=m, var_name_ds=var_name_ds, method=args.get('quantile_method', 'exact'))
     generate_plots(m=m, ds=ds, var_name_ds=var_name_ds, first_date=first_date)
     predict_time = time.time() - start_time
     logging.info("prediction and plots finished in " + str(predict_time) + "sec")
@@ -2,7 +2,7 @@ import logging
 import time
 
 from utils.Plotter import Plotter
-from utils.data_loader_utils import load_data
+from utils.data_loader_utils import load_data, get_load_options, describe_files
 from utils.model_train_utils import train_model
 from utils.prediction_utils import predict, robustness
 
@@ -36,13 +36,14 @@ def main_model_fit(args):
         k: int, number of class
         var_name: string, name var in dataset
         id_field: string, standard name of var
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
     """
     var_name_ds = args['var_name']
     var_name_mdl = args['id_field']
     features_in_ds = {var_name_mdl: var_name_ds}
     k = args['k']
     file_name = args['file']
-    arguments_str = f"\tfile_name: {file_name} \n" \
+    arguments_str = f"\tfile_name: {describe_files(file_name)} \n" \
                     f"\tvar_name_ds: {var_name_ds} \n" \
                     f"\tvar_name_mdl: {var_name_mdl} \n" \
                     f"\tk: {k}"
@@ -50,7 +51,8 @@ def main_model_fit(args):
     # ----------- loading data ---------- #
     logging.info("loading the dataset")
     start_time = time.time()
-    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds,
+                                           **get_load_options(args))
     z_dim = coord_dict['depth']
     load_time = time.time() - start_time
     logging.info("load finished in " + str(load_time) + "sec")
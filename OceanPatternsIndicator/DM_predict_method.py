@@ -3,8 +3,8 @@ import time
 
 import pyxpcm
 
-from utils.data_loader_utils import load_data
-from utils.prediction_utils import predict, robustness, quantiles, generate_plots
+from utils.data_loader_utils import load_data, get_load_options, describe_files
+from utils.prediction_utils import predict, predict_by_time_blocks, robustness, quantiles, generate_plots
 from download.storagehubfacility import storagehubfacility as sthubf, check_json
 
 
@@ -57,13 +57,18 @@ def main_predict(args):
         model: string, model path
         var_name: string, name var in dataset
         id_field: string, standard name of var
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
+        quantile_method: string, optional, 'exact' (default), 'sketch' (approximate) or 'pyxpcm'. With
+        months_per_block the quantiles are always computed with the sketch, block by block
+        months_per_block: int, optional, stream the prediction over the time axis by blocks of N months, each block is
+        appended to predicted_dataset.nc
     """
     var_name_ds = args['var_name']
     var_name_mdl = args['id_field']
     features_in_ds = {var_name_mdl: var_name_ds}
     model_path = args['model']
     file_name = args['file']
-    arguments_str = f"\tfile_name: {file_name} \n" \
+    arguments_str = f"\tfile_name: {describe_files(file_name)} \n" \
                     f"\tvar_name_ds: {var_name_ds} \n" \
                     f"\tvar_name_mdl: {var_name_mdl} \n" \
                     f"\tmodel: {model_path} \n"
@@ -72,7 +77,8 @@ def main_predict(args):
     # ------------ loading data and model ----------- #
     logging.info("loading the dataset and model")
     start_time = time.time()
-    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds, first_date, coord_dict = load_data(file_name=file_name, var_name_ds=var_name_ds,
+                                           **get_load_options(args))
     logging.info(f"loadin dataset finished: {ds}")
     z_dim = coord_dict['depth']
     m = load_model(model_id=model_path)
@@ -82,10 +88,21 @@ def main_predict(args):
     # ------------ predict and plot ----------- #
     logging.info("starting predictions and plots")
     start_time = time.time()
-    ds = predict(m=m, ds=ds, var_name_mdl=var_name_mdl, var_name_ds=var_name_ds, z_dim=z_dim)
-    ds = robustness(m=m, ds=ds, features_in_ds=features_in_ds, z_dim=z_dim)
-    ds = quantiles(ds=ds, m=m, var_name_ds=var_name_ds)
-    generate_plots(m=m, ds=ds, var_name_ds=var_name_ds, first_date=first_date)
+    months_per_block = args.get('months_per_block')
+    if months_per_block:
+        logging.info(f"streaming prediction by blocks of {months_per_block} month(s)")
+        if args.get('quantile_method', 'sketch') != 'sketch':
+            logging.warning("streaming prediction: the quantiles are computed with the sketch method")
+        ds = predict_by_time_blocks(m=m, ds=ds, var_name_mdl=var_name_mdl, var_name_ds=var_name_ds, z_dim=z_dim,
+                                    time_dim=coord_dict['time'], months_per_block=int(months_per_block),
+                                    out_file='predicted_dataset.nc')
+    else:
+        ds = predict(m=m, ds=ds, var_name_mdl=var_name_mdl, var_name_ds=var_name_ds, z_dim=z_dim)
+        ds = robustness(m=m, ds=ds, features_in_ds=features_in_ds, z_dim=z_dim)
+        ds = quantiles(ds=ds, m=m, var_name_ds=var_name_ds, method=args.get('quantile_method', 'exact'))
+    generate_plots(m=m, ds=ds, var_name_ds=var_name_ds, first_date=first_date, save_dataset=not months_per_block)
+    if months_per_block:
+        ds.close()
     predict_time = time.time() - start_time
     logging.info("prediction and plots finished in " + str(predict_time) + "sec")
 
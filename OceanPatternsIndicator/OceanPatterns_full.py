@@ -1,7 +1,8 @@
 ﻿import json
 import time
 
-from download import daccess
+from download import scheduler
+from download.config import catalogue
 import sys
 import os
 import logging
@@ -64,8 +65,16 @@ def download_data(param):
             },
         'start_time': '2018-01',
         'end_time': '2018-12',
-        'data_source': 'MEDSEA_MULTIYEAR_PHY_006_004'
+        'data_source': 'MEDSEA_MULTIYEAR_PHY_006_004',
+        'download_workers': 4,  # optional, maximum number of concurrent monthly downloads
+        'in_memory': False,  # optional, if True the files are kept in memory and passed to load_data without disk
+        'spill_threshold': 536870912,  # optional, files bigger than this size (bytes) are written on disk anyway
+        'subset_domain': True  # optional, keep only the variable, box and depth range of the downloaded files
     }
+
+    Returns
+    -------
+    list of the downloaded files: paths, and memoryviews of the files kept in memory
     """
     # ------------ parameter declaration ------------ #
     dataset = param['data_source'][0]   # data_source is a list of str
@@ -73,15 +82,26 @@ def download_data(param):
     fields = [param['id_field']]
 
     # ------------ file download ------------ #
-    dcs = daccess.Daccess(dataset, fields)
+    # monthly requests are submitted together, their polling and transfers overlap (see DownloadScheduler)
+    dcs = scheduler.DownloadScheduler(dataset, fields, max_workers=param.get('download_workers', 4))
     time_range_list = time_utils.get_time_range_wd(param['start_time'], param['end_time'])
-    daccess_working_domain = dict()
-    daccess_working_domain['depth'] = param['working_domain']['depth_layers'][0].copy()
-    daccess_working_domain['lonLat'] = param['working_domain']['box'][0].copy()
+    daccess_working_domain_list = list()
     for time_range in time_range_list:
+        daccess_working_domain = dict()
+        daccess_working_domain['depth'] = param['working_domain']['depth_layers'][0].copy()
+        daccess_working_domain['lonLat'] = param['working_domain']['box'][0].copy()
         daccess_working_domain['time'] = time_range
+        # working domain used to subset the downloaded files, same format as load_data
+        daccess_working_domain['box'] = param['working_domain']['box'][0].copy()
+        daccess_working_domain['depth_range'] = param['working_domain']['depth_layers'][0].copy()
         logging.info(daccess_working_domain)
-        dcs.download(daccess_working_domain, rm_file=False)
+        daccess_working_domain_list.append(daccess_working_domain)
+    download_options = {'rm_file': False, 'return_type': 'buffer', 'in_memory': param.get('in_memory', False),
+                        'subset_domain': param.get('subset_domain', True)}
+    if 'spill_threshold' in param:
+        download_options['spill_threshold'] = param['spill_threshold']
+    nc_files = dcs.download(daccess_working_domain_list, **download_options)
+    return [nc_file for month_files in nc_files for nc_file in month_files]
 
 
 def get_var_name(source, cf_std_name):
@@ -96,17 +116,7 @@ def get_var_name(source, cf_std_name):
     -------
     string: name of the variable in dataset
     """
-    actual_dir = os.path.dirname(__file__)
-    with open('./download/config/dataset_infrastructures.json') as json_infra:
-        infra = json.load(json_infra)
-        if infra[source]['infrastructure'] == "WEKEO" :
-            config_path = './download/config/wekeo_dataset.json'
-        elif infra[source]['infrastructure'] == "STHUB" :
-            config_path = './download/config/sthub_dataset.json'
-
-    with open(config_path) as json_file:
-        data = json.load(json_file)
-    return data[source]['cf-standard-name_variable'][cf_std_name][0]
+    return catalogue.get_var_name(source, cf_std_name)
 
 
 def main():
@@ -128,7 +138,7 @@ def main():
     logging.info(f"Ocean patterns launched with the following arguments:\n {param_dict}")
     try:
         start_time = time.time()
-        download_data(param_dict)
+        downloaded_files = download_data(param_dict)
         download_time = time.time() - start_time
         logging.info("download finished in " + str(download_time) + "sec")
 
@@ -138,7 +148,9 @@ def main():
         error_exit(err_log, exec_log)
     try:
         param_dict['var_name'] = get_var_name(param_dict['data_source'][0], param_dict['id_field'])
-        param_dict['file'] = './indir/*.nc'
+        # only the files of this request: ./indir can hold full files or subsets of other domains.
+        # In-memory files are passed as they are to load_data, without disk round trip
+        param_dict['file'] = downloaded_files
         if param_dict['id_output_type'] == "BIC":
             logging.info("launching BIC")
             main_bic_computation(param_dict)
@@ -0,0 +1,73 @@
+import functools
+import json
+import os
+
+CONFIG_DIR = os.path.dirname(__file__)
+# dataset configuration file of each infrastructure
+INFRASTRUCTURE_CONFIG = {'WEKEO': 'wekeo_dataset', 'STHUB': 'sthub_dataset'}
+
+
+@functools.lru_cache(maxsize=None)
+def load(name):
+    """
+    @param name: name of a json file of the config directory, without extension
+    @return: the parsed file, read only once per process (the returned dict is shared, do not modify it)
+    """
+    with open(os.path.join(CONFIG_DIR, name + '.json')) as json_file:
+        return json.load(json_file)
+
+
+@functools.lru_cache(maxsize=None)
+def get_type_file_maps():
+    """
+    @return: (field_by_type_file, type_file_by_field): type file (e.g. TEMP) -> list of cf standard names, and the
+        reverse map cf standard name -> type file
+    """
+    field_by_type_file = load('filename')
+    type_file_by_field = dict()
+    for type_file, fields in field_by_type_file.items():
+        for field in fields:
+            type_file_by_field.setdefault(field, type_file)
+    return field_by_type_file, type_file_by_field
+
+
+@functools.lru_cache(maxsize=None)
+def get_dataset_field_map(name, dataset):
+    """
+    @param name: dataset configuration file (wekeo_dataset or sthub_dataset)
+    @param dataset: source dataset
+    @return: dict variable -> dataset field (e.g. thetao -> TEMP)
+    """
+    dataset_field_by_variable = dict()
+    for dataset_field, d_vars in load(name)[dataset]['dataset_variable'].items():
+        for d_var in d_vars:
+            dataset_field_by_variable.setdefault(d_var, dataset_field)
+    return dataset_field_by_variable
+
+
+def get_infrastructure(dataset):
+    """
+    @param dataset: source dataset
+    @return: infrastructure of the dataset (WEKEO or STHUB)
+    """
+    dataset_infrastructures = load('dataset_infrastructures')
+    if dataset not in dataset_infrastructures:
+        raise Exception("Can't find dataset: " + dataset + ' in catalogue')
+    return dataset_infrastructures[dataset]['infrastructure']
+
+
+def get_dataset_config(dataset):
+    """
+    @param dataset: source dataset
+    @return: configuration of the dataset, from the configuration file of its infrastructure
+    """
+    return load(INFRASTRUCTURE_CONFIG[get_infrastructure(dataset)])[dataset]
+
+
+def get_var_name(dataset, cf_std_name):
+    """
+    @param dataset: source dataset
+    @param cf_std_name: cf standard name of the variable
+    @return: name of the variable in dataset
+    """
+    return get_dataset_config(dataset)['cf-standard-name_variable'][cf_std_name][0]
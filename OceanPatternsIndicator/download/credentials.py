@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # no file locking (e.g. windows): the disk cache is disabled
+    fcntl = None
+
+# HDA access token validity in seconds
+TOKEN_LIFETIME = 3600
+# the Terms and Conditions acceptance is checked again after one day
+TANDC_LIFETIME = 24 * 3600
+# a credential is refreshed when it expires within REFRESH_MARGIN seconds
+REFRESH_MARGIN = 300
+
+
+def credential_key(kind, secret):
+    """
+    @param kind: type of credential (e.g. 'hda_token')
+    @param secret: secret that identifies the user (api key, gcube token), only its hash is kept in the key
+    @return: key of the credential in the cache
+    """
+    return kind + ':' + hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+
+class CredentialCache:
+    def __init__(self, cache_file=None):
+        """
+        Credentials (access tokens, Terms and Conditions acceptance) shared by all the Daccess instances of the
+        process, with expiry-aware refresh
+        @param cache_file: optional json file where the credentials are also stored, to share them between processes
+            (e.g. back-to-back jobs); the file is locked while a credential is read or refreshed
+        """
+        self.cache_file = cache_file if fcntl is not None else None
+        self._values = dict()  # key -> (value, expiry time)
+        self._locks = dict()
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _valid(self, entry):
+        return entry is not None and entry[1] - time.time() > REFRESH_MARGIN
+
+    def get(self, key, fetch, lifetime):
+        """
+        @param key: credential key (see credential_key)
+        @param fetch: function without arguments that requests a new credential
+        @param lifetime: validity of a new credential in seconds
+        @return: a valid credential, fetched only if the cached one is missing or about to expire
+        """
+        with self._key_lock(key):
+            entry = self._values.get(key)
+            if self._valid(entry):
+                return entry[0]
+            if self.cache_file is None:
+                entry = (fetch(), time.time() + lifetime)
+            else:
+                entry = self._get_from_file(key, fetch, lifetime)
+            self._values[key] = entry
+            return entry[0]
+
+    def _get_from_file(self, key, fetch, lifetime):
+        with open(self.cache_file + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                content = dict()
+                if os.path.exists(self.cache_file):
+                    try:
+                        with open(self.cache_file) as f:
+                            content = json.load(f)
+                    except ValueError:
+                        content = dict()
+                entry = tuple(content[key]) if key in content else None
+                if not self._valid(entry):
+                    entry = (fetch(), time.time() + lifetime)
+                    content[key] = list(entry)
+                    self._write_file(content)
+                return entry
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_file(self, content):
+        tmp_file = self.cache_file + '.tmp'
+        # the file contains access tokens: readable only by the user
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def invalidate(self, key):
+        """
+        Remove a credential (e.g. an access token refused by the server), in memory and on disk
+        """
+        with self._key_lock(key):
+            self._values.pop(key, None)
+            if self.cache_file is None or not os.path.exists(self.cache_file):
+                return
+            with open(self.cache_file + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with open(self.cache_file) as f:
+                        content = json.load(f)
+                    if content.pop(key, None) is not None:
+                        self._write_file(content)
+                except ValueError:
+                    pass
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_gcube_tokens = dict()
+
+
+def get_cache():
+    """
+    @return: the CredentialCache of the process, stored on disk in the file given by the environment variable
+        DACCESS_CREDENTIAL_CACHE if set
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CredentialCache(os.environ.get('DACCESS_CREDENTIAL_CACHE'))
+        return _cache
+
+
+def get_gcube_token(globalVariablesFile):
+    """
+    @param globalVariablesFile: file with the gcube token
+    @return: the gcube token, read only once per process (see utils.get_gcube_token)
+    """
+    from download import utils
+
+    with _cache_lock:
+        if globalVariablesFile not in _gcube_tokens:
+            _gcube_tokens[globalVariablesFile] = utils.get_gcube_token(globalVariablesFile)
+        return _gcube_tokens[globalVariablesFile]
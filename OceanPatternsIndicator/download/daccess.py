@@ -1,7 +1,6 @@
-import os
-import json
 import sys
 
+from download.config import catalogue
 from download.contexts.input_ctx import InputContext
 from download.contexts.download_ctx import DownloadContext
 from download.wekeo import in_hda, hda
@@ -12,15 +11,7 @@ workingDomain_attrs_optional = ['depth']
 
 
 def get_infrastructure(dataset):
-    actual_dir = os.path.dirname(__file__)
-    with open(actual_dir + '/config/dataset_infrastructures.json') as json_file:
-        dataset_infrastructures = json.load(json_file)
-    if dataset in dataset_infrastructures:
-        infrastructure = dataset_infrastructures[dataset]['infrastructure']
-    else:
-        raise Exception("Can't find dataset: " + dataset + ' in catalogue')
-
-    return infrastructure
+    return catalogue.get_infrastructure(dataset)
 
 
 class Daccess:
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# connections kept alive for each host
+POOL_MAXSIZE = 10
+# retry policy of the idempotent requests (GET, PUT...), POST are never retried (a job/order could be submitted twice)
+RETRY_POLICY = {'total': 3, 'backoff_factor': 1., 'status_forcelist': (429, 500, 502, 503, 504)}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    @return: the requests.Session shared by the HDA and StorageHub requests: the connections are kept alive and reused
+        by the next requests to the same host (no new TCP/TLS handshake for each month downloaded)
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # raise_on_status=False: once the retries are exhausted the last response is returned, the callers check
+            # the status code
+            retry = Retry(raise_on_status=False, **RETRY_POLICY)
+            adapter = HTTPAdapter(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
+
+
+def put(url, **kwargs):
+    return get_session().put(url, **kwargs)
+
+
+class TTLCache:
+    def __init__(self, ttl):
+        """
+        Thread safe cache whose values expire ttl seconds after their computation
+        @param ttl: time to live in seconds
+        """
+        self.ttl = ttl
+        self._values = dict()  # key -> (value, computation time)
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        @param key: cache key
+        @param compute: function without arguments that computes the value if it is missing or expired
+        @return: the cached value of key
+        """
+        with self._lock:
+            if key in self._values:
+                value, computation_time = self._values[key]
+                if time.time() - computation_time < self.ttl:
+                    return value
+        value = compute()
+        with self._lock:
+            self._values[key] = (value, time.time())
+        return value
+
+    def invalidate(self, key=None):
+        """
+        @param key: key to remove, None to clear the cache
+        """
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
@@ -11,7 +11,8 @@ class DownloadStrategy(ABC):
 
     @abstractmethod
     def download(self, dataset, working_domain, fields,
-                 in_memory=False, rm_file=False, max_attempt=5, return_type="netCDF4"):
+                 in_memory=False, rm_file=False, max_attempt=5, return_type="netCDF4", spill_threshold=None,
+                 subset_domain=False):
         """
         @param dataset: source dataset
         @param working_domain: dict with spatial/time information, each strategy defines its own format
@@ -21,5 +22,9 @@ class DownloadStrategy(ABC):
         @param max_attempt: maximum number of download attempt in case of errors
         @param return_type: if netCDF4 return a netCDF4.Dataset, if str return the output filename
                             if is str, please disable rm_file and in_memory
+                            if buffer return a memoryview on the file downloaded in memory, or the output
+                            filename of a file on disk (both can be passed to load_data)
+        @param spill_threshold: files bigger than spill_threshold bytes are written on disk even if in_memory is True
+        @param subset_domain: if True only the requested variables and working domain are kept from the downloaded files
         """
         pass
@@ -0,0 +1,344 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+from download import http_session, utils
+
+CHUNK_SIZE = 64738
+# items bigger than one segment are downloaded with parallel HTTP Range requests
+SEGMENT_SIZE = 16 * 1024 ** 2
+MAX_WORKERS = 4
+# bytes written by a segment between two saves of the download state
+STATE_INTERVAL = 4 * 1024 ** 2
+
+
+def validator(r):
+    """
+    @param r: response of the server
+    @return: strong ETag or Last-Modified of the item, used in If-Range to check that it did not change, None if the
+    server does not send them
+    """
+    etag = r.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return r.headers.get('Last-Modified')
+
+
+def request_range(url, start, end, headers=None, if_range=None, **kwargs):
+    """
+    Request the bytes [start, end) of an item. With if_range the server answers 206 only if the item still matches
+    the validator, otherwise it sends the whole item with 200.
+    @return: streamed response
+    """
+    headers = dict(headers or {}, Range='bytes={}-{}'.format(start, end - 1))
+    if if_range:
+        headers['If-Range'] = if_range
+    return http_session.get(url, headers=headers, stream=True, **kwargs)
+
+
+def range_size(r):
+    """
+    @return: size of the item from the Content-Range of a 206 response, 0 if unknown
+    """
+    total = r.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+    return int(total) if total.isdigit() else 0
+
+
+def iter_response(r, start, end):
+    """
+    Stream the bytes [start, end) of an item from a 206 response, chunk by chunk
+    """
+    for chunk in r.iter_content(CHUNK_SIZE):
+        yield chunk[:end - start]
+        start += len(chunk)
+        if start >= end:
+            break
+    if start < end:
+        raise Exception("Download error: connection closed before the end of the range")
+
+
+def iter_range(url, start, end, headers=None, if_range=None, **kwargs):
+    """
+    Stream the bytes [start, end) of an item, chunk by chunk
+    """
+    with request_range(url, start, end, headers, if_range, **kwargs) as r:
+        if r.status_code == 200 and if_range:
+            raise Exception("Download error: the item changed on the server during the download")
+        if r.status_code != 206:
+            raise Exception("Download error, status code: " + str(r.status_code))
+        yield from iter_response(r, start, end)
+
+
+def file_checksum(filename, start, end):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        while start < end:
+            chunk = f.read(min(CHUNK_SIZE, end - start))
+            if not chunk:
+                break
+            sha.update(chunk)
+            start += len(chunk)
+    return sha.hexdigest()
+
+
+class Progress:
+    def __init__(self, total_length, dl=0, dl_status=False):
+        self.total_length = total_length
+        self.dl = dl
+        self.dl_status = dl_status
+        self.start = time.process_time()
+        self._lock = threading.Lock()
+
+    def update(self, n):
+        with self._lock:
+            self.dl += n
+            if self.dl_status:
+                utils.show_dl_percentage(self.dl, self.start, self.total_length)
+
+
+class PartialDownload:
+    def __init__(self, destination, size, validator=None, segment_size=SEGMENT_SIZE):
+        """
+        State of a resumable download: the item is written in destination.part and the progress of each segment in
+        destination.part.json. A segment is checked against its sha256 when the download is resumed, the bytes of a
+        segment in progress are kept up to the last saved state. The state records the validator of the item and the
+        segments are requested with If-Range, so the parts of an item changed on the server are never mixed.
+        @param destination: output file
+        @param size: size of the item in bytes
+        @param validator: ETag or Last-Modified of the item, None if the server does not send them (no resume)
+        @param segment_size: size of the segments downloaded in parallel
+        """
+        self.destination = destination
+        self.part_file = destination + '.part'
+        self.state_file = destination + '.part.json'
+        self.size = size
+        self.validator = validator
+        self._lock = threading.Lock()
+        self.segments = self.load()
+        if self.segments is None:
+            self.segments = [{'start': start, 'end': min(start + segment_size, size), 'done': 0, 'checksum': None}
+                             for start in range(0, size, segment_size)]
+            with open(self.part_file, 'wb') as f:
+                f.truncate(size)
+            self.save()
+
+    @staticmethod
+    def saved_state(destination):
+        """
+        @param destination: output file
+        @return: state of an interrupted download of destination, None if there is none or it has no validator
+        """
+        state_file = destination + '.part.json'
+        if not os.path.exists(state_file) or not os.path.exists(destination + '.part'):
+            return None
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except ValueError:
+            return None
+        return state if state.get('validator') else None
+
+    @staticmethod
+    def pending_range(state):
+        """
+        @return: (start, end) still to download in the first incomplete segment of a saved state, None if complete
+        """
+        for segment in state['segments']:
+            offset = segment['start'] + segment['done']
+            if offset < segment['end']:
+                return offset, segment['end']
+        return None
+
+    def load(self):
+        state = self.saved_state(self.destination)
+        if state is None or state.get('size') != self.size or state['validator'] != self.validator \
+                or os.path.getsize(self.part_file) != self.size:
+            return None
+        segments = state['segments']
+        for segment in segments:
+            if segment['checksum'] is not None \
+                    and file_checksum(self.part_file, segment['start'], segment['end']) != segment['checksum']:
+                print("Corrupted segment {}-{}, download it again".format(segment['start'], segment['end']))
+                segment['done'] = 0
+                segment['checksum'] = None
+        self.segments = segments
+        print("Resume download of {}: {:.2f} MB already downloaded"
+              .format(self.destination, self.downloaded() / (1024 * 1024)))
+        return segments
+
+    def save(self):
+        tmp_file = self.state_file + '.tmp'
+        # the segments save the state from several threads through the same temporary file
+        with self._lock:
+            with open(tmp_file, 'w') as f:
+                json.dump({'size': self.size, 'validator': self.validator, 'segments': self.segments}, f)
+            os.replace(tmp_file, self.state_file)
+
+    def downloaded(self):
+        return sum(segment['done'] for segment in self.segments)
+
+    def download_segment(self, url, segment, progress, headers, kwargs, response=None):
+        """
+        @param response: 206 response already opened at the current offset of the segment, None to request it
+        """
+        offset = segment['start'] + segment['done']
+        if offset < segment['end']:
+            if response is None:
+                chunks = iter_range(url, offset, segment['end'], headers, self.validator, **kwargs)
+            else:
+                chunks = iter_response(response, offset, segment['end'])
+            with open(self.part_file, 'r+b') as f:
+                f.seek(offset)
+                unsaved = 0
+                for chunk in chunks:
+                    f.write(chunk)
+                    unsaved += len(chunk)
+                    progress.update(len(chunk))
+                    if unsaved >= STATE_INTERVAL:
+                        # the state is saved only once the bytes are on disk
+                        f.flush()
+                        os.fsync(f.fileno())
+                        segment['done'] += unsaved
+                        unsaved = 0
+                        self.save()
+                f.flush()
+                os.fsync(f.fileno())
+                segment['done'] += unsaved
+        if segment['checksum'] is None:
+            segment['checksum'] = file_checksum(self.part_file, segment['start'], segment['end'])
+            self.save()
+
+    def complete(self):
+        os.replace(self.part_file, self.destination)
+        os.remove(self.state_file)
+
+
+def response_size(r):
+    """
+    @return: size of the whole item from a 206 or 200 response, 0 if unknown
+    """
+    return range_size(r) if r.status_code == 206 else int(r.headers.get('Content-Length', 0))
+
+
+def download_file(url, destination, size=0, headers=None, max_workers=MAX_WORKERS, dl_status=False, **kwargs):
+    """
+    Download an item in destination with constant memory. If the server supports HTTP Range requests, the item is
+    split in segments downloaded in parallel and an interrupted download is resumed from destination.part if the
+    item did not change (If-Range), otherwise it is streamed in a single request. The first request is also the
+    request of the first segment, the support of Range requests is read from its response.
+    @param url: item address
+    @param destination: output file
+    @param size: size of the item in bytes, 0 if unknown
+    @param headers: HTTP headers
+    @param max_workers: maximum number of parallel segments
+    @param dl_status: if True show the download percentage
+    @param kwargs: arguments of requests.get (timeout, allow_redirects...)
+    """
+    state = PartialDownload.saved_state(destination)
+    if state is not None:
+        # resume from the first incomplete segment, the whole item is sent back (200) if it changed
+        start, end = PartialDownload.pending_range(state) or (state['size'] - 1, state['size'])
+        if_range = state['validator']
+    else:
+        start, end, if_range = 0, SEGMENT_SIZE, None
+
+    r = request_range(url, start, end, headers, if_range, **kwargs)
+    with r:
+        if r.status_code not in (200, 206):
+            raise Exception("Download error, status code: " + str(r.status_code))
+        size = response_size(r) or size
+        print("Downloading " + destination)
+        print("File size is: %8.2f MB" % (size / (1024 * 1024)))
+
+        if r.status_code == 206 and size > 0:
+            partial = PartialDownload(destination, size, validator(r))
+            progress = Progress(size, partial.downloaded(), dl_status)
+            workers = max(1, min(max_workers, len(partial.segments)))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                # the segment at the requested offset is read from the first response
+                futures = [executor.submit(partial.download_segment, url, segment, progress, headers, kwargs,
+                                           r if segment['start'] + segment['done'] == start and segment['end'] <= end
+                                           else None)
+                           for segment in partial.segments]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                # keep the progress of the completed chunks for the next attempt
+                partial.save()
+            partial.complete()
+        else:
+            if state is not None:
+                print("The item changed on the server, download it again")
+                os.remove(destination + '.part.json')
+            progress = Progress(size or None, 0, dl_status)
+            if r.status_code != 200:
+                r = http_session.get(url, headers=headers, stream=True, **kwargs)
+            with r:
+                if r.status_code != 200:
+                    raise Exception("Download error, status code: " + str(r.status_code))
+                with open(destination + '.part', 'wb') as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        progress.update(len(chunk))
+            os.replace(destination + '.part', destination)
+
+    try:
+        print("[%8.2f] MB downloaded, %8.2f kbps" % (
+            progress.dl / (1024 * 1024), (progress.dl / (time.process_time() - progress.start)) / 1024))
+    except ZeroDivisionError:
+        pass
+
+
+def download_memory(url, size=0, headers=None, max_workers=MAX_WORKERS, **kwargs):
+    """
+    Download an item in memory: the chunks are written in place in a single buffer (no copy of the whole response),
+    with parallel Range requests if the server supports them. The first request is also the request of the first
+    segment, the other segments are requested with If-Range.
+    @param url: item address
+    @param size: size of the item in bytes, 0 if unknown
+    @param headers: HTTP headers
+    @param max_workers: maximum number of parallel segments
+    @param kwargs: arguments of requests.get (timeout, allow_redirects...)
+    @return: bytearray with the content of the item
+    """
+    r = request_range(url, 0, SEGMENT_SIZE, headers, **kwargs)
+    with r:
+        if r.status_code not in (200, 206):
+            raise Exception("Download error, status code: " + str(r.status_code))
+        size = response_size(r) or size
+        if r.status_code == 206 and size > 0:
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            if_range = validator(r)
+
+            def download_segment(start, end, response=None):
+                if response is None:
+                    chunks = iter_range(url, start, end, headers, if_range, **kwargs)
+                else:
+                    chunks = iter_response(response, start, end)
+                for chunk in chunks:
+                    view[start:start + len(chunk)] = chunk
+                    start += len(chunk)
+
+            segments = [(start, min(start + SEGMENT_SIZE, size)) for start in range(0, size, SEGMENT_SIZE)]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(segments)))) as executor:
+                futures = [executor.submit(download_segment, start, end, r if start == 0 else None)
+                           for start, end in segments]
+            for future in futures:
+                future.result()
+            return buffer
+
+        if r.status_code != 200:
+            r = http_session.get(url, headers=headers, stream=True, **kwargs)
+        with r:
+            if r.status_code != 200:
+                raise Exception("Download error, status code: " + str(r.status_code))
+            buffer = bytearray()
+            for chunk in r.iter_content(CHUNK_SIZE):
+                buffer += chunk
+            return buffer
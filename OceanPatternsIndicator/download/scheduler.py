@@ -0,0 +1,82 @@
+import concurrent.futures
+import queue
+import threading
+import time
+
+from download import daccess
+
+# per-infrastructure limits: max number of concurrent downloads and min interval (seconds) between two job submissions
+RATE_LIMITS = {
+    'WEKEO': {'max_concurrent': 4, 'min_interval': 1.},
+    'STHUB': {'max_concurrent': 4, 'min_interval': 0.5},
+}
+
+
+class RateLimiter:
+    def __init__(self, max_concurrent, min_interval):
+        """
+        Limit the number of concurrent requests and space out their start, to be used as a context manager
+        @param max_concurrent: maximum number of requests running at the same time
+        @param min_interval: minimum interval in seconds between the start of two requests
+        """
+        self.min_interval = min_interval
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_start = 0.
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.time()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._semaphore.release()
+
+
+class DownloadScheduler:
+    def __init__(self, dataset: str, fields: list, max_workers=4, output_dir=None, hda_key="", rate_limits=None):
+        """
+        Concurrent download of several working domains (e.g. one per month) of the same dataset: all the requests are
+        submitted up front to a bounded pool of workers, so job polling and file transfers of different months overlap.
+        @param dataset: source dataset
+        @param fields: cf standard name used to represent a variable
+        @param max_workers: maximum number of concurrent downloads
+        @param output_dir: output directory
+        @param hda_key: key to access to hda service, leave "" if you want to use bluecloud proxy
+        @param rate_limits: dict infrastructure -> {'max_concurrent': int, 'min_interval': float}, default RATE_LIMITS
+        """
+        infrastructure = daccess.get_infrastructure(dataset)
+        limits = (rate_limits or RATE_LIMITS).get(infrastructure, {'max_concurrent': max_workers, 'min_interval': 0.})
+        self.max_workers = max(1, min(max_workers, limits['max_concurrent']))
+        self.rate_limiter = RateLimiter(limits['max_concurrent'], limits['min_interval'])
+
+        # one Daccess per worker: the input/download strategies keep the state of the request in progress
+        self._daccess_pool = queue.Queue()
+        for _ in range(self.max_workers):
+            self._daccess_pool.put(daccess.Daccess(dataset, fields, output_dir=output_dir, hda_key=hda_key))
+
+    def _download(self, daccess_working_domain, kwargs):
+        dcs = self._daccess_pool.get()
+        try:
+            with self.rate_limiter:
+                return dcs.download(daccess_working_domain, **kwargs)
+        finally:
+            self._daccess_pool.put(dcs)
+
+    def download(self, daccess_working_domain_list: list, **kwargs):
+        """
+        @param daccess_working_domain_list: list of working domains (see Daccess.download)
+        @param kwargs: arguments of Daccess.download
+        @return: list with the result of Daccess.download for each working domain, in the same order.
+            If some downloads fail, the others are completed before raising the first error,
+            so the files already downloaded are kept in the download directory
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._download, working_domain, kwargs)
+                       for working_domain in daccess_working_domain_list]
+        return [future.result() for future in futures]
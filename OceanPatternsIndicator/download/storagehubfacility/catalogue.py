@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import tempfile
+import time
+
+from download import http_session
+from download.storagehubfacility import storagehubfacility as sthubf, check_json
+
+# time to live in seconds of the workspace listing, in memory and on disk
+CATALOGUE_TTL = 6 * 3600
+# catalogues already loaded in this process, shared by all the StHub instances (e.g. the DownloadScheduler workers)
+_catalogues = http_session.TTLCache(CATALOGUE_TTL)
+
+
+def month_keys(file_name):
+    """
+    @param file_name: name of a file of the workspace
+    @return: every 6 digit substring of file_name, candidates YYYYMM (YYYYMM01_m*, *_YYYYMM.nc, *YYYYMM_YYYYMM.nc)
+    """
+    return set(re.findall(r'(?=(\d{6}))', file_name))
+
+
+class Catalogue:
+    def __init__(self, files, file_types):
+        """
+        Index of the files of a workspace directory by (file type, YYYYMM)
+        @param files: list of (id, file_name, size) of the directory
+        @param file_types: file types of the dataset (e.g. TEMP, PSAL)
+        """
+        self.index = dict()  # 'file_type/YYYYMM' -> list of (id, file_name, size), in listing order
+        for file in files:
+            for file_type in file_types:
+                if file_type in file[1]:
+                    for month in month_keys(file[1]):
+                        self.index.setdefault(file_type + '/' + month, []).append(tuple(file))
+
+    def find(self, file_types, times):
+        """
+        @param file_types: types of files desired
+        @param times: list of dates YYYY, YYYYMM or YYYYMMDD
+        @return: list of (id, file_name, size) of the files with one of the file types and one of the dates in the name
+        """
+        found = list()
+        for t in times:
+            months = [t[:6]] if len(t) >= 6 else [t + str(month).zfill(2) for month in range(1, 13)]
+            for file_type in file_types:
+                for month in months:
+                    for file in self.index.get(file_type + '/' + month, []):
+                        if t in file[1] and file not in found:
+                            found.append(file)
+        return found
+
+    def to_json(self):
+        return {'time': time.time(), 'index': self.index}
+
+    @classmethod
+    def from_json(cls, content):
+        catalogue = cls([], [])
+        catalogue.index = {key: [tuple(file) for file in files] for key, files in content['index'].items()}
+        return catalogue
+
+
+def list_workspace(dir_id, outdir):
+    """
+    @param dir_id: StorageHub id of the dataset directory
+    @param outdir: directory of the temporary listing file
+    @return: list of (id, file_name, size) of the directory
+    """
+    print("START ItemChildren")
+    fd, listing_file = tempfile.mkstemp(dir=outdir, prefix='.sthub_listing_', suffix='.json')
+    os.close(fd)
+    try:
+        myshfo = sthubf.StorageHubFacility(operation="ItemChildren", ItemId=dir_id, localFile=listing_file)
+        myshfo.main()
+        with open(listing_file) as f:
+            return check_json.get_id(json.load(f))
+    finally:
+        os.remove(listing_file)
+
+
+def load_catalogue(dir_id, file_types, outdir, ttl=CATALOGUE_TTL):
+    """
+    Catalogue of a dataset directory: from memory, else from outdir/.sthub_catalogue_<dir_id>.json if younger than
+    ttl, else the workspace is listed again and the catalogue saved
+    @param dir_id: StorageHub id of the dataset directory
+    @param file_types: file types of the dataset
+    @param outdir: download directory, where the catalogue is stored
+    @param ttl: time to live in seconds of the stored catalogue
+    @return: Catalogue
+    """
+    catalogue_file = os.path.join(outdir, '.sthub_catalogue_' + dir_id + '.json')
+
+    def read_or_list():
+        if os.path.exists(catalogue_file):
+            try:
+                with open(catalogue_file) as f:
+                    content = json.load(f)
+                if time.time() - content['time'] < ttl:
+                    return Catalogue.from_json(content)
+            except (ValueError, KeyError):
+                pass  # corrupted catalogue, list the workspace again
+        catalogue = Catalogue(list_workspace(dir_id, outdir), file_types)
+        tmp_file = catalogue_file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(catalogue.to_json(), f)
+        os.replace(tmp_file, catalogue_file)
+        return catalogue
+
+    return _catalogues.get((dir_id, os.path.abspath(outdir)), read_or_list)
+
+
+def invalidate_catalogue(dir_id, outdir):
+    _catalogues.invalidate((dir_id, os.path.abspath(outdir)))
+    catalogue_file = os.path.join(outdir, '.sthub_catalogue_' + dir_id + '.json')
+    if os.path.exists(catalogue_file):
+        os.remove(catalogue_file)
@@ -6,8 +6,8 @@
 # Created on 2018/06/15 
 # 
 import requests
+from download import ranged_download, utils
 from .storagehubcommand import StorageHubCommand
-from download import utils
 
 
 class StorageHubCommandItemDownload(StorageHubCommand):
@@ -19,44 +19,22 @@ class StorageHubCommandItemDownload(StorageHubCommand):
         self.destinationFile = destinationFile
         self.itemSize = itemSize
 
-    def execute(self, in_memory=False, dl_status=False):
+    def execute(self, in_memory=False, dl_status=False, return_type="netCDF4"):
         print("Execute StorageHubCommandItemDownload")
         # print(self.storageHubUrl + "/items/" + self.itemId + "/download?");
 
         urlString = self.storageHubUrl + "/items/" + self.itemId + "/download?gcube-token=" + self.gcubeToken
+        # parallel Range requests and resume of download interrupted, constant memory (see ranged_download)
         try:
-            r = requests.get(urlString, stream=True, timeout=10, allow_redirects=False)
-        except:
-            raise Exception("ERROR Connection timeout")
-        print(r.status_code)
-        if r.status_code != 200:
-            print("Download error: " + str(r.status_code))
-            raise Exception("Error in execute StorageHubCommandItemDownload: " + str(r.status_code))
-        if not in_memory:
-            with open(self.destinationFile, 'wb') as file:
-                if self.itemSize == 0:
-                    file.write(r.content)
-                else:
-                    import time
-                    # filename = os.path.join(directory, file_name)
-                    print("Downloading " + self.destinationFile)
-                    start = time.process_time()
-                    print("File size is: %8.2f MB" % (self.itemSize / (1024 * 1024)))
-                    dl = 0
-                    for chunk in r.iter_content(64738):
-                        dl += len(chunk)
-                        file.write(chunk)
-                        if dl_status:
-                            utils.show_dl_percentage(dl, start, self.itemSize)
-                    try:
-                        print("[%8.2f] MB downloaded, %8.2f kbps" % (
-                            dl / (1024 * 1024), (dl / (time.process_time() - start)) / 1024))
-                    except:
-                        pass
-
-        else:
-            import netCDF4
-            return netCDF4.Dataset(self.destinationFile, mode='r', memory=r.content)
+            if not in_memory:
+                ranged_download.download_file(urlString, self.destinationFile, size=self.itemSize, dl_status=dl_status,
+                                              timeout=10, allow_redirects=False)
+            else:
+                memory = ranged_download.download_memory(urlString, size=self.itemSize, timeout=10,
+                                                         allow_redirects=False)
+                return utils.memory_file(memory, self.destinationFile, return_type)
+        except requests.exceptions.RequestException as e:
+            raise Exception("ERROR Connection error: {}".format(e))
 
     def __str__(self):
         return 'StorageHubCommandItemDownload[itemId=' + self.itemId + ', storageHubUrl=' + str(
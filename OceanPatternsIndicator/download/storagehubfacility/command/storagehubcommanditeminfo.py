@@ -5,7 +5,7 @@
 #
 # Created on 2018/06/15 
 # 
-import requests
+from download import http_session
 from .storagehubcommand import StorageHubCommand
 
 
@@ -23,7 +23,7 @@ class StorageHubCommandItemInfo(StorageHubCommand):
         print(self.storageHubUrl + "/items/" + self.itemId + "/?exclude=hl:accounting");
         
         urlString = self.storageHubUrl + "/items/" + self.itemId + "/?exclude=hl:accounting&gcube-token=" + self.gcubeToken
-        r = requests.get(urlString)
+        r = http_session.get(urlString)
         print(r.status_code)
         if r.status_code != 200:
             print("Error in execute StorageHubCommandItemInfo: " + r.status_code)
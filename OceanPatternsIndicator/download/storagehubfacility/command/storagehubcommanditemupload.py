@@ -5,7 +5,7 @@
 #
 # Created on 2018/06/15 
 # 
-import requests
+from download import http_session
 from .storagehubcommand import StorageHubCommand
 
 
@@ -28,7 +28,7 @@ class StorageHubCommandItemUpload(StorageHubCommand):
         filedata = {'name': self.filename, 'description': self.fileDescription, "file": ("file", open(self.file, "rb"))}
         
         urlString = self.storageHubUrl + "/items/" + self.itemId + "/create/FILE?gcube-token=" + self.gcubeToken
-        r = requests.post(urlString, files=filedata)
+        r = http_session.post(urlString, files=filedata)
         print(r)
         print(r.status_code)
         if r.status_code != 200:
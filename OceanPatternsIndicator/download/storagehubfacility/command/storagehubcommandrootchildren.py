@@ -5,7 +5,7 @@
 #
 # Created on 2018/06/15 
 # 
-import requests
+from download import http_session
 import json
 from .storagehubcommand import StorageHubCommand
 
@@ -21,7 +21,7 @@ class StorageHubCommandRootChildren(StorageHubCommand):
         print("Execute StorageHubCommandRootChildren")
         print(self.storageHubUrl + "/?exclude=hl:accounting");
         urlString = self.storageHubUrl + "/?exclude=hl:accounting&gcube-token=" + self.gcubeToken
-        r = requests.get(urlString)
+        r = http_session.get(urlString)
         print(r.status_code)
         if r.status_code != 200:
             print("Error in execute StorageHubCommandRootChildren: " + r.status_code)
@@ -32,7 +32,7 @@ class StorageHubCommandRootChildren(StorageHubCommand):
         
         print(self.storageHubUrl + "/items/"+rootId+"/children?exclude=hl:accounting");
         urlString = self.storageHubUrl + "/items/"+rootId+"/children?exclude=hl:accounting&gcube-token=" + self.gcubeToken
-        r = requests.get(urlString)
+        r = http_session.get(urlString)
         print(r.status_code)
         if r.status_code != 200:
             print("Error in execute StorageHubCommandRootChildren: " + r.status_code)
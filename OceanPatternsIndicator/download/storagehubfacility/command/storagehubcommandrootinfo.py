@@ -5,7 +5,7 @@
 #
 # Created on 2018/06/15 
 # 
-import requests
+from download import http_session
 from .storagehubcommand import StorageHubCommand
 
 
@@ -20,7 +20,7 @@ class StorageHubCommandRootInfo(StorageHubCommand):
         print("Execute StorageHubCommandRootInfo")
         print(self.storageHubUrl + "/?exclude=hl:accounting");
         urlString = self.storageHubUrl + "/?exclude=hl:accounting&gcube-token=" + self.gcubeToken
-        r = requests.get(urlString)
+        r = http_session.get(urlString)
         print(r.status_code)
         if r.status_code != 200:
             print("Error in execute StorageHubCommandRootInfo: " + r.status_code)
@@ -1,12 +1,10 @@
-import json
-import os
+from download.config import catalogue
 
 
 class Dataset:
     def __init__(self):
-        actual_dir = os.path.dirname(__file__)
-        with open(actual_dir + '/../config/sthub_dataset.json') as json_file:
-            self.data = json.load(json_file)
+        # parsed once and shared by all the instances
+        self.data = catalogue.load('sthub_dataset')
 
     def get_file_types(self, dataset, fields):
         """
@@ -34,9 +32,7 @@ class Dataset:
         return self.data[dataset]['cf-standard-name_variable'][cf_std_name]
 
     def get_dataset_field_from_variable(self, dataset, var):
-        for dataset_field, d_vars in self.data[dataset]['dataset_variable'].items():
-            if var in d_vars:
-                return dataset_field
+        return catalogue.get_dataset_field_map('sthub_dataset', dataset).get(var)
 
     def get_dir_id(self, dataset):
         return self.data[dataset]['dir_id']
@@ -139,6 +139,9 @@ class InStHub(InputStrategy):
         self.depth = None
         self.time = None
         self.time_freq = time_freq
+        # working domain used to subset the downloaded files (see StHub.download)
+        self.box = None
+        self.depth_range = None
 
     def get_wd(self, workingDomain, dataset):
         """
@@ -147,11 +150,15 @@ class InStHub(InputStrategy):
                 lonLat: list of list, the internal list has the format:  [[minLon , maxLon], [minLat , maxLat]]
                 depth: depth range in string format: [minDepth, maxDepth]
                 time: list of two strings that represent a time range: [YYYY-MM-DDThh:mm:ssZ, YYYY-MM-DDThh:mm:ssZ]
+                box: optional [lon_min, lat_min, lon_max, lat_max] to subset the downloaded files
+                depth_range: optional [depth_min, depth_max] (positive values) to subset the downloaded files
         @return: a new working domain with the format required to download from hda
         """
         self.lonLat = get_lon_lat(workingDomain)
         self.depth = get_depth(workingDomain)
         self.time = get_time(workingDomain, self.time_freq)
+        self.box = workingDomain.get('box')
+        self.depth_range = workingDomain.get('depth_range')
         return self.__dict__
 
     def get_wd_from_string_template(self, string_template):
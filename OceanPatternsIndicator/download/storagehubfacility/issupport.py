@@ -5,8 +5,12 @@
 #
 # Created on 2018/06/15 
 # 
-import requests
 from xml.etree import ElementTree
+from download import http_session
+
+# StorageHub url discovered for each (service url, gcube token), rediscovered after one hour
+ENDPOINT_TTL = 3600
+_endpoint_cache = http_session.TTLCache(ENDPOINT_TTL)
 
 
 class ISSupport:
@@ -20,9 +24,12 @@ class ISSupport:
         self.storageHubServiceName = "StorageHub"
 
     def discoverStorageHub(self, gcubeToken):
+        return _endpoint_cache.get((self.serviceUrl, gcubeToken), lambda: self._discoverStorageHub(gcubeToken))
+
+    def _discoverStorageHub(self, gcubeToken):
         print("Discover StorageHub")
         urlString = self.serviceUrl + "/icproxy/gcube/service/GCoreEndpoint/" + self.storageHubServiceClass + "/" + self.storageHubServiceName + "?gcube-token=" + gcubeToken
-        r = requests.get(urlString, timeout=10)
+        r = http_session.get(urlString, timeout=10)
         print(r.status_code)
         #print(r.text)
         if r.status_code != 200:
@@ -45,3 +52,7 @@ class ISSupport:
 
     def __str__(self):
         return 'ISSupport[serviceUrl=' + str(self.serviceUrl) + ']'
+
+
+def invalidate_endpoint(serviceUrl, gcubeToken):
+    _endpoint_cache.invalidate((serviceUrl, gcubeToken))
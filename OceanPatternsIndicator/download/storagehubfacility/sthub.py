@@ -1,26 +1,29 @@
 import sys
 import time
 
-from download.storagehubfacility import storagehubfacility as sthubf, check_json
+from download.storagehubfacility import storagehubfacility as sthubf, catalogue
 from download.interface.idownload import DownloadStrategy
 from download.storagehubfacility import dataset_access as db
+from download import utils, subset
+import hashlib
 import json
-from download import utils
 import os
 
 
-def wait_to_restart_connection(attempt, output_file):
-    print("A network error occurred, download attempt number {} failed, try to download again within 60 seconds..."
-          .format(attempt), file=sys.stderr)
+def wait_to_restart_connection(attempt, output_file, download_file=None):
+    # the partial download (download_file.part) is kept and resumed, the connection is retried sooner
+    wait = 10 if os.path.exists((download_file or output_file) + '.part') else 60
+    print("A network error occurred, download attempt number {} failed, try to download again within {} seconds..."
+          .format(attempt, wait), file=sys.stderr)
     rm(output_file)
-    time.sleep(60)
+    time.sleep(wait)
 
 
-def handle_network_error(output_file, attempt, max_attempt):
+def handle_network_error(output_file, attempt, max_attempt, download_file=None):
     if attempt >= max_attempt:
         raise ConnectionError("ERROR An error occurs while download input file")
     else:
-        wait_to_restart_connection(attempt, output_file)
+        wait_to_restart_connection(attempt, output_file, download_file)
 
 
 def get_outfile(field, date):
@@ -51,26 +54,49 @@ def rm(filename):
         os.remove(filename)
 
 
-def download_from_sthub(file_to_download, output_file, in_memory, max_attempt, dl_status, return_type):
+def download_from_sthub(file_to_download, output_file, in_memory, max_attempt, dl_status, return_type,
+                        spill_threshold=utils.SPILL_THRESHOLD, file_subset=None):
+    """
+    @param file_subset: None to keep the whole file, else dict with the variables, box and depth_range to keep
+        (see subset.subset_file): the file is downloaded, subset and only the subset is stored in output_file
+    """
     item_id = file_to_download[0]
     item_size = file_to_download[2]
-    myshfo = sthubf.StorageHubFacility(operation="Download", ItemId=item_id, localFile=output_file, itemSize=item_size)
+    # big items are spilled to disk even if requested in memory
+    in_memory = utils.keep_in_memory(in_memory, item_size, spill_threshold)
+    download_file = output_file if file_subset is None else output_file + '.full'
+    myshfo = sthubf.StorageHubFacility(operation="Download", ItemId=item_id, localFile=download_file,
+                                       itemSize=item_size)
 
     attempt = 0
     file_is_downloaded = False
     while attempt < max_attempt and not file_is_downloaded:
         try:
-            # in_memory false as default -> the file is written on disk as output_file
-            nc_file = myshfo.main(in_memory=in_memory, dl_status=dl_status)     # return None if in_memory == False
-            if not in_memory:  # need to load manually the file if in_memory is False
-                nc_file = load_file_from_filesystem(output_file, return_type)
+            # in_memory false as default -> the file is written on disk as download_file
+            if file_subset is None:
+                nc_file = myshfo.main(in_memory=in_memory, dl_status=dl_status,
+                                      return_type=return_type)     # return None if in_memory == False
+            elif in_memory:
+                buffer = myshfo.main(in_memory=True, dl_status=dl_status, return_type="buffer")
+            else:
+                myshfo.main(dl_status=dl_status)
             file_is_downloaded = True
         except Exception as e:
             import sys
             print(e, file=sys.stderr)
             attempt += 1
-            handle_network_error(output_file, attempt, max_attempt)
+            handle_network_error(output_file, attempt, max_attempt, download_file)
 
+    # the subset errors (e.g. empty working domain) are not network errors: they are raised without retry
+    if file_subset is not None:
+        if in_memory:
+            nc_file = utils.memory_file(subset.subset_memory(buffer, output_file, **file_subset), output_file,
+                                        return_type)
+        else:
+            subset.subset_file(download_file, output_file, **file_subset)
+            rm(download_file)
+    if not in_memory:  # need to load manually the file if in_memory is False
+        nc_file = load_file_from_filesystem(output_file, return_type)
     return nc_file
 
 
@@ -82,7 +108,7 @@ def load_file_from_filesystem(output_file, return_type):
 
     if return_type == "netCDF4":  # if downloaded previously and rm_file == False
         nc_file = netCDF4.Dataset(output_file, mode='r')
-    elif return_type == "str":
+    elif return_type == "str" or return_type == "buffer":  # a file spilled to disk is loaded from its path
         nc_file = output_file
     else:
         raise Exception("Return type '{}' unknown".format(return_type))
@@ -97,35 +123,34 @@ class StHub(DownloadStrategy):
         self.outdir = utils.init_dl_dir(outdir)
         self.dataset_id = dataset_id
         self.dataset = db.Dataset()
-        self.dataset_files = self.retrieve_file_available_on_workspace()  # list of (id, name_file) pairs
+        self.catalogue = self.retrieve_file_available_on_workspace()  # files of the dataset indexed by type and date
 
     def retrieve_file_available_on_workspace(self, attempt=0, max_attempt=5):
         if attempt < max_attempt:
             try:
-                # create ouFile that contains all the file of the selected dataset on sthub
-                self.generate_dataset_outfile()
-                dataset_outfile = json.load(open('outFile'))
-                complete_list = check_json.get_id(dataset_outfile)
-            except:
+                # catalogue of the files of the selected dataset on sthub, listed again only when it is expired
+                dir_id = self.dataset.get_dir_id(self.dataset_id)
+                file_types = list(self.dataset.data[self.dataset_id]['dataset_variable'].keys())
+                dataset_catalogue = catalogue.load_catalogue(dir_id, file_types, self.outdir)
+            except Exception:
                 attempt += 1
                 print("A network error occurred,"
                       "storage hub information retrieval attempt {}, try again within 60 seconds..."
                       .format(attempt), file=sys.stderr)
                 time.sleep(60)
-                complete_list = self.retrieve_file_available_on_workspace(attempt=attempt)
-            return complete_list
+                dataset_catalogue = self.retrieve_file_available_on_workspace(attempt=attempt)
+            return dataset_catalogue
         else:
             raise ConnectionError("ERROR An error occurs while download input file")
 
-    def generate_dataset_outfile(self):
-        print("START ItemChildren")
-        dir_id = self.dataset.get_dir_id(self.dataset_id)
-        myshfo = sthubf.StorageHubFacility(operation="ItemChildren", ItemId=dir_id)
-        myshfo.main()
-
     def find_files_to_download(self, dataset, fields, working_domain):
         file_types = self.find_file_types_associated_to_dataset(dataset, fields)
-        files_to_download = filter_dataset(self.dataset_files, working_domain, file_types)
+        files_to_download = self.catalogue.find(file_types, working_domain['time'])
+        if len(files_to_download) == 0:
+            # the files could have been added after the listing
+            catalogue.invalidate_catalogue(self.dataset.get_dir_id(self.dataset_id), self.outdir)
+            self.catalogue = self.retrieve_file_available_on_workspace()
+            files_to_download = self.catalogue.find(file_types, working_domain['time'])
         if len(files_to_download) == 0:
             raise Exception("No file available to download in the selected domain")
         else:
@@ -145,70 +170,56 @@ class StHub(DownloadStrategy):
         return file_type_list
 
     def get_file_from_sthub_workspace(self, file_to_download, in_memory, rm_file, max_attempt, return_type,
-                                      dl_status=False):
-        output_file = self.get_output_file(file_to_download)    # path of output file on disk
+                                      dl_status=False, spill_threshold=utils.SPILL_THRESHOLD, file_subset=None):
+        output_file = self.get_output_file(file_to_download, file_subset)    # path of output file on disk
         if os.path.exists(output_file):
             nc_file = load_file_from_filesystem(output_file, return_type)
         else:
-            nc_file = download_from_sthub(file_to_download, output_file, in_memory, max_attempt, dl_status, return_type)
+            nc_file = download_from_sthub(file_to_download, output_file, in_memory, max_attempt, dl_status, return_type,
+                                          spill_threshold, file_subset)
 
-        if rm_file:
+        if rm_file and not isinstance(nc_file, str):
             rm(output_file)     # remove the file on disk, keep it only in memory
         return nc_file
 
-    def get_output_file(self, file_to_download):
+    def get_output_file(self, file_to_download, file_subset=None):
         filename = file_to_download[1]
+        if file_subset is not None:
+            # a subset file is reused only for the same working domain and variables
+            subset_key = hashlib.md5(json.dumps(file_subset, sort_keys=True).encode()).hexdigest()[:8]
+            filename = os.path.splitext(filename)[0] + '_' + subset_key + '.nc'
         output_file = self.outdir + "/" + filename
         return output_file
 
     def download(self, dataset, working_domain, fields, in_memory=False, rm_file=True, max_attempt=5,
-                 return_type="netCDF4"):
+                 return_type="netCDF4", spill_threshold=utils.SPILL_THRESHOLD, subset_domain=False):
         """
         @param in_memory: if True the function return a netCDF4.Dataset in memory
+        @param spill_threshold: items bigger than spill_threshold bytes are written on disk even if in_memory is True
+        @param subset_domain: if True only the variables of fields inside working_domain['box'] and
+            working_domain['depth_range'] are kept from each downloaded file
         @param rm_file: if True the downloaded files will be deleted once they are loaded into memory
         @param dataset: source dataset
         @param working_domain: dict with
             lonLat: not used
             depth: not used
             time: date in string format: [YYYYMM]
+            box: [lon_min, lat_min, lon_max, lat_max] used if subset_domain is True (optional)
+            depth_range: [depth_min, depth_max] used if subset_domain is True (optional)
         @param fields: cf standard name used to represent a variable
         @return: download in outdir the correct netCDF file/s
         """
         nc_files = list()
         file_to_download_list = self.find_files_to_download(dataset, fields, working_domain)
+        file_subset = None
+        if subset_domain:
+            variables = [var for field in fields for var in self.dataset.get_var_from_cf_std_name(dataset, field)]
+            file_subset = {'variables': variables, 'box': working_domain.get('box'),
+                           'depth_range': working_domain.get('depth_range')}
         for file_to_download in file_to_download_list:
-            nc_file = self.get_file_from_sthub_workspace(file_to_download, in_memory, rm_file, max_attempt, return_type)
+            nc_file = self.get_file_from_sthub_workspace(file_to_download, in_memory, rm_file, max_attempt, return_type,
+                                                         spill_threshold=spill_threshold, file_subset=file_subset)
             nc_files.append(nc_file)
 
         return nc_files
 
-
-def filter_dataset(file_list, working_domain, file_types):
-    """
-    This function filters the input list and return a new list with the file with
-    the type of files desired
-    @param file_types: pattern that identifies the type of files
-    @param working_domain: dict with time information:
-            time: date in string format: [YYYYMM]
-    @param file_list: list containing (id, file_name) pairs to be filtered
-    @return: list that contains only files of desired type
-    """
-
-    time = working_domain['time']
-    filtered_list = list()
-    for file in file_list:
-        for file_type in file_types:
-            if file_type in file[1]:
-                for t in time:
-                    if t + '01_m' in file[1]:   # med pattern: YYYYMM01_m*
-                        if file not in filtered_list:
-                            filtered_list.append(file)
-                    elif t + '.nc' in file[1]:  # glo pattern: *_YYYYMM.nc
-                        if file not in filtered_list:
-                            filtered_list.append(file)
-                    elif t in file[1]:
-                        if file not in filtered_list:   # wind dataset pattern: *YYYYMM_YYYYMM.nc
-                            filtered_list.append(file)
-                    break
-
-    return filtered_list
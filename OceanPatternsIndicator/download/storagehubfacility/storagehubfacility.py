@@ -33,22 +33,29 @@ class StorageHubFacility:
         self.storageHubUrl = None
         # print("SHF DOING : ", self.operation, self.ItemId, self.destinationFile)
 
-    def main(self, in_memory=False, dl_status=False):
+    def main(self, in_memory=False, dl_status=False, return_type="netCDF4"):
         # print(self)
         self.retrieveToken()
         issup = issupport.ISSupport()
+        # the StorageHub url is discovered once and cached (see issupport.ENDPOINT_TTL)
         self.storageHubUrl = issup.discoverStorageHub(self.gcubeToken)
-        return self.executeOperation(in_memory, dl_status)
+        try:
+            return self.executeOperation(in_memory, dl_status, return_type)
+        except Exception:
+            # the url could be outdated, it is discovered again at the next attempt
+            issupport.invalidate_endpoint(issup.serviceUrl, self.gcubeToken)
+            raise
 
     def retrieveToken(self):
-        from download import utils
+        from download import credentials
         # print("Retrieve gcubeToken")
         if not os.path.isfile(self.globalVariablesFile):
             print("File does not exist: " + self.globalVariablesFile)
             raise Exception("File does not exist: " + self.globalVariablesFile)
-        self.gcubeToken = utils.get_gcube_token(self.globalVariablesFile)
+        # read once per process
+        self.gcubeToken = credentials.get_gcube_token(self.globalVariablesFile)
 
-    def executeOperation(self, in_memory=False, dl_status=False):
+    def executeOperation(self, in_memory=False, dl_status=False, return_type="netCDF4"):
         # print("Execute Operation")
         if self.operation == 'RootInfo':
             opRootInfo = command.StorageHubCommandRootInfo(self.gcubeToken, self.storageHubUrl, self.destinationFile)
@@ -68,7 +75,7 @@ class StorageHubFacility:
         elif self.operation == 'Download':
             opDownload = command.StorageHubCommandItemDownload(self.ItemId, self.gcubeToken, self.storageHubUrl,
                                                                self.destinationFile, self.itemSize)
-            return opDownload.execute(in_memory=in_memory, dl_status=dl_status)
+            return opDownload.execute(in_memory=in_memory, dl_status=dl_status, return_type=return_type)
         elif self.operation == 'Upload':
             filename = os.path.basename(self.destinationFile)
             opUpload = command.StorageHubCommandItemUpload(self.ItemId, self.gcubeToken, self.storageHubUrl,
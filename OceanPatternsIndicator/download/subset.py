@@ -0,0 +1,128 @@
+import os
+
+# names of the coordinates in the datasets (see wekeo.functions.dimensionVar)
+LON_NAMES = ['lon', 'longitude', 'nav_lon']
+LAT_NAMES = ['lat', 'latitude', 'nav_lat']
+DEPTH_NAMES = ['depth', 'deptht']
+
+
+def find_dim(nc_dataset, names):
+    for name in names:
+        if name in nc_dataset.dimensions and name in nc_dataset.variables:
+            return name
+    return None
+
+
+def domain_slices(nc_dataset, box=None, depth_range=None):
+    """
+    @param nc_dataset: netCDF4.Dataset
+    @param box: [lon_min, lat_min, lon_max, lat_max] or None
+    @param depth_range: [depth_min, depth_max] (positive values) or None
+    @return: dict dimension -> slice of the 1D coordinate values inside the working domain (bounds included)
+    """
+    import numpy as np
+
+    bounds = list()
+    if box is not None:
+        bounds.append((find_dim(nc_dataset, LON_NAMES), box[0], box[2], False))
+        bounds.append((find_dim(nc_dataset, LAT_NAMES), box[1], box[3], False))
+    if depth_range is not None:
+        bounds.append((find_dim(nc_dataset, DEPTH_NAMES), min(depth_range), max(depth_range), True))
+
+    slices = dict()
+    for dim, vmin, vmax, absolute in bounds:
+        if dim is None or nc_dataset.variables[dim].ndim != 1:
+            continue
+        values = np.asarray(nc_dataset.variables[dim][:])
+        if absolute:
+            values = np.abs(values)
+        index = np.flatnonzero((values >= vmin) & (values <= vmax))
+        if index.size == 0:
+            raise Exception("Working domain selection is empty along {}".format(dim))
+        slices[dim] = slice(int(index[0]), int(index[-1]) + 1)
+    return slices
+
+
+def copy_subset(src, dst, variables, slices):
+    """
+    Copy the variables (and their coordinates) of src restricted to slices in dst, one record (first dimension index)
+    at a time for the variables with more than 2 dimensions, so the memory does not depend on the file size
+    """
+    variables = [var for var in variables if var in src.variables]
+    if len(variables) == 0:
+        raise Exception("None of the requested variables is in the downloaded file")
+    keep = set(variables)
+    for var in variables:
+        keep.update(src.variables[var].dimensions)
+    # coordinate and bounds variables of the kept dimensions
+    for name, variable in src.variables.items():
+        if set(variable.dimensions) <= keep and (name in src.dimensions or name.endswith('_bnds')):
+            keep.add(name)
+
+    dst.setncatts({attr: src.getncattr(attr) for attr in src.ncattrs()})
+    for name, dimension in src.dimensions.items():
+        if name not in keep:
+            continue
+        if dimension.isunlimited():
+            size = None
+        elif name in slices:
+            size = slices[name].stop - slices[name].start
+        else:
+            size = len(dimension)
+        dst.createDimension(name, size)
+
+    for name, variable in src.variables.items():
+        if name not in keep or not set(variable.dimensions) <= keep:
+            continue
+        fill_value = variable.getncattr('_FillValue') if '_FillValue' in variable.ncattrs() else None
+        out = dst.createVariable(name, variable.datatype, variable.dimensions, zlib=True, fill_value=fill_value)
+        out.setncatts({attr: variable.getncattr(attr) for attr in variable.ncattrs() if attr != '_FillValue'})
+        index = tuple(slices.get(dim, slice(None)) for dim in variable.dimensions)
+        if variable.ndim > 2 and variable.shape[0] > 1 and variable.dimensions[0] not in slices:
+            for record in range(variable.shape[0]):
+                out[record] = variable[(record,) + index[1:]]
+        elif variable.ndim > 0:
+            out[:] = variable[index]
+        else:
+            out.assignValue(variable.getValue())
+
+
+def subset_file(source, destination, variables, box=None, depth_range=None):
+    """
+    Write in destination only the variables and the working domain of a downloaded NetCDF file
+    @param source: path of the downloaded file
+    @param destination: path of the subset file
+    @param variables: list of variables to keep
+    @param box: [lon_min, lat_min, lon_max, lat_max] or None
+    @param depth_range: [depth_min, depth_max] (positive values) or None
+    """
+    import netCDF4
+
+    tmp_file = destination + '.subset.tmp'
+    with netCDF4.Dataset(source, mode='r') as src:
+        src.set_auto_maskandscale(False)
+        with netCDF4.Dataset(tmp_file, mode='w', format=src.data_model) as dst:
+            dst.set_auto_maskandscale(False)
+            copy_subset(src, dst, variables, domain_slices(src, box, depth_range))
+    os.replace(tmp_file, destination)
+
+
+def subset_memory(buffer, file_name, variables, box=None, depth_range=None):
+    """
+    Subset of a NetCDF file downloaded in memory, written in memory
+    @param buffer: content of the downloaded file
+    @param file_name: name of the file
+    @param variables: list of variables to keep
+    @param box: [lon_min, lat_min, lon_max, lat_max] or None
+    @param depth_range: [depth_min, depth_max] (positive values) or None
+    @return: memoryview with the content of the subset file
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(file_name, mode='r', memory=buffer) as src:
+        src.set_auto_maskandscale(False)
+        # NETCDF4 format: the diskless datasets written in memory are returned by close()
+        dst = netCDF4.Dataset(file_name, mode='w', memory=len(buffer), format='NETCDF4')
+        dst.set_auto_maskandscale(False)
+        copy_subset(src, dst, variables, domain_slices(src, box, depth_range))
+        return dst.close()
@@ -6,19 +6,11 @@ def get_field(type_file):
     @param type_file: String that represent the file type
     @return: return the field associated to the input_file as cf standard name
     """
-    import os
-    import json
-    actual_dir = os.path.dirname(__file__)
-    with open(actual_dir + '/config/filename.json') as json_file:
-        filename = json.load(json_file)
-    field = None
-    for type_file_tmp, fields_tmp in filename.items():
-        if type_file == type_file_tmp:
-            field = fields_tmp
-            break
-    if field is None:
+    from download.config import catalogue
+    field_by_type_file, _ = catalogue.get_type_file_maps()
+    if type_file not in field_by_type_file:
         raise Exception("Can't assign a type file for type_file: " + str(type_file))
-    return field
+    return field_by_type_file[type_file]
 
 
 def get_type_file(field):
@@ -26,20 +18,11 @@ def get_type_file(field):
     @param field: cf standard name used to represent a variable
     @return: return the type file associated to field indicated
     """
-    import os
-    import json
-    actual_dir = os.path.dirname(__file__)
-    with open(actual_dir + '/config/filename.json') as json_file:
-        filename = json.load(json_file)
-
-    type_file = None
-    for type_file_tmp, fields_tmp in filename.items():
-        if field in fields_tmp:
-            type_file = type_file_tmp
-            break
-    if type_file is None:
+    from download.config import catalogue
+    _, type_file_by_field = catalogue.get_type_file_maps()
+    if field not in type_file_by_field:
         raise Exception("Can't assign an output type file for field: " + str(field))
-    return type_file
+    return type_file_by_field[field]
 
 
 def init_dl_dir(outdir=None):
@@ -99,4 +82,36 @@ def show_dl_percentage(dl, start, total_length):
                 print("[%8.2f] MB downloaded, %8.2f kbps" \
                       % (dl / (1024 * 1024), (dl / (time.process_time() - start)) / 1024))
             except:
-                pass
\ No newline at end of file
+                pass
+
+# items bigger than this size (bytes) are written on disk even if the download is requested in memory
+SPILL_THRESHOLD = 512 * 1024 ** 2
+
+
+def keep_in_memory(in_memory, size, spill_threshold=SPILL_THRESHOLD):
+    """
+    @param in_memory: if True the download is requested in memory
+    @param size: size of the item in bytes, 0 if unknown
+    @param spill_threshold: max size in bytes of an item kept in memory, None for no limit
+    @return: True if the item has to be downloaded in memory, False if it has to be spilled to disk
+    """
+    if not in_memory:
+        return False
+    return spill_threshold is None or 0 < size <= spill_threshold
+
+
+def memory_file(buffer, file_name, return_type):
+    """
+    @param buffer: content of a NetCDF file downloaded in memory
+    @param file_name: name of the file (used by netCDF4 to identify the dataset)
+    @param return_type: if netCDF4 return a netCDF4.Dataset on buffer, if buffer return a memoryview on buffer
+        (no copy, it can be passed directly to load_data)
+    @return: the in memory dataset
+    """
+    if return_type == "netCDF4":
+        import netCDF4
+        return netCDF4.Dataset(file_name, mode='r', memory=buffer)
+    elif return_type == "buffer":
+        return memoryview(buffer)
+    else:
+        raise Exception("Return type '{}' unknown for a file downloaded in memory".format(return_type))
@@ -0,0 +1,105 @@
+import asyncio
+import concurrent.futures
+import json
+import random
+import threading
+import time
+
+from download import http_session
+
+
+class AsyncHDAClient:
+    def __init__(self, broker_endpoint, initial_delay=1., max_delay=30., backoff_factor=2., max_connections=10):
+        """
+        asyncio client that polls the status of many HDA jobs/orders at the same time over one pooled HTTP session.
+        Polls are spaced with an exponential backoff with full jitter: the n-th wait is a random time in
+        [0, min(max_delay, initial_delay * backoff_factor ** n)]. HTTP calls are blocking (requests), they run in
+        a thread pool of max_connections threads sharing the connection pool of http_session.
+        @param broker_endpoint: HDA data broker address
+        @param initial_delay: first backoff delay in seconds
+        @param max_delay: maximum backoff delay in seconds
+        @param backoff_factor: multiplicative factor of the backoff delay
+        @param max_connections: number of concurrent status requests
+        """
+        self.broker_endpoint = broker_endpoint
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff_factor = backoff_factor
+        self.session = http_session.get_session()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections)
+        self.latency = dict()  # job/order id -> seconds from the first poll to completion
+
+    async def _get_status(self, url, headers):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.session.get(url, headers=headers))
+
+    async def poll(self, url, request_id, headers, timeout=None, tolerant=False):
+        """
+        Poll url until the status is completed
+        @param url: status address
+        @param request_id: job or order id
+        @param headers: HTTP headers (access token)
+        @param timeout: maximum time in seconds, None to wait indefinitely
+        @param tolerant: if True, unexpected HTTP responses are printed and the status is polled again (until timeout)
+            instead of raising an error
+        @return: the last status response (requests.Response)
+        """
+        start_time = time.time()
+        delay = self.initial_delay
+        while True:
+            response = await self._get_status(url, headers)
+            if response.status_code == 200:
+                parsed_response = json.loads(response.text)
+                status = parsed_response['status']
+                if 'fail' in status:
+                    raise Exception("Query {} has failed with message: {}"
+                                    .format(request_id, parsed_response.get('message')))
+                if status == 'completed':
+                    self.latency[request_id] = time.time() - start_time
+                    print("{} completed in {:.1f} s".format(request_id, self.latency[request_id]))
+                    return response
+            elif tolerant:
+                print("Error: Unexpected response {} for {}".format(response, request_id))
+            else:
+                raise Exception("Error: Unexpected response {}".format(response))
+            if timeout is not None and time.time() - start_time > timeout:
+                raise Exception("ERROR: Timeout reached for {}".format(request_id))
+            await asyncio.sleep(random.uniform(0, delay))
+            delay = min(delay * self.backoff_factor, self.max_delay)
+
+    async def wait_async(self, headers, job_ids=(), order_ids=(), job_timeout=None, order_timeout=None):
+        tasks = [self.poll(self.broker_endpoint + '/datarequest/status/' + job_id, job_id, headers, job_timeout)
+                 for job_id in job_ids]
+        tasks += [self.poll(self.broker_endpoint + '/dataorder/status/' + order_id, order_id, headers, order_timeout,
+                            tolerant=True)
+                  for order_id in order_ids]
+        responses = await asyncio.gather(*tasks)
+        return dict(zip(list(job_ids) + list(order_ids), responses))
+
+    def wait(self, headers, job_ids=(), order_ids=(), job_timeout=None, order_timeout=None):
+        """
+        Wait for the completion of all the jobs and orders, polled together in one event loop.
+        Job polling stops at the first unexpected HTTP response, order polling tolerates them until order_timeout.
+        @param headers: HTTP headers (access token)
+        @param job_ids: list of job ids
+        @param order_ids: list of order ids
+        @param job_timeout: maximum time in seconds for each job, None to wait indefinitely
+        @param order_timeout: maximum time in seconds for each order, None to wait indefinitely
+        @return: dict id -> last status response (requests.Response)
+        """
+        return asyncio.run(self.wait_async(headers, job_ids, order_ids, job_timeout, order_timeout))
+
+
+_clients = dict()
+_clients_lock = threading.Lock()
+
+
+def get_client(broker_endpoint):
+    """
+    @param broker_endpoint: HDA data broker address
+    @return: the AsyncHDAClient shared by all the requests to broker_endpoint
+    """
+    with _clients_lock:
+        if broker_endpoint not in _clients:
+            _clients[broker_endpoint] = AsyncHDAClient(broker_endpoint)
+        return _clients[broker_endpoint]
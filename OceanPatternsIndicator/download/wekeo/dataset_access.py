@@ -1,12 +1,16 @@
-import os
 import json
 
+from download.config import catalogue
+
+
+# sorted grids of the datasets, shared by all the Dataset instances
+_grids = dict()
+
 
 class Dataset:
     def __init__(self):
-        actual_dir = os.path.dirname(__file__)
-        with open(actual_dir + '/../config/wekeo_dataset.json') as json_file:
-            self.data = json.load(json_file)
+        # parsed once and shared by all the instances
+        self.data = catalogue.load('wekeo_dataset')
 
     def get_depth(self, dataset):
         if 'depth' in self.data[dataset]:
@@ -20,13 +24,25 @@ class Dataset:
     def get_lat(self, dataset) -> list:
         return self.data[dataset]['lat']
 
+    def get_grid(self, dataset, axis):
+        """
+        @param dataset: source dataset
+        @param axis: 'lon', 'lat' or 'depth'
+        @return: the grid of the dataset along axis as a sorted numpy array, None if not available
+        """
+        import numpy as np
+
+        key = (dataset, axis)
+        if key not in _grids:
+            values = self.data[dataset].get(axis)
+            _grids[key] = None if not values else np.sort(np.asarray(values, dtype=float))
+        return _grids[key]
+
     def get_var_from_cf_std_name(self, dataset, cf_std_name):
         return self.data[dataset]['cf-standard-name_variable'][cf_std_name]
 
     def get_dataset_field_from_variable(self, dataset, var):
-        for dataset_field, d_vars in self.data[dataset]['dataset_variable'].items():
-            if var in d_vars:
-                return dataset_field
+        return catalogue.get_dataset_field_map('wekeo_dataset', dataset).get(var)
 
     def get_dataset_fields(self, dataset, field: str):
         """
@@ -3,9 +3,15 @@ import os
 import time
 import json
 import re
-import requests
 
-from download import utils
+from download import utils, http_session, ranged_download, credentials
+from download.wekeo import async_client
+
+# data broker address, it can be overridden (e.g. to use the local stub server, see stub_server.py)
+BROKER_ENDPOINT = os.environ.get('HDA_BROKER_ENDPOINT', "https://wekeo-broker.apps.mercator.dpi.wekeo.eu/databroker")
+# maximum time in seconds to wait for a job and for an order
+JOB_TIMEOUT = 120
+ORDER_TIMEOUT = 1800
 
 
 def generate_api_key(username, password):
@@ -39,8 +45,7 @@ def init(dataset_id, api_key, download_dir_path):
     """
     hda_dict = {}
     # Data broker address
-    hda_dict["broker_endpoint"] = \
-        "https://wekeo-broker.apps.mercator.dpi.wekeo.eu/databroker"
+    hda_dict["broker_endpoint"] = BROKER_ENDPOINT
     # Terms and conditions
     hda_dict["acceptTandC_address"] \
         = hda_dict["broker_endpoint"] \
@@ -79,10 +84,18 @@ def get_access_token(hda_dict, bluecloud_proxy=True):
     """
 
     if bluecloud_proxy:
-        hda_dict['access_token'] = get_token_from_bluecloud_proxy()
+        access_token = get_token_from_bluecloud_proxy()
     else:
-        hda_dict['access_token'] = get_token_from_wekeo(hda_dict)
-    hda_dict['headers'] = {'Authorization': 'Bearer ' + hda_dict["access_token"], 'Accept': 'application/json'}
+        access_token = get_token_from_wekeo(hda_dict)
+    return set_access_token(hda_dict, access_token)
+
+
+def set_access_token(hda_dict, access_token):
+    """
+    Stores the access token and the HTTP headers that use it in the dictionary
+    """
+    hda_dict['access_token'] = access_token
+    hda_dict['headers'] = {'Authorization': 'Bearer ' + access_token, 'Accept': 'application/json'}
     return hda_dict
 
 
@@ -91,7 +104,7 @@ def get_token_from_wekeo(hda_dict):
         'Authorization': 'Basic ' + hda_dict['api_key']
     }
     print("Getting an access token. This token is valid for one hour only.")
-    response = requests.get(hda_dict['accessToken_address'], headers=headers, verify=False)
+    response = http_session.get(hda_dict['accessToken_address'], headers=headers, verify=False)
 
     # If the HTTP response code is 200 (i.e. success), then retrive the
     # token from the response
@@ -104,15 +117,17 @@ def get_token_from_wekeo(hda_dict):
         raise Exception("Error: Unexpected response {}".format(response))
 
 
-def get_token_from_bluecloud_proxy():
-    from download import utils
-
+def get_bluecloud_gcube_token():
     globalVariablesFile = os.path.dirname(__file__).split('download')[0] + '/globalvariables.csv'
-    gcubeToken = utils.get_gcube_token(globalVariablesFile)
+    return credentials.get_gcube_token(globalVariablesFile)
+
+
+def get_token_from_bluecloud_proxy():
+    gcubeToken = get_bluecloud_gcube_token()
 
     hprops = {"Accept": "application/json"}
     urlString = "https://data.d4science.org/wekeo/gettoken?gcube-token=" + gcubeToken
-    r = requests.get(urlString, headers=hprops)
+    r = http_session.get(urlString, headers=hprops)
     if r.status_code != 200:
         error = "Error in Get Token {} {}".format(r.status_code, r.text)
         print(error)
@@ -134,7 +149,7 @@ def query_metadata(hda_dict):
     Returns:
         Returns the dictionary including the query response
     """
-    response = requests.get(hda_dict['broker_endpoint'] + \
+    response = http_session.get(hda_dict['broker_endpoint'] + \
                             '/querymetadata/' + hda_dict['dataset_id'], \
                             headers=hda_dict['headers'])
 
@@ -172,13 +187,13 @@ def acceptTandC(hda_dict):
 
     msg1 = "Accepting Terms and Conditions of Copernicus_General_License"
     msg2 = "Copernicus_General_License Terms and Conditions already accepted"
-    response = requests.get(hda_dict['acceptTandC_address'], headers=hda_dict['headers'])
+    response = http_session.get(hda_dict['acceptTandC_address'], headers=hda_dict['headers'])
 
     isTandCAccepted = json.loads(response.text)['accepted']
 
     if isTandCAccepted is False:
         print(msg1)
-        response = requests.put(hda_dict['acceptTandC_address'], headers=hda_dict['headers'])
+        response = http_session.put(hda_dict['acceptTandC_address'], headers=hda_dict['headers'])
     else:
         print(msg2)
     isTandCAccepted = json.loads(response.text)['accepted']
@@ -186,20 +201,20 @@ def acceptTandC(hda_dict):
     return hda_dict
 
 
-def get_job_id(hda_dict, data):
-    """ 
-    Assigns a job id for the data request.
-    
+def submit_job(hda_dict, data):
+    """
+    Submits the data request, without waiting for its completion (see wait_jobs).
+
     Parameters:
-        hda_dict: dictionary initied with the function init, 
-                  that stores all required information to be able to 
+        hda_dict: dictionary initied with the function init,
+                  that stores all required information to be able to
                   interact with the HDA API
         data: dictionary containing the dataset description
 
     Returns:
         Returns the dictionary including the assigned job id.
     """
-    response = requests.post(hda_dict['broker_endpoint'] + '/datarequest', headers=hda_dict['headers'], json=data,
+    response = http_session.post(hda_dict['broker_endpoint'] + '/datarequest', headers=hda_dict['headers'], json=data,
                              verify=False)
 
     if response.status_code == hda_dict['CONST_HTTP_SUCCESS_CODE']:
@@ -210,42 +225,54 @@ def get_job_id(hda_dict, data):
         print("Error: Unexpected response {}".format(response))
 
     hda_dict['job_id'] = job_id
+    return hda_dict
+
+
+def get_job_id(hda_dict, data):
+    """ 
+    Assigns a job id for the data request.
+    
+    Parameters:
+        hda_dict: dictionary initied with the function init, 
+                  that stores all required information to be able to 
+                  interact with the HDA API
+        data: dictionary containing the dataset description
+
+    Returns:
+        Returns the dictionary including the assigned job id.
+    """
+    submit_job(hda_dict, data)
     get_request_status(hda_dict)
     return hda_dict
 
 
+def wait_jobs(hda_dicts, timeout=JOB_TIMEOUT):
+    """
+    Waits for the jobs of several data requests, polled together (see async_client.AsyncHDAClient).
+
+    Parameters:
+        hda_dicts: list of dictionaries returned by submit_job, with the
+                   same broker endpoint and access token
+        timeout: maximum time in seconds for each job
+    """
+    if not hda_dicts:
+        return
+    client = async_client.get_client(hda_dicts[0]['broker_endpoint'])
+    client.wait(hda_dicts[0]['headers'], job_ids=[hda_dict['job_id'] for hda_dict in hda_dicts], job_timeout=timeout)
+    print("Query successfully submitted. Status is completed")
+
+
 def get_request_status(hda_dict):
     """ 
     Requests the status of the process to assign a job ID.
+    The status is polled with an exponential backoff (see async_client.AsyncHDAClient).
     
     Parameters:
         hda_dict: dictionary initied with the function init, that 
                   stores all required information to be able to 
                   interact with the HDA API
     """
-    status = "not started"
-    start_time = time.time()
-    timeout = 120
-    count = 0
-    while status != "completed":
-        count = count + 1
-        if count > 20:
-            print('Waiting 5 seconds...')
-            time.sleep(5)
-        response = requests.get(hda_dict['broker_endpoint'] + '/datarequest/status/' + hda_dict['job_id'],
-                                headers=hda_dict['headers'])
-        if response.status_code == hda_dict['CONST_HTTP_SUCCESS_CODE']:
-            status = json.loads(response.text)['status']
-            if 'fail' not in status:
-                print("Query successfully submitted. Status is " + status)
-            else:
-                message = json.loads(response.text)['message']
-                raise Exception("Query has failed with message: ", message)
-        else:
-            raise Exception("Error: Unexpected response {}".format(response))
-
-        if time.time() - start_time > timeout:
-            raise Exception("ERROR: Timeout reached")
+    wait_jobs([hda_dict])
 
 
 def get_results_list(hda_dict):
@@ -262,7 +289,7 @@ def get_results_list(hda_dict):
         downloaded.
     """
     params = {'page': '0', 'size': '5'}
-    response = requests.get(hda_dict['broker_endpoint'] + \
+    response = http_session.get(hda_dict['broker_endpoint'] + \
                             '/datarequest/jobs/' + hda_dict['job_id'] + \
                             '/result', headers=hda_dict['headers'], params=params)
     results = json.loads(response.text)
@@ -275,20 +302,19 @@ def get_results_list(hda_dict):
     return hda_dict
 
 
-def get_order_ids(hda_dict):
-    """ 
-    Assigns each file to be downloaded a unique order ID.
-    
+def submit_orders(hda_dict):
+    """
+    Assigns each file to be downloaded a unique order ID, without
+    waiting for the orders (see wait_orders).
+
     Parameters:
-        hda_dict: dictionary initied with the function init, that 
-                  stores all required information to be able to 
+        hda_dict: dictionary initied with the function init, that
+                  stores all required information to be able to
                   interact with the HDA API
 
     Returns:
-        Returns the dictionary including the list of order IDs and the
-        request status of assigning the order IDs.
+        Returns the dictionary including the list of order IDs.
     """
-    i = 0
     order_ids = []
     order_sizes = []
 
@@ -301,28 +327,70 @@ def get_order_ids(hda_dict):
 
         order_sizes.append(result['size'])
 
-        response = requests.post(hda_dict['broker_endpoint'] + \
+        response = http_session.post(hda_dict['broker_endpoint'] + \
                                  '/dataorder', headers=hda_dict['headers'], \
                                  json=data, verify=False)
 
         if (response.status_code == hda_dict['CONST_HTTP_SUCCESS_CODE']):
             order_ids.append(json.loads(response.text)['orderId'])
             print("Query successfully submitted. Order ID is " + \
-                  order_ids[i])
-            response = get_order_status(hda_dict, order_ids[i])
+                  order_ids[-1])
         else:
             print("Error: Unexpected response {}".format(response))
 
-        i += 1
     hda_dict['order_ids'] = order_ids
     hda_dict['order_sizes'] = order_sizes
     hda_dict['order_status_response'] = response
     return hda_dict
 
 
+def wait_orders(hda_dicts, timeout=ORDER_TIMEOUT):
+    """
+    Waits for the orders of several data requests, polled together
+    (see async_client.AsyncHDAClient). Unexpected responses are
+    tolerated until the timeout.
+
+    Parameters:
+        hda_dicts: list of dictionaries returned by submit_orders, with
+                   the same broker endpoint and access token
+        timeout: maximum time in seconds for each order
+
+    Returns:
+        Returns the dictionaries including the status response of their
+        last order.
+    """
+    order_ids = [order_id for hda_dict in hda_dicts for order_id in hda_dict['order_ids']]
+    if not order_ids:
+        return hda_dicts
+    client = async_client.get_client(hda_dicts[0]['broker_endpoint'])
+    responses = client.wait(hda_dicts[0]['headers'], order_ids=order_ids, order_timeout=timeout)
+    print("Query successfully submitted. Status is completed")
+    for hda_dict in hda_dicts:
+        if hda_dict['order_ids']:
+            hda_dict['order_status_response'] = responses[hda_dict['order_ids'][-1]]
+    return hda_dicts
+
+
+def get_order_ids(hda_dict):
+    """ 
+    Assigns each file to be downloaded a unique order ID.
+    
+    Parameters:
+        hda_dict: dictionary initied with the function init, that 
+                  stores all required information to be able to 
+                  interact with the HDA API
+
+    Returns:
+        Returns the dictionary including the list of order IDs and the
+        request status of assigning the order IDs.
+    """
+    return wait_orders([submit_orders(hda_dict)])[0]
+
+
 def get_order_status(hda_dict, order_id):
     """ 
     Requests the status of assigning an order ID for a data file.
+    The status is polled with an exponential backoff (see async_client.AsyncHDAClient).
     
     Parameters:
         hda_dict: dictionary initied with the function init, that 
@@ -333,35 +401,25 @@ def get_order_status(hda_dict, order_id):
     Returns:
         Returns the response of assigning an order ID.
     """
-    status = "not started"
-    count = 0
-    while (status != "completed"):
-        count = count + 1
-        if count > 20:
-            print('Waiting 5 seconds...')
-            time.sleep(5)
-        response = requests.get(hda_dict['broker_endpoint'] + \
-                                '/dataorder/status/' + order_id, \
-                                headers=hda_dict['headers'])
-
-        if (response.status_code == hda_dict['CONST_HTTP_SUCCESS_CODE']):
-            status = json.loads(response.text)['status']
-            print("Query successfully submitted. Status is " + status)
-        else:
-            print("Error: Unexpected response {}".format(response))
-
+    client = async_client.get_client(hda_dict['broker_endpoint'])
+    response = client.wait(hda_dict['headers'], order_ids=[order_id], order_timeout=ORDER_TIMEOUT)[order_id]
+    print("Query successfully submitted. Status is completed")
     return response
 
 
-def downloadFileMemory(url, headers, file_name):
-    import netCDF4
-    r = requests.get(url, headers=headers, stream=True)
+def downloadFileMemory(url, headers, total_length=0):
+    """
+    Function to download a single data file in memory.
 
-    if r.status_code == 200:
-        nc_dataset = netCDF4.Dataset(file_name, mode='r', memory=r.content)
-        return nc_dataset
-    else:
-        raise Exception('Download error, status code: ' + str(r.status_code))
+    Parameters:
+        url: is the download url which included the unique order ID
+        headers:
+        total_length: size of the data file, 0 if unknown
+
+    Returns:
+        Returns a bytearray with the content of the data file.
+    """
+    return ranged_download.download_memory(url, size=total_length, headers=headers)
 
 
 def downloadFile(url, headers, directory, file_name, total_length=0, dl_status=False):
@@ -377,7 +435,7 @@ def downloadFile(url, headers, directory, file_name, total_length=0, dl_status=F
     Returns:
         Returns the time needed to download the data file.
     """
-    r = requests.get(url, headers=headers, stream=True)
+    r = http_session.get(url, headers=headers, stream=True)
     if r.status_code == 200:
         filename = os.path.join(directory, file_name)
         print("Downloading " + filename)
@@ -464,7 +522,8 @@ def get_filenames(hda_dict):
     return fileName
 
 
-def download_data(hda_dict, file_extension=None, user_filename=None, in_memory=None, dl_status=False):
+def download_data(hda_dict, file_extension=None, user_filename=None, in_memory=None, dl_status=False,
+                  spill_threshold=utils.SPILL_THRESHOLD):
     """ 
     Downloads for each of the order IDs the associated data file.
     
@@ -476,11 +535,19 @@ def download_data(hda_dict, file_extension=None, user_filename=None, in_memory=N
                   optional file extension to add to file
         user_filename:  
                   user specified download name
+        in_memory:
+                  if True the data files are downloaded in memory
+        spill_threshold:
+                  data files bigger than spill_threshold bytes are 
+                  written on disk even if in_memory is True
         
     Returns:
-        hda_dict: with names/paths of downloaded files
+        hda_dict: with names/paths of downloaded files and the 
+                  content of the files downloaded in memory 
+                  (memory_files, None for the files on disk)
     """
     fileNames = []
+    memoryFiles = []
     fileName = get_filenames(hda_dict)
     i = 0
     for order_id in hda_dict['order_ids']:
@@ -496,9 +563,12 @@ def download_data(hda_dict, file_extension=None, user_filename=None, in_memory=N
 
         product_size = hda_dict['order_sizes'][i]
 
-        if in_memory:
-            time_elapsed = downloadFileMemory(download_url, hda_dict['headers'], file_name)
+        if utils.keep_in_memory(in_memory, product_size, spill_threshold):
+            start = time.time()
+            memoryFiles.append(downloadFileMemory(download_url, hda_dict['headers'], product_size))
+            time_elapsed = time.time() - start
         else:
+            memoryFiles.append(None)
             time_elapsed = downloadFile(download_url, hda_dict['headers'],
                                         hda_dict['download_dir_path'], file_name,
                                         product_size,
@@ -521,4 +591,5 @@ def download_data(hda_dict, file_extension=None, user_filename=None, in_memory=N
         i += 1
 
     hda_dict['filenames'] = fileNames
+    hda_dict['memory_files'] = memoryFiles
     return hda_dict
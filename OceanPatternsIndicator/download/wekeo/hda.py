@@ -3,8 +3,7 @@ import os
 from download.wekeo import functions as hdaf, dataset_access as db
 from download.interface.idownload import DownloadStrategy
 import time
-from download import utils
-import netCDF4
+from download import utils, credentials
 import sys
 
 warnings.filterwarnings('ignore')
@@ -46,7 +45,7 @@ def load_file_from_filesystem(output_file, return_type):
 
     if return_type == "netCDF4":  # if downloaded previously and rm_file == False
         nc_file = netCDF4.Dataset(output_file, mode='r')
-    elif return_type == "str":
+    elif return_type == "str" or return_type == "buffer":  # a file spilled to disk is loaded from its path
         nc_file = output_file
     else:
         raise Exception("Return type '{}' unknown".format(return_type))
@@ -76,15 +75,19 @@ class HDA(DownloadStrategy):
         self.hdaInit['download_dir_path'] = None
         self.hda = None
 
-        ##### hda_token initialization #####
-        self.accessToken = dict()
-        self.accessToken['time'] = None
+    def credential_key(self, kind):
+        if self.bluecoud_proxy:
+            return credentials.credential_key(kind, 'bluecloud:' + hdaf.get_bluecloud_gcube_token())
+        return credentials.credential_key(kind, self.api_key)
 
     def accept_term_cond(self):
         if self.hda is None:
             raise Exception("Can't accept term and conditions without hda init")
         if 'isTandCAccepted' not in self.hda:
-            self.hda = hdaf.acceptTandC(self.hda)
+            # accepted once for all the HDA instances (see credentials.CredentialCache)
+            self.hda['isTandCAccepted'] = credentials.get_cache().get(
+                self.credential_key('hda_tandc'), lambda: hdaf.acceptTandC(self.hda)['isTandCAccepted'],
+                credentials.TANDC_LIFETIME)
         else:
             print("Terms and Conditions already accepted")
 
@@ -92,19 +95,15 @@ class HDA(DownloadStrategy):
         if self.hda is None:
             raise Exception("Can't request token without hda init")
 
-        # if self.hda has just been initialized
-        if 'access_token' not in self.hda:
-            self.hda = hdaf.get_access_token(self.hda, self.bluecoud_proxy)
-            self.accessToken['time'] = time.time()
-        # if self.hda has just initialized check is validity
-        elif self.accessToken['time'] is not None:
-            time_now = time.time()
-            # token is valid for an hour, check if it's still valid
-            if time_now - self.accessToken['time'] > 3600:
-                self.hda = hdaf.get_access_token(self.hda)  # request a new valid token
-                self.accessToken['time'] = time.time()
-            else:
-                print('Token still valid')
+        # the token is valid for an hour, it is shared by all the HDA instances and refreshed before its expiry
+        access_token = credentials.get_cache().get(
+            self.credential_key('hda_token'),
+            lambda: hdaf.get_access_token(dict(self.hda), self.bluecoud_proxy)['access_token'],
+            credentials.TOKEN_LIFETIME)
+        self.hda = hdaf.set_access_token(self.hda, access_token)
+
+    def invalidate_token(self):
+        credentials.get_cache().invalidate(self.credential_key('hda_token'))
 
     def hda_init(self, dataset_id, download_dir_path):
         # With `dataset_id`, `api_key` and `download_dir_path`,
@@ -118,10 +117,12 @@ class HDA(DownloadStrategy):
             self.hda = hdaf.init(dataset_id, self.api_key, download_dir_path)
 
     def download(self, dataset, working_domain, fields, in_memory=False, rm_file=True, max_attempt=5,
-                 return_type="netCDF4"):
+                 return_type="netCDF4", spill_threshold=utils.SPILL_THRESHOLD, subset_domain=False):
         """
         @param in_memory: if True the function return a netCDF4.Dataset in memory.
             NOTE: if select True, the file will be not masked
+        @param spill_threshold: files bigger than spill_threshold bytes are written on disk even if in_memory is True
+        @param subset_domain: not used, the HDA requests are already restricted to the working domain and variables
         @param rm_file: if True the downloaded files will be deleted once they are loaded into memory
         @param dataset: source dataset
         @param working_domain: dict with
@@ -136,10 +137,28 @@ class HDA(DownloadStrategy):
 
         map_dataset_with_variables_and_outfile = self.extract_map_dataset_with_var_and_outfile(dataset, fields, time)
 
-        nc_files = list()
+        # the files of all the dataset fields are requested together, their jobs and orders are polled at once
+        output_files = list()
+        hda_requests = list()
         for dataset_field, variables_outfile in map_dataset_with_variables_and_outfile.items():
-            nc_file = self.get_file_from_hda(dataset, dataset_field, variables_outfile, in_memory, rm_file,
-                                             max_attempt, working_domain, return_type)
+            output_file = self.outdir + '/' + variables_outfile['outfile'][0] + '.nc'
+            output_files.append(output_file)
+            if not os.path.exists(output_file):
+                dataset_id = self.dataset.get_dataset_id(dataset, dataset_field)
+                data_json_request = self.dataset.get_data(dataset, dataset_field, variables_outfile['variables'],
+                                                          working_domain['lonLat'], working_domain['depth'], time)
+                hda_requests.append((dataset_id, data_json_request, output_file))
+        downloaded = self.download_batch_from_hda(hda_requests, in_memory, max_attempt, return_type,
+                                                  spill_threshold) if hda_requests else dict()
+
+        nc_files = list()
+        for output_file in output_files:
+            if output_file in downloaded:
+                nc_file = downloaded[output_file]
+            else:
+                nc_file = load_file_from_filesystem(output_file, return_type)
+            if rm_file and not isinstance(nc_file, str):
+                rm(output_file)
             nc_files.append(nc_file)
 
         # nc_file is useful when call download using string_template, in this case you need
@@ -166,7 +185,7 @@ class HDA(DownloadStrategy):
         return map_dataset_with_variables_and_outfile
 
     def get_file_from_hda(self, dataset, dataset_field, variables_outfile, in_memory, rm_file, max_attempt,
-                          working_domain, return_type):
+                          working_domain, return_type, spill_threshold=utils.SPILL_THRESHOLD):
         lonLat = working_domain['lonLat']
         depth = working_domain['depth']
         time = working_domain['time']
@@ -181,46 +200,68 @@ class HDA(DownloadStrategy):
             data_json_request = self.dataset.get_data(dataset, dataset_field, variables_to_download, lonLat, depth,
                                                       time)
             nc_file = self.download_from_hda(dataset_id, data_json_request, output_file, in_memory, max_attempt,
-                                             return_type)
-        if rm_file:
+                                             return_type, spill_threshold)
+        if rm_file and not isinstance(nc_file, str):
             rm(output_file)
 
         return nc_file
 
-    def download_from_hda(self, dataset_id, data, output_file, in_memory, max_attempt, return_type):
-        attempt = 0
-        file_is_downloaded = False
-        nc_file = None
-        while attempt < max_attempt and not file_is_downloaded:
+    def download_from_hda(self, dataset_id, data, output_file, in_memory, max_attempt, return_type,
+                          spill_threshold=utils.SPILL_THRESHOLD):
+        return self.download_batch_from_hda([(dataset_id, data, output_file)], in_memory, max_attempt, return_type,
+                                            spill_threshold)[output_file]
 
-            # Once initialised, you can request an access token with the function
+    def download_batch_from_hda(self, hda_requests, in_memory, max_attempt, return_type,
+                                spill_threshold=utils.SPILL_THRESHOLD):
+        """
+        Download several files: all the jobs are submitted and then polled together, as are the orders
+        @param hda_requests: list of tuples (dataset_id, data json request, output_file)
+        @return: dict output_file -> nc_file
+        """
+        attempt = 0
+        nc_files = dict()
+        while attempt < max_attempt and len(nc_files) < len(hda_requests):
+            pending = [hda_request for hda_request in hda_requests if hda_request[2] not in nc_files]
             try:
-                self.hda_init(dataset_id, self.outdir)
-                self.get_token()
-                # You might need to accept the Terms and Conditions
-                self.accept_term_cond()
-
-                # launch your data request and your request is assigned a `job ID`
-                hda_dict = hdaf.get_job_id(self.hda, data)
-
-                # The next step is to gather a list of file names available, based on your assigned `job ID`
-                hda_dict = hdaf.get_results_list(hda_dict)
-
-                # The next step is to create an `order ID` for each file name to be downloaded
-                hda_dict = hdaf.get_order_ids(hda_dict)
-
-                hdaf.download_data(hda_dict, user_filename=output_file, in_memory=in_memory,
-                                   dl_status=False)
-                nc_file = load_file_from_filesystem(output_file, return_type)
-                file_is_downloaded = True
+                hda_dicts = list()
+                for dataset_id, data, output_file in pending:
+                    # Once initialised, you can request an access token with the function
+                    self.hda_init(dataset_id, self.outdir)
+                    self.get_token()
+                    # You might need to accept the Terms and Conditions
+                    self.accept_term_cond()
+                    # launch your data request and your request is assigned a `job ID`
+                    hda_dicts.append(hdaf.submit_job(dict(self.hda), data))
+                hdaf.wait_jobs(hda_dicts)
+
+                # The next step is to gather a list of file names available, based on your assigned `job ID`,
+                # and to create an `order ID` for each file name to be downloaded
+                for hda_dict in hda_dicts:
+                    hdaf.submit_orders(hdaf.get_results_list(hda_dict))
+                hdaf.wait_orders(hda_dicts)
+
+                for hda_dict, (_, _, output_file) in zip(hda_dicts, pending):
+                    hda_dict = hdaf.download_data(hda_dict, user_filename=output_file, in_memory=in_memory,
+                                                  dl_status=False, spill_threshold=spill_threshold)
+                    memory_file = hda_dict['memory_files'][0] if hda_dict['memory_files'] else None
+                    if memory_file is not None:
+                        nc_files[output_file] = utils.memory_file(memory_file, output_file, return_type)
+                    else:
+                        nc_files[output_file] = load_file_from_filesystem(output_file, return_type)
             except Exception as e:
                 import sys
                 print(e, file=sys.stderr)
+                # the token could have been revoked, a new one is requested at the next attempt
+                self.invalidate_token()
                 attempt += 1
-                handle_network_error(output_file, attempt, max_attempt)
-        if nc_file is None:
-            raise Exception("ERROR an unknown error happened when try to download: " + output_file)
-        return nc_file
+                for _, _, output_file in pending:
+                    if output_file not in nc_files:
+                        rm(output_file)
+                handle_network_error(', '.join(hda_request[2] for hda_request in pending), attempt, max_attempt)
+        if len(nc_files) < len(hda_requests):
+            raise Exception("ERROR an unknown error happened when try to download: " +
+                            ', '.join(hda_request[2] for hda_request in hda_requests))
+        return nc_files
 
 
 def handle_network_error(output_file, attempt, max_attempt):
@@ -1,32 +1,41 @@
 from download.interface.iinput import InputStrategy
 from download.wekeo import dataset_access as db
-import copy
+import numpy as np
+
+
+def snap(grid, values, mode: int):
+    """
+    Vectorised snapping of values on a sorted grid (O(log n) per value)
+    @param grid: sorted numpy array
+    @param values: value or array of values
+    @param mode: if 0 -> select the biggest value in grid that is contained by each value (lower or equal),
+                 if 1 -> select the minimum value in grid that contains each value (greater or equal)
+    @return: array with the snapped values, clipped to the grid bounds
+    """
+    values = np.asarray(values, dtype=float)
+    if mode == 0:
+        index = np.searchsorted(grid, values, side='right') - 1
+    else:
+        index = np.searchsorted(grid, values, side='left')
+    return grid[np.clip(index, 0, len(grid) - 1)]
 
 
 def binary_search(elements, value, mode: int):
     """
-    @param elements: list where to search
+    @param elements: sorted list where to search
     @param value: value used to find the sets
     @param mode: if 0 -> select the biggest value in elements that is contained by x_des,
                  if 1 -> select the minimum value in elements that contains x_des
     @return: if mode == 0: the biggest value in elements that is contained within x_des,
              if mode == 1: the minimum value in elements that contains x_des
     """
-    half_index = int(len(elements) / 2)
-
-    if len(elements) == 2:
-        if mode == 0:
-            return elements[0]
-        else:
-            return elements[1]
-
-    if elements[half_index] == value:
-        return elements[half_index]
-    # if mode == 1 the bigger element from left list is excluded.
-    elif value < elements[half_index]:
-        return binary_search(elements[0: half_index + 1], value, mode)
-    else:
-        return binary_search(elements[half_index:len(elements)], value, mode)
+    return snap(np.asarray(elements, dtype=float), value, mode).item()
+
+
+def snap_lower_bound(grid, values):
+    # values below the grid are kept as they are
+    values = np.asarray(values, dtype=float)
+    return np.where(values > grid[0], snap(grid, values, 0), values)
 
 
 class InHDA(InputStrategy):
@@ -58,23 +67,24 @@ class InHDA(InputStrategy):
                     depth: depth range in string format: [minDepth, maxDepth]
         @return: depth range in string format: [minDepth, maxDepth]
         """
-        depth_dataset = self.dataset.get_depth(dataset)
-        if depth_dataset is None:
+        depth = self.snap_depths([workingDomain['depth']], dataset)
+        if depth is None:
             print("Dataset: ", dataset, " doesn't have depth attribute")
             return None
-        depth = copy.deepcopy(workingDomain['depth'])
-        depth_dataset.sort()
-
-        if depth[0] > min(depth_dataset):
-            depth[0] = str(binary_search(depth_dataset, depth[0], 0))
-        else:
-            depth[0] = str(depth[0])
-
-        depth[1] = str(binary_search(depth_dataset, depth[1], 1))
+        return [str(d) for d in depth[0].tolist()]
 
-        if depth is None:
-            raise Exception("Can't extract vertical domain from wd: " + str(workingDomain))
-        return depth
+    def snap_depths(self, depths, dataset):
+        """
+        Snap many depth ranges at once on the depth grid of the dataset
+        @param depths: array-like (n, 2) of depth ranges [minDepth, maxDepth]
+        @param dataset: source dataset
+        @return: array (n, 2) of depth ranges that contain the requested ranges, None if the dataset has no depth
+        """
+        depth_dataset = self.dataset.get_grid(dataset, 'depth')
+        if depth_dataset is None:
+            return None
+        depths = np.asarray(depths, dtype=float)
+        return np.stack([snap_lower_bound(depth_dataset, depths[:, 0]), snap(depth_dataset, depths[:, 1], 1)], axis=1)
 
     # time information from daccess is already correct
     def get_time(self, workingDomain):
@@ -93,19 +103,19 @@ class InHDA(InputStrategy):
         if 'lonLat' not in workingDomain:
             raise Exception("Can't read lonLat from workingDomain")
 
-        lonLat_tmp = workingDomain['lonLat']
-        lonLat = [lonLat_tmp[0], lonLat_tmp[2], lonLat_tmp[1], lonLat_tmp[3]]
+        return self.snap_lon_lats([workingDomain['lonLat']], dataset)[0].tolist()
 
-        lon_dataset = self.dataset.get_lon(dataset)
-        if lonLat[0] > min(lon_dataset):
-            lonLat[0] = binary_search(lon_dataset, lonLat[0], 0)
-        lonLat[2] = binary_search(lon_dataset, lonLat[2], 1)
-
-        lat_dataset = self.dataset.get_lat(dataset)
-        if lonLat[1] > min(lon_dataset):
-            lonLat[1] = binary_search(lat_dataset, lonLat[1], 0)
-        lonLat[3] = binary_search(lat_dataset, lonLat[3], 1)
-
-        if lonLat is None:
-            raise Exception("Can't extract horizontal domain from wd: " + str(workingDomain))
-        return lonLat
+    def snap_lon_lats(self, lonLats, dataset):
+        """
+        Snap many horizontal domains at once on the lon/lat grid of the dataset (e.g. to plan a batch of requests)
+        @param lonLats: array-like (n, 4) of horizontal domains [minLon, maxLon, minLat, maxLat]
+        @param dataset: source dataset
+        @return: array (n, 4) of domains [minLon, minLat, maxLon, maxLat] that contain the requested domains
+        """
+        lonLats = np.asarray(lonLats, dtype=float)
+        lon_dataset = self.dataset.get_grid(dataset, 'lon')
+        lat_dataset = self.dataset.get_grid(dataset, 'lat')
+        return np.stack([snap_lower_bound(lon_dataset, lonLats[:, 0]),
+                         snap_lower_bound(lat_dataset, lonLats[:, 2]),
+                         snap(lon_dataset, lonLats[:, 1], 1),
+                         snap(lat_dataset, lonLats[:, 3], 1)], axis=1)
@@ -0,0 +1,139 @@
+"""
+Local stub of the HDA data broker, to test the download offline.
+
+Usage:
+    python -m download.wekeo.stub_server --port 8080 --delay 3 --file my_file.nc
+    export HDA_BROKER_ENDPOINT=http://localhost:8080/databroker
+
+then use Daccess (or HDA) with a non empty hda_key, the token is requested to the stub instead of the bluecloud proxy.
+Jobs and orders are 'running' during --delay seconds after their creation, then 'completed'.
+The downloaded file is --file, or a few dummy bytes if not given.
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BROKER_PATH = '/databroker'
+
+
+class StubHDAState:
+    def __init__(self, delay=3., payload=b'stub'):
+        """
+        @param delay: seconds before a job/order is completed
+        @param payload: bytes returned by the download of an order
+        """
+        self.delay = delay
+        self.payload = payload
+        self.created = dict()  # job/order id -> creation time
+        self.polls = dict()  # job/order id -> number of status requests
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def new_id(self, prefix):
+        with self._lock:
+            request_id = '{}{}'.format(prefix, next(self._counter))
+            self.created[request_id] = time.time()
+            self.polls[request_id] = 0
+        return request_id
+
+    def status(self, request_id):
+        with self._lock:
+            self.polls[request_id] += 1
+        if time.time() - self.created[request_id] >= self.delay:
+            return 'completed'
+        return 'running'
+
+
+class StubHDAHandler(BaseHTTPRequestHandler):
+    state = StubHDAState()
+
+    def _send_json(self, body, code=200):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length)) if length else dict()
+
+    def do_GET(self):
+        path = self.path.split('?')[0][len(BROKER_PATH):]
+        if path == '/gettoken':
+            self._send_json({'access_token': 'stub-token'})
+        elif path.startswith('/termsaccepted/'):
+            self._send_json({'accepted': True})
+        elif re.fullmatch(r'/datarequest/status/[^/]+', path) or re.fullmatch(r'/dataorder/status/[^/]+', path):
+            request_id = path.split('/')[-1]
+            if request_id not in self.state.created:
+                self._send_json({'message': 'unknown id'}, code=404)
+            else:
+                self._send_json({'status': self.state.status(request_id)})
+        elif re.fullmatch(r'/datarequest/jobs/[^/]+/result', path):
+            job_id = path.split('/')[-2]
+            self._send_json({'content': [{'url': 'stub://' + job_id, 'filename': job_id + '.nc',
+                                          'size': len(self.state.payload)}], 'totItems': 1})
+        elif re.fullmatch(r'/dataorder/download/[^/]+', path):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(self.state.payload)))
+            self.end_headers()
+            self.wfile.write(self.state.payload)
+        else:
+            self._send_json({'message': 'not found'}, code=404)
+
+    def do_PUT(self):
+        self._send_json({'accepted': True})
+
+    def do_POST(self):
+        path = self.path.split('?')[0][len(BROKER_PATH):]
+        self._read_json()
+        if path == '/datarequest':
+            self._send_json({'jobId': self.state.new_id('job')})
+        elif path == '/dataorder':
+            self._send_json({'orderId': self.state.new_id('order')})
+        else:
+            self._send_json({'message': 'not found'}, code=404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=8080, delay=3., payload=b'stub'):
+    """
+    Start the stub server in a background thread
+    @param port: port of the server, 0 for a free port
+    @param delay: seconds before a job/order is completed
+    @param payload: bytes returned by the download of an order
+    @return: the server (server.server_address gives the port, server.shutdown() stops it)
+    """
+    handler = type('Handler', (StubHDAHandler,), {'state': StubHDAState(delay, payload)})
+    server = ThreadingHTTPServer(('localhost', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parse = argparse.ArgumentParser(description="Local stub of the HDA data broker")
+    parse.add_argument('--port', type=int, default=8080, help='port of the server')
+    parse.add_argument('--delay', type=float, default=3., help='seconds before a job/order is completed')
+    parse.add_argument('--file', type=str, default=None, help='file returned by the downloads')
+    args = parse.parse_args()
+
+    payload = b'stub'
+    if args.file is not None:
+        with open(args.file, 'rb') as f:
+            payload = f.read()
+    server = start_server(args.port, args.delay, payload)
+    print("HDA stub listening on http://localhost:{}{}".format(server.server_address[1], BROKER_PATH))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,4 +1,6 @@
 # BIC calculation functions file
+import logging
+
 import xarray as xr
 import numpy as np
 
@@ -14,141 +16,19 @@ from datetime import datetime
 
 import warnings
 
+from utils.sampling_grid import mapping_corr_dist_index
+from utils.BIC_search import BIC_sweep, check_cold_start, early_stopping_search
 
-def mapping_corr_dist(corr_dist, start_point, grid_extent):
-    '''Remapping longitude/latitude grid using a start point. It creates a new grid from the start point 
-       where each point is separated the given correlation distance.
-
-           Parameters
-           ----------
-               corr_dist: correlation distance
-               start_point: latitude and longitude of the start point 
-               grid_extent: max and min latitude and longitude of the grid to be remapped 
-                    [min lon, max lon, min let, max lat]
-
-           Returns
-           ------
-               new_lats: new latitude vector with points separeted the correlation distance 
-               new_lons: new longitude vector with points separeted the correlation distance
-
-               '''
-
-    # angular distance d/earth's radius (km)
-    delta = corr_dist / 6371
-
-    # all in radians (conversion at the end)
-    grid_extent = grid_extent * np.pi / 180
-    start_point = start_point * np.pi / 180
-
-    ### while loop for lat nord ###
-    max_lat = grid_extent[3]
-    lat2 = -np.pi / 2
-    lat1 = start_point[1]
-    # bearing = 0 donc cos(0)=1 and sin(0)=0
-    new_lats = [lat1]
-    while lat2 < max_lat:
-        lat2 = np.arcsin(np.sin(lat1) * np.cos(delta) +
-                         np.cos(lat1) * np.sin(delta))
-        new_lats.append(lat2)
-        lat1 = lat2
-
-    ### while loop for lat sud ###
-    min_lat = grid_extent[2]
-    lat2 = np.pi / 2
-    lat1 = start_point[1]
-    # bearing = pi donc cos(pi)=-1 and sin(pi)=0
-    while lat2 > min_lat:
-        lat2 = np.arcsin(np.sin(lat1) * np.cos(delta) -
-                         np.cos(lat1) * np.sin(delta))
-        new_lats.append(lat2)
-        lat1 = lat2
-
-    new_lats = np.sort(new_lats) * 180 / np.pi
-
-    ### while loop for lon east ###
-    max_lon = grid_extent[1]
-    lon2 = -np.pi
-    lon1 = start_point[0]
-    lat1 = start_point[1]
-    # bearing = pi/2 donc cos(pi/2)=0 and sin(pi/2)=1
-    new_lons = [lon1]
-    dlon = np.arctan2(np.sin(delta) * np.cos(lat1),
-                      np.cos(delta) - np.sin(lat1) * np.sin(lat1))
-    while lon2 < max_lon:
-        lon2 = lon1 + dlon
-        new_lons.append(lon2)
-        lon1 = lon2
-
-    ### while loop for lon west ###
-    min_lon = grid_extent[0]
-    lon2 = np.pi
-    lon1 = start_point[0]
-    lat1 = start_point[1]
-    # bearing = -pi/2 donc cos(-pi/2)=0 and sin(-pi/2)=-1
-    dlon = np.arctan2(-np.sin(delta) * np.cos(lat1),
-                      np.cos(delta) - np.sin(lat1) * np.sin(lat1))
-    while lon2 > min_lon:
-        lon2 = lon1 + dlon
-        new_lons.append(lon2)
-        lon1 = lon2
-
-    new_lons = np.sort(new_lons) * 180 / np.pi
-
-    return new_lats, new_lons
-
-
-def mapping_corr_time(corr_time, start_point, time_extent):
-    '''Remapping time vector using a start point. It creates a new vector from the start point 
-       where elements are separated the time correlation.
-
-           Parameters
-           ----------
-               corr_time: correlation time
-               start_point: date of the start point 
-               time_extent: max and min time of the vector to be remapped 
-                    [min time, max time]
-
-           Returns
-           ------
-               new_time: new time vector with points separeted the time correlation
-
-               '''
-
-    # we are supossing that 1 month is 30 days for using np.timedelta64
-
-    ### while loop for bigger dates ###
-    max_time = time_extent[1]
-    time2 = time_extent[0]
-    time1 = start_point[0]
-    # bearing = 0 donc cos(0)=1 and sin(0)=0
-    new_time = [time1]
-    while time2 < max_time:
-        time2 = time1 + np.timedelta64(corr_time * 30, 'D')
-        new_time.append(time2)
-        time1 = time2
-
-    ### while loop for smaller dates ###
-    min_time = time_extent[0]
-    time2 = time_extent[1]
-    time1 = start_point[0]
-    # bearing = pi donc cos(pi)=-1 and sin(pi)=0
-    while time2 > min_time:
-        time2 = time1 - np.timedelta64(corr_time * 30, 'D')
-        new_time.append(time2)
-        time1 = time2
 
-    new_time = np.sort(new_time)
-
-    return new_time
-
-
-def BIC_cal(X, k, pcm_features):
+def BIC_cal(X, k, pcm_features, random_state=None):
     ''' Function that calculates BIC for a number of classes k
 
             Parameters
             ----------
                 X: dataset after preprocessing
                 k: number of classes
+                pcm_features: dictionary with pcm features {'temperature': z vector}
+                random_state: seed of the GaussianMixture initialisation. Default: None
 
             Returns
             ------
@@ -159,6 +39,7 @@ def BIC_cal(X, k, pcm_features):
 
     # create model
     m = pcm(K=k + 1, features=pcm_features)
+    m._classifier.set_params(random_state=random_state)
     # fit model
     m._classifier.fit(X)
 
@@ -181,9 +62,161 @@ def BIC_cal(X, k, pcm_features):
     return BIC, k
 
 
-def BIC_calculation(ds, corr_dist, coords_dict, time_steps, pcm_features, features_in_ds, z_dim, Nrun=10, NK=20):
+# datasets of the BIC runs, sent once to each worker of map_tasks (see init_shared) instead of with each task
+_shared = None
+
+
+def init_shared(shared):
+    '''Worker initializer of map_tasks: keeps the datasets of the BIC runs in the worker process.
+
+           Parameters
+           ----------
+               shared: list with the dataset of each run after preprocessing
+
+               '''
+
+    global _shared
+    _shared = shared
+
+
+def BIC_cal_shared(run, k, pcm_features, random_state=None):
+    '''BIC_cal on the dataset of a run shared with the workers (see init_shared)'''
+    return BIC_cal(_shared[run], k, pcm_features, random_state=random_state)
+
+
+def BIC_sweep_shared(run, NK, random_state=None):
+    '''BIC_sweep on the dataset of a run shared with the workers (see init_shared)'''
+    return BIC_sweep(_shared[run], NK, random_state=random_state)
+
+
+def map_tasks(func, tasks, backend='serial', n_jobs=None, shared=None):
+    '''Apply func to each tuple of arguments in tasks, using the selected parallel backend.
+       The shared data are sent once to each worker (process initializer, automatic memmapping of joblib) and not
+       with each task, the tasks only give the index of the data to be used (see BIC_cal_shared).
+
+           Parameters
+           ----------
+               func: function to be applied (it should be defined at module level for the process backend)
+               tasks: list of tuples of arguments
+               backend: 'serial', 'thread' (ThreadPoolExecutor), 'process' (ProcessPoolExecutor) or 'joblib'.
+                    Default: 'serial'
+               n_jobs: number of workers. Default: None, all the available cores are used
+               shared: data shared by all the tasks (see init_shared). Default: None
+
+           Returns
+           ------
+               results: list of results, in the same order as tasks
+
+               '''
+
+    if backend == 'serial':
+        init_shared(shared)
+        return [func(*task) for task in tqdm(tasks)]
+    elif backend in ('thread', 'process'):
+        if backend == 'thread':
+            init_shared(shared)
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs, initializer=init_shared,
+                                                              initargs=(shared,))
+        with executor:
+            futures = [executor.submit(func, *task) for task in tasks]
+            for _ in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+                pass
+            return [future.result() for future in futures]
+    elif backend == 'joblib':
+        from joblib import Parallel, delayed
+        # arrays larger than 1MB are dumped once to a memmap shared by the workers
+        return Parallel(n_jobs=n_jobs if n_jobs is not None else -1)(
+            delayed(call_shared)(func, shared, task) for task in tasks)
+    else:
+        raise ValueError(
+            'backend is not valid. Please, chose between these options: "serial", "thread", "process" or "joblib".')
+
+
+def call_shared(func, shared, task):
+    '''Joblib task: initialise the shared data of the worker (see init_shared) and apply func'''
+    init_shared(shared)
+    return func(*task)
+
+
+def preprocessing_cache(ds, coords_dict, time_steps, pcm_features, features_in_ds, z_dim):
+    '''Preprocessing (scaler + reducer) fitted once on the full training set. The transformed matrix is cached with
+       the row of each (time, latitude, longitude) profile, so the dataset of each BIC run is a gather of rows.
+
+           Parameters
+           ----------
+               ds: dataset
+               coords_dict: dictionary with coordinates names
+                    {'depth': 'depth', 'latitude': 'latitude', 'time': 'time', 'longitude': 'longitude'}
+               time_steps: time steps to be taken in to acount (format %Y-%m)
+               pcm_features: dictionary with pcm features {'temperature': z vector}
+               features_in_ds: dictionary with the name of feaures in the model and in the dataste
+                    {temperature: thetao}
+               z_dim: name of the z variable
+
+           Returns
+           ------
+               cache: dictionary with the transformed matrix 'X', the row of each flat profile index 'row' (-1 for the
+                    profiles dropped by the preprocessing), the sampling dimensions 'dims' and their 'shape', and the
+                    time indices of each time step 'time_index'. None if the rows can not be matched with the profiles
+
+               '''
+
+    time_dim = coords_dict.get('time')
+    ds_steps = [ds.sel({time_dim: time_step}) for time_step in time_steps]
+    ds_train = xr.concat(ds_steps, dim=time_dim) if len(ds_steps) > 1 else ds_steps[0]
+    sizes = [ds_step.sizes[time_dim] for ds_step in ds_steps]
+    time_index = np.split(np.arange(sum(sizes)), np.cumsum(sizes)[:-1])
+
+    # K=4 it is not important, it is only used for preprocess data
+    m = pcm(K=4, features=pcm_features)
+    X, sampling_dims = m.preprocessing(ds_train, features=features_in_ds, dim=z_dim, action='fit')
+    sampling_dims = list(sampling_dims)
+    if sorted(sampling_dims) != sorted([time_dim, coords_dict.get('latitude'), coords_dict.get('longitude')]):
+        warnings.warn("Sampling dimensions %s not supported by the preprocessing cache" % sampling_dims)
+        return None
+
+    # profiles kept by the preprocessing: no NaN in any feature, in the order of the stacked sampling dimensions
+    valid = None
+    for feature_in_ds in features_in_ds.values():
+        mask = ds_train[feature_in_ds].transpose(*sampling_dims, z_dim).notnull().all(dim=z_dim).values
+        valid = mask if valid is None else valid & mask
+    if valid.sum() != X.shape[0]:
+        warnings.warn("Preprocessed rows do not match the dataset profiles, the preprocessing cache is not used")
+        return None
+
+    row = np.full(valid.size, -1)
+    row[valid.ravel()] = np.arange(X.shape[0])
+
+    return {'X': np.asarray(X), 'row': row, 'dims': sampling_dims, 'shape': valid.shape, 'time_index': time_index}
+
+
+def gather_rows(cache, index_dict):
+    '''Rows of the cached matrix (see preprocessing_cache) for the profiles of an orthogonal selection.
+
+           Parameters
+           ----------
+               cache: preprocessing cache
+               index_dict: dictionary with the integer indices to be selected along each sampling dimension
+
+           Returns
+           ------
+               rows: rows of cache['X'], profiles dropped by the preprocessing are skipped
+
+               '''
+
+    flat = np.ravel_multi_index(np.ix_(*[index_dict[dim] for dim in cache['dims']]), cache['shape']).ravel()
+    rows = cache['row'][flat]
+    return rows[rows >= 0]
+
+
+def BIC_calculation(ds, corr_dist, coords_dict, time_steps, pcm_features, features_in_ds, z_dim, Nrun=10, NK=20,
+                    backend='serial', n_jobs=None, random_state=0, warm_start=False, early_stopping=False,
+                    patience=3, band=1., coarse_step=1, shared_preprocessing=False, validate_warm_start=False):
     '''Calculation of BIC (Bayesian Information Criteria) for a training dataset.
-        The calculation is parallelised using ThreadPoolExecutor.
+        The Nrun x NK model fits are independent tasks, they can be parallelised using the backend option. The
+        dataset of each run is sent once to each worker, the tasks only give the run index (see map_tasks).
 
            Parameters
            ----------
@@ -198,6 +231,20 @@ def BIC_calculation(ds, corr_dist, coords_dict, time_steps, pcm_features, featur
                z_dim: name of the z variable
                Nrun: number of runs
                NK: max number of classes
+               backend: 'serial', 'thread', 'process' or 'joblib' (see map_tasks). Default: 'serial'
+               n_jobs: number of workers. Default: None, all the available cores are used
+               random_state: seed used to derive one seed per run (sampling) and per (run, k) fit, so the BIC
+                    curve is reproducible whatever the backend. Default: 0
+               warm_start: if True, each run is a warm-started sweep over the number of classes (see BIC_sweep)
+                    instead of NK independent fits with random initialisation. Default: False
+               validate_warm_start: if True, the warm-started sweep of the first run is compared with NK cold-start
+                    fits (see check_cold_start), to be used to validate the warm start on a new dataset. Default: False
+               early_stopping: if True, the number of classes is increased only until the BIC minimum is confirmed
+                    (see early_stopping_search), BIC values of the classes not evaluated are NaN. Default: False
+               patience, band, coarse_step: early stopping parameters (see early_stopping_search)
+               shared_preprocessing: if True, the preprocessing is fitted once on the full training set and each run
+                    gathers its rows from the transformed matrix (see preprocessing_cache), instead of fitting the
+                    preprocessing on each run dataset. Default: False
 
            Returns
            ------
@@ -210,9 +257,9 @@ def BIC_calculation(ds, corr_dist, coords_dict, time_steps, pcm_features, featur
     # TODO: automatic detection of variables names
     # TODO: If only one time step?
 
-    # grid extent
-    grid_extent = np.array([ds[coords_dict.get('longitude')].values.min(), ds[coords_dict.get('longitude')].values.max(
-    ), ds[coords_dict.get('latitude')].values.min(), ds[coords_dict.get('latitude')].values.max()])
+    # dataset coordinates, the sampling grid of each run is given as indices into them
+    lat_values = ds[coords_dict.get('latitude')].values
+    lon_values = ds[coords_dict.get('longitude')].values
 
     # check time steps
     if len(time_steps) > 1:
@@ -229,19 +276,39 @@ def BIC_calculation(ds, corr_dist, coords_dict, time_steps, pcm_features, featur
 
     ## Here was the previously nested BIC_cal function
 
-    BIC = np.zeros((NK, Nrun))
+    if warm_start and early_stopping:
+        raise ValueError('warm_start and early_stopping options can not be used together.')
+
+    # one independent seed sequence per run: sampling and fits do not depend on the execution order
+    run_seeds = np.random.SeedSequence(random_state).spawn(Nrun)
+
+    cache = None
+    if shared_preprocessing:
+        cache = preprocessing_cache(ds, coords_dict, time_steps, pcm_features, features_in_ds, z_dim)
+
+    X_runs = []
+    seeds = []
     for run in range(Nrun):
+        rng = np.random.default_rng(run_seeds[run])
+        fit_seeds = run_seeds[run].generate_state(NK)
+        rows = []
 
         for itime in range(len(time_steps)):  # time loop
             # random fist point
-            latp = np.random.choice(ds[coords_dict.get('latitude')].values, 1, replace=False)
-            lonp = np.random.choice(ds[coords_dict.get('longitude')].values, 1, replace=False)
+            latp = rng.choice(lat_values, 1, replace=False)
+            lonp = rng.choice(lon_values, 1, replace=False)
             # remapping
-            new_lats, new_lons = mapping_corr_dist(
-                corr_dist=corr_dist, start_point=np.concatenate((lonp, latp)), grid_extent=grid_extent)
+            lat_index, lon_index = mapping_corr_dist_index(
+                corr_dist=corr_dist, start_point=np.concatenate((lonp, latp)), lat_values=lat_values,
+                lon_values=lon_values)
+
+            if cache is not None:
+                rows.append(gather_rows(cache, {coords_dict.get('time'): cache['time_index'][itime],
+                                                coords_dict.get('latitude'): lat_index,
+                                                coords_dict.get('longitude'): lon_index}))
+                continue
 
-            ds.sel({coords_dict.get('latitude'): 30, coords_dict.get('longitude'): 30}, method='nearest')
-            ds_run_i = ds.sel({coords_dict.get('latitude'): list(new_lats), coords_dict.get('longitude'): list(new_lons)}, method='nearest')
+            ds_run_i = ds.isel({coords_dict.get('latitude'): lat_index, coords_dict.get('longitude'): lon_index})
             ds_run_i = ds_run_i.sel({coords_dict.get('time'): time_steps[itime]})
 
             # change lat and lot dimensions by index to be able to merge the datasets (it is not necessary to have lat lon information)
@@ -264,22 +331,45 @@ def BIC_calculation(ds, corr_dist, coords_dict, time_steps, pcm_features, featur
                 # concat time steps
                 ds_run = xr.concat([ds_run, ds_run_i], dim=coords_dict.get('time'))
 
-        # pre-processing
-        # K=4 it is not important, it is only used for preprocess data
-        m = pcm(K=4, features=pcm_features)
-        X, sampling_dims = m.preprocessing(
-            ds_run, features=features_in_ds, dim=z_dim, action='fit')
+        if cache is not None:
+            X = cache['X'][np.concatenate(rows)]
+        else:
+            # pre-processing
+            # K=4 it is not important, it is only used for preprocess data
+            m = pcm(K=4, features=pcm_features)
+            X, sampling_dims = m.preprocessing(
+                ds_run, features=features_in_ds, dim=z_dim, action='fit')
 
-        # serial computation of BIC
-        results = []
-        for k in class_list:
-            results.append(BIC_cal(X, k, pcm_features))
+        X_runs.append(np.asarray(X))
+        seeds.append(fit_seeds)
 
-        results = [r for r in results if r is not None]
-        results.sort(key=lambda x: x[1])
-        BIC[:, run] = np.array([i[0] for i in results])
-
-    BIC_min = np.argmin(np.mean(BIC, axis=1)) + 1
+    # computation of BIC for all runs and number of classes
+    BIC = np.zeros((NK, Nrun))
+    if early_stopping:
+        def eval_k(k):
+            k_tasks = [(run, k, pcm_features, int(seeds[run][k])) for run in range(Nrun)]
+            return [bic for bic, _ in map_tasks(BIC_cal_shared, k_tasks, backend=backend, n_jobs=n_jobs,
+                                                shared=X_runs)]
+
+        BIC = early_stopping_search(eval_k, NK, Nrun, patience=patience, band=band, coarse_step=coarse_step)
+    elif warm_start:
+        tasks = [(run, NK, int(seeds[run][0])) for run in range(Nrun)]
+        results = map_tasks(BIC_sweep_shared, tasks, backend=backend, n_jobs=n_jobs, shared=X_runs)
+        for run, (bic, n_iter) in enumerate(results):
+            BIC[:, run] = bic
+        n_iter = np.array([r[1] for r in results])
+        logging.info(f"warm-started BIC sweep, mean EM iterations per number of classes: {n_iter.mean(axis=0)}, "
+                     f"total: {n_iter.sum()}")
+        if validate_warm_start:
+            # iterations saved and BIC tolerance, against cold starts on the dataset of the first run
+            check_cold_start(X_runs[0], BIC[:, 0], n_iter[0], random_state=int(seeds[0][0]))
+    else:
+        tasks = [(run, k, pcm_features, int(seeds[run][k])) for run in range(Nrun) for k in class_list]
+        results = map_tasks(BIC_cal_shared, tasks, backend=backend, n_jobs=n_jobs, shared=X_runs)
+        for i, (bic, k) in enumerate(results):
+            BIC[k, i // NK] = bic
+
+    BIC_min = np.nanargmin(np.mean(BIC, axis=1)) + 1
 
     return BIC, BIC_min
 
@@ -422,17 +422,13 @@ class Plotter:
                     keyword.
 
                '''
-        def core_funct(x):
-            res = np.nan
-            if np.count_nonzero(~np.isnan(x)) != 0:
-                res = np.argmax(np.bincount(x.astype('int')))
-            return res
-        
         def get_most_freq_labels(this_ds):
-            this_ds = this_ds.stack({'N_OBS': [d for d in this_ds['PCM_LABELS'].dims if d != 'time']})
-            this_ds = this_ds.chunk({"N_OBS":10000})
-            this_ds['PCM_MOST_FREQ_LABELS'] = xr.apply_ufunc(core_funct, this_ds['PCM_LABELS'], dask="parallelized", input_core_dims=[['time']], vectorize=True, output_dtypes=np.float).load()
-            return this_ds.unstack('N_OBS')
+            # class counts of each grid point along time, computed on the grid (no stack/unstack of the profiles).
+            # The reductions stay lazy on a dask-backed dataset: the labels are read chunk by chunk when plotted
+            labels = this_ds['PCM_LABELS']
+            counts = xr.concat([(labels == k).sum('time') for k in range(self.m.K)], dim='k')
+            most_freq = counts.argmax('k').where(labels.notnull().any('time'))
+            return this_ds.assign(variables={'PCM_MOST_FREQ_LABELS': most_freq})
 
         # spatial extent
         if isinstance(extent, str):
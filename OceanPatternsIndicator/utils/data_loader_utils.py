@@ -3,14 +3,19 @@ import xarray as xr
 import logging
 
 
-def load_data(file_name, var_name_ds):
+def load_data(file_name, var_name_ds, lazy=False, box=None, depth_range=None, memory_budget='128MiB'):
     """
     Load dataset into a Xarray dataset
 
     Parameters
     ----------
     var_name_ds : name of variable in dataset
-    file_name : Path to the NetCDF dataset
+    file_name : Path to the NetCDF dataset, or list of paths and in-memory NetCDF files (see open_files)
+    lazy : if True the dataset is kept dask-backed and only the selected variable/domain is read when needed,
+    otherwise the whole selection is loaded in memory (default)
+    box : optional working domain [lon_min, lat_min, lon_max, lat_max] selected before reading the data
+    depth_range : optional depth range [depth_min, depth_max] (positive values) selected before reading the data
+    memory_budget : target size of each dask chunk in lazy mode (e.g. '128MiB')
 
     Returns
     -------
@@ -18,10 +23,17 @@ def load_data(file_name, var_name_ds):
     first_date: string, first time slice of the dataset
     coord_dict: coordinate dictionary for pyXpcm
     """
-    logging.info(f"dataset to load: {file_name}")
-    ds = xr.open_mfdataset(file_name).load()
+    logging.info(f"dataset to load: {describe_files(file_name)}")
+    # open lazily: nothing is read from disk until the variable and domain are selected
+    ds = open_files(file_name)
     # select var
     ds = ds[[var_name_ds]]
+    ds = select_working_domain(ds, box=box, depth_range=depth_range)
+    if lazy:
+        ds = chunk_dataset(ds, memory_budget=memory_budget)
+        logging.info(f"lazy loading, dataset chunks: {dict(ds.chunks)}")
+    else:
+        ds = ds.load()
     first_date = str(ds.time.min().values)[0:7]
     # exception to handle missing depth dim: setting depth to 0 because the dataset most likely represents surface data
     try:
@@ -36,6 +48,44 @@ def load_data(file_name, var_name_ds):
     return ds, first_date, coord_dict
 
 
+def open_files(file_name):
+    """
+    Open the input files as a single lazy Xarray dataset
+
+    Parameters
+    ----------
+    file_name : path (or glob pattern) of the NetCDF files, or list whose elements are paths or in-memory NetCDF
+    files (any object with the buffer interface, e.g. the memoryview returned by Daccess.download with
+    return_type='buffer'). The in-memory files are read by netCDF4 directly from the buffer, without copy or disk
+    round trip
+
+    Returns
+    -------
+    ds: Xarray dataset
+    """
+    if isinstance(file_name, str):
+        return xr.open_mfdataset(file_name, chunks={})
+    datasets = list()
+    for i, file in enumerate(file_name):
+        if isinstance(file, str):
+            datasets.append(xr.open_dataset(file, chunks={}))
+        else:
+            import netCDF4
+            nc_file = netCDF4.Dataset(f"in_memory_{i}.nc", mode='r', memory=file)
+            datasets.append(xr.open_dataset(xr.backends.NetCDF4DataStore(nc_file), chunks={}))
+    return xr.combine_by_coords(datasets, combine_attrs='drop_conflicts')
+
+
+def describe_files(file_name):
+    """
+    Short description of the input files for the logs (the in-memory files are not printed)
+    """
+    if isinstance(file_name, str):
+        return file_name
+    n_memory = sum(not isinstance(file, str) for file in file_name)
+    return f"{len(file_name) - n_memory} files on disk, {n_memory} files in memory"
+
+
 def get_coords_dict(ds):
     """
     create a dict of coordinates to mapping each dimension of the dataset
@@ -60,4 +110,83 @@ def get_coords_dict(ds):
             coords_dict.update({'time': c})
         if axis_at == 'Z':
             coords_dict.update({'depth': c})
-    return coords_dict
\ No newline at end of file
+    return coords_dict
+
+
+def select_working_domain(ds, box=None, depth_range=None):
+    """
+    Select the working domain using the 1D coordinates only, so that no data is read from disk
+
+    Parameters
+    ----------
+    ds : Xarray dataset
+    box : list [lon_min, lat_min, lon_max, lat_max] or None
+    depth_range : list [depth_min, depth_max] (positive values) or None
+
+    Returns
+    -------
+    ds: Xarray dataset restricted to the working domain
+    """
+    coords_dict = get_coords_dict(ds)
+    indexers = {}
+    if box is not None:
+        for coord, vmin, vmax in [('longitude', box[0], box[2]), ('latitude', box[1], box[3])]:
+            if coord in coords_dict:
+                values = ds[coords_dict[coord]].values
+                indexers[coords_dict[coord]] = np.flatnonzero((values >= vmin) & (values <= vmax))
+    if depth_range is not None and 'depth' in coords_dict:
+        values = np.abs(ds[coords_dict['depth']].values)
+        indexers[coords_dict['depth']] = np.flatnonzero((values >= min(depth_range)) & (values <= max(depth_range)))
+    for dim, index in indexers.items():
+        if index.size == 0:
+            raise ValueError(f"working domain selection is empty along {dim}")
+    return ds.isel(indexers)
+
+
+def chunk_dataset(ds, memory_budget='128MiB'):
+    """
+    Rechunk the dataset with chunk sizes computed automatically from a memory budget. The vertical axis is kept in a
+    single chunk because pyXpcm needs complete profiles.
+
+    Parameters
+    ----------
+    ds : Xarray dataset (dask-backed)
+    memory_budget : target size of each chunk (e.g. '128MiB')
+
+    Returns
+    -------
+    ds: rechunked Xarray dataset
+    """
+    import dask
+
+    coords_dict = get_coords_dict(ds)
+    chunks = {dim: 'auto' for dim in ds.dims}
+    if coords_dict.get('depth') in ds.dims:
+        chunks[coords_dict['depth']] = -1
+    with dask.config.set({'array.chunk-size': memory_budget}):
+        ds = ds.chunk(chunks)
+    return ds
+
+
+def get_load_options(args):
+    """
+    Build the load_data keyword arguments from the method arguments. Lazy loading is enabled with 'lazy_load': True,
+    in that case the working domain is also selected before reading the data.
+
+    Parameters
+    ----------
+    args : Dictionary of the method arguments (optional keys: lazy_load, memory_budget, working_domain)
+
+    Returns
+    -------
+    dict of keyword arguments for load_data
+    """
+    if not args.get('lazy_load', False):
+        return {}
+    working_domain = args.get('working_domain', {})
+    options = {'lazy': True, 'memory_budget': args.get('memory_budget', '128MiB')}
+    if working_domain.get('box'):
+        options['box'] = working_domain['box'][0]
+    if working_domain.get('depth_layers'):
+        options['depth_range'] = working_domain['depth_layers'][0]
+    return options
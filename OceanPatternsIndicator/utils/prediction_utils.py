@@ -1,8 +1,11 @@
 import logging
 
 import numpy as np
+import pandas as pd
+import xarray as xr
 import matplotlib.pyplot as plt
 from utils.Plotter import Plotter
+from utils.grouped_quantiles import grouped_quantiles, QuantileSketch
 
 
 def predict(m, ds, var_name_mdl, var_name_ds, z_dim):
@@ -46,7 +49,130 @@ def robustness(m, ds, features_in_ds, z_dim):
     return ds
 
 
-def quantiles(ds, m, var_name_ds):
+def predict_by_time_blocks(m, ds, var_name_mdl, var_name_ds, z_dim, time_dim='time', months_per_block=1,
+                           out_file='predicted_dataset.nc', sketch_q=(0.05, 0.5, 0.95)):
+    """
+    Streaming prediction: the dataset is walked in blocks of months_per_block months, each block is loaded,
+    classified (labels, posteriors and robustness) and appended along the time dimension to out_file before the next
+    block is read, so the peak memory is bounded by the block size and not by the length of the period.
+    The quantiles of each class are accumulated block by block in a QuantileSketch (memory bounded by K x depth
+    levels, relative error below 1% for values with magnitude between 1e-6 and 1e6, see QuantileSketch) and written
+    in the <var_name_ds>_Q variable of out_file, so they never need all the profiles in memory.
+    Parameters
+    ----------
+    m : Trained model
+    ds : Xarray dataset, preferably lazy (see load_data)
+    var_name_mdl : name of variable in model
+    var_name_ds : name of variable in dataset
+    z_dim : z axis dimension (depth)
+    time_dim : time dimension
+    months_per_block : number of months classified at once
+    out_file : NetCDF file where the predicted blocks are written (time is its unlimited dimension)
+    sketch_q : quantiles computed with the streaming sketch
+
+    Returns
+    -------
+    ds: Xarray dataset (dask-backed) read from out_file, with the predictions of all the blocks and the quantiles
+    """
+    features_in_ds = {var_name_mdl: var_name_ds}
+    months = ds[time_dim].dt.strftime('%Y-%m').values
+    unique_months = np.unique(months)
+    sketch = QuantileSketch(m.K, ds.sizes[z_dim])
+    for i in range(0, len(unique_months), months_per_block):
+        block_months = unique_months[i:i + months_per_block]
+        block = ds.isel({time_dim: np.flatnonzero(np.isin(months, block_months))}).load()
+        block = predict(m=m, ds=block, var_name_mdl=var_name_mdl, var_name_ds=var_name_ds, z_dim=z_dim)
+        block = robustness(m=m, ds=block, features_in_ds=features_in_ds, z_dim=z_dim)
+        values, labels = stack_profiles(block, var_name_ds)
+        sketch.update(values, labels)
+        if i == 0:
+            # float time units, so the appended blocks keep their hours
+            block.to_netcdf(out_file, format='NETCDF4', unlimited_dims=[time_dim],
+                            encoding={time_dim: {'units': 'seconds since 1970-01-01', 'dtype': 'float64'}})
+        else:
+            append_block(out_file, block, time_dim)
+        logging.info(f"block {block_months[0]} - {block_months[-1]} predicted and appended to {out_file}")
+        del block
+
+    q = list(sketch_q)
+    m_quantiles = xr.Dataset({var_name_ds + "_Q": (('pcm_class', 'quantile', z_dim), sketch.quantiles(q))},
+                             coords={'pcm_class': range(m.K), 'quantile': q})
+    m_quantiles[var_name_ds + "_Q"].attrs = ds[var_name_ds].attrs
+    m_quantiles.to_netcdf(out_file, mode='a', format='NETCDF4')
+    return xr.open_dataset(out_file, chunks={time_dim: 1})
+
+
+def append_block(out_file, block, time_dim):
+    """
+    Append a predicted block along the (unlimited) time dimension of a NetCDF file written by xarray
+    Parameters
+    ----------
+    out_file : NetCDF file, written with the first block
+    block : predicted block, Xarray dataset with the same variables
+    time_dim : time dimension
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(out_file, mode='a') as nc:
+        start = len(nc.dimensions[time_dim])
+        stop = start + block.sizes[time_dim]
+        for name, var in block.variables.items():
+            if time_dim not in var.dims or name not in nc.variables:
+                continue
+            nc_var = nc.variables[name]
+            if name == time_dim:
+                values = netCDF4.date2num(pd.to_datetime(var.values).to_pydatetime(), nc_var.units,
+                                          getattr(nc_var, 'calendar', 'standard'))
+            else:
+                values = var.transpose(*nc_var.dimensions).values
+                if np.issubdtype(values.dtype, np.floating):
+                    # NaNs are written as the fill value (packed variables are packed by netCDF4)
+                    values = np.ma.masked_invalid(values)
+            nc_var[tuple(slice(start, stop) if dim == time_dim else slice(None) for dim in nc_var.dimensions)] = values
+
+
+def stack_profiles(ds, var_name_ds):
+    """
+    Profiles of the variable and their class, as arrays
+    Parameters
+    ----------
+    ds : predicted dataset, Xarray dataset
+    var_name_ds : name var in ds
+
+    Returns
+    -------
+    values: array (profiles, depth levels)
+    labels: class of each profile, NaN for the profiles not classified
+    """
+    sampling_dims = list(ds['PCM_LABELS'].dims)
+    z_dim = [dim for dim in ds[var_name_ds].dims if dim not in sampling_dims][0]
+    values = ds[var_name_ds].stack({'sampling': sampling_dims}).transpose('sampling', z_dim).values
+    labels = ds['PCM_LABELS'].stack({'sampling': sampling_dims}).values
+    return values, labels
+
+
+def assign_quantiles(ds, var_name_ds, m_quantiles, q):
+    """
+    Add the quantiles of each class to the dataset, in the format of pyxpcm quantile
+    Parameters
+    ----------
+    ds : predicted dataset, Xarray dataset
+    var_name_ds : name var in ds
+    m_quantiles : array (classes, quantiles, depth levels)
+    q : list of quantiles
+
+    Returns
+    -------
+    ds: Xarray dataset with the <var_name_ds>_Q variable
+    """
+    z_dim = [dim for dim in ds[var_name_ds].dims if dim not in ds['PCM_LABELS'].dims][0]
+    ds = ds.assign(variables={var_name_ds + "_Q": (('pcm_class', 'quantile', z_dim), m_quantiles)})
+    ds = ds.assign_coords(coords={'pcm_class': range(m_quantiles.shape[0]), 'quantile': q})
+    ds[var_name_ds + "_Q"].attrs = ds[var_name_ds].attrs
+    return ds
+
+
+def quantiles(ds, m, var_name_ds, method='exact'):
     """
     compute quantiles and unstack dataset
     Parameters
@@ -54,13 +180,18 @@ def quantiles(ds, m, var_name_ds):
     ds : predicted dataset, stacked. Xarray dataset
     var_name_ds : name var in ds
     m: trained pyXpcm model
+    method : 'exact' or 'sketch' to use the grouped quantile engine (see grouped_quantiles), profiles are sorted by
+    class once instead of a masked copy of the dataset for each class, or 'pyxpcm' to use pyxpcm quantile
     Returns
     -------
     ds: Xarray dataset with quantiles
     """
-    ds = ds.pyxpcm.quantile(m, q=[0.05, 0.5, 0.95], of=var_name_ds, outname=var_name_ds + '_Q', keep_attrs=True,
-                            inplace=True)
-    return ds
+    q = [0.05, 0.5, 0.95]
+    if method == 'pyxpcm':
+        return ds.pyxpcm.quantile(m, q=q, of=var_name_ds, outname=var_name_ds + '_Q', keep_attrs=True, inplace=True)
+    values, labels = stack_profiles(ds, var_name_ds)
+    m_quantiles = grouped_quantiles(values, labels, q, m.K, method=method)
+    return assign_quantiles(ds, var_name_ds, m_quantiles, q)
 
 
 def save_empty_plot(name):
@@ -86,7 +217,7 @@ def save_empty_plot(name):
     return 0
 
 
-def generate_plots(m, ds, var_name_ds, first_date):
+def generate_plots(m, ds, var_name_ds, first_date, save_dataset=True):
     """
     Generates and saves the following plots:
     - vertical structure: vertical structure of each classes. It draws the mean profile and the 0.05 and 0.95 quantiles
@@ -104,6 +235,8 @@ def generate_plots(m, ds, var_name_ds, first_date):
     ds : Xarray dataset containing the predictions
     var_name_ds : name of the variable in the dataset
     first_date: date of first time slice
+    save_dataset: if True, the dataset is saved in predicted_dataset.nc (False when it was already written there by
+    predict_by_time_blocks)
     Returns
     -------
     saves all the plots as png
@@ -146,4 +279,5 @@ def generate_plots(m, ds, var_name_ds, first_date):
         logging.warning('plot seasonal temporal distribution is not available, the following error occurred:')
         logging.exception(e)
     # save data
-    ds.to_netcdf('predicted_dataset.nc', format='NETCDF4')
\ No newline at end of file
+    if save_dataset:
+        ds.to_netcdf('predicted_dataset.nc', format='NETCDF4')
\ No newline at end of file
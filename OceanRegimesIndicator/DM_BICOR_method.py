@@ -24,7 +24,8 @@ def get_args():
     return parse.parse_args()
 
 
-def compute_BIC(ds, var_name_ds, nk, corr_dist):
+def compute_BIC(ds, var_name_ds, nk, corr_dist, warm_start=False, early_stopping=False, patience=3, band=1.,
+                coarse_step=1, random_state=0, validate_warm_start=False):
     """
     The BIC (Bayesian Information Criteria) can be used to optimize the number of classes in the model, trying not to
     over-fit or under-fit the data. To compute this index, the model is fitted to the training dataset for a range of K
@@ -34,6 +35,13 @@ def compute_BIC(ds, var_name_ds, nk, corr_dist):
     ds : Xarray dataset
     var_name_ds: the name of the variable in the dataset
     nk : number of K to explore (always starts at 1 up to nk)
+    warm_start : if True, use a warm-started sweep over K instead of independent fits
+    early_stopping : if True, stop increasing K once the BIC minimum is confirmed
+    patience : number of consecutive K significantly above the minimum needed to stop (early stopping)
+    band : significance threshold in standard deviations of the per-run BIC differences (early stopping)
+    coarse_step : step of the coarse grid of K, refined around its minimum (early stopping)
+    random_state : seed of the warm-started sweeps (default 0)
+    validate_warm_start : if True, compare the warm-started sweep of the first run with cold-start fits
 
     Returns
     -------
@@ -43,7 +51,9 @@ def compute_BIC(ds, var_name_ds, nk, corr_dist):
     bic, bic_min = BIC_calculation(X=ds, coords_dict={'latitude': 'lat', 'longitude': 'lon'},
                                    corr_dist=corr_dist,
                                    feature_name='feature_reduced', var_name=var_name_ds + '_reduced',
-                                   Nrun=10, NK=nk)
+                                   Nrun=10, NK=nk, warm_start=warm_start, early_stopping=early_stopping,
+                                   patience=patience, band=band, coarse_step=coarse_step, random_state=random_state,
+                                   validate_warm_start=validate_warm_start)
     return bic, bic_min
 
 
@@ -169,6 +179,19 @@ def main_BICOR(args):
         var_name_ds: string, name var in dataset
         var_name_mdl: string, name var in model
         corr_dist: int, correlation distance
+        bic_warm_start: bool, optional, warm-started sweep over K (default False)
+        bic_validate_warm_start: bool, optional, compare the warm-started sweep with cold starts (default False)
+        random_state: int, optional, seed of the warm-started sweeps (default 0)
+        bic_early_stopping: bool, optional, stop increasing K once the minimum is confirmed (default False)
+        bic_patience: int, optional, early stopping patience (default 3)
+        bic_band: float, optional, early stopping threshold in standard deviations (default 1)
+        bic_coarse_step: int, optional, early stopping coarse grid step (default 1, no coarse grid)
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
+        preprocessing_cache: string, optional, directory of the preprocessing cache (disabled by default)
+        preprocessing_cache_size: int, optional, max size of the preprocessing cache in bytes (default 2 GiB)
+        preprocessing_chunk_size: int, optional, fit the scaler and an IncrementalPCA chunk by chunk of this number of
+            time series (default: full solver). The scaled and reduced matrices are computed chunk by chunk when they
+            are read, only the matrix of the ocean time series is held in memory
     """
     var_name_ds = args['var_name']
     corr_dist = args['corr_dist']
@@ -184,19 +207,26 @@ def main_BICOR(args):
 
     logging.info("loading the dataset")
     start_time = time.time()
-    ds_init = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds_init = load_data(file_name=file_name, var_name_ds=var_name_ds, **get_load_options(args))
     load_time = time.time() - start_time
     logging.info("load finished in " + str(load_time) + "sec")
 
     logging.info("preprocess the dataset")
     start_time = time.time()
-    ds, mask = preprocessing_ds(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path)
+    ds, mask = preprocessing_ds(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path,
+                                **get_cache_options(args), **get_preprocessing_options(args))
     load_time = time.time() - start_time
     logging.info("preprocessing finished in " + str(load_time) + "sec")
 
     logging.info("starting computation")
     start_time = time.time()
-    bic, bic_min = compute_BIC(ds=ds, var_name_ds=var_name_ds, nk=nk, corr_dist=corr_dist)
+    bic, bic_min = compute_BIC(ds=ds, var_name_ds=var_name_ds, nk=nk, corr_dist=corr_dist,
+                               warm_start=args.get('bic_warm_start', False),
+                               early_stopping=args.get('bic_early_stopping', False),
+                               patience=int(args.get('bic_patience', 3)), band=float(args.get('bic_band', 1.)),
+                               coarse_step=int(args.get('bic_coarse_step', 1)),
+                               random_state=args.get('random_state', 0),
+                               validate_warm_start=args.get('bic_validate_warm_start', False))
     bic_time = time.time() - start_time
     logging.info("bic computation finished in " + str(bic_time) + "sec")
     # plot and save fig
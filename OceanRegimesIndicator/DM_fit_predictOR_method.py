@@ -1,7 +1,7 @@
 from utils.data_loader_utils import *
 from utils.model_train_utils import train_model
 from utils.prediction_utils import quantiles, robustness, predict, generate_plots
-import joblib
+from utils.model_bundle import save_bundle
 import time
 
 
@@ -35,6 +35,13 @@ def main_fitpred_OR(args):
         var_name: string, name var in dataset
         id_field: string, standard name of var
         mask: string, path to mask or 'auto'
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
+        quantile_method: string, optional, 'exact' (default) or 'sketch' (approximate)
+        preprocessing_cache: string, optional, directory of the preprocessing cache (disabled by default)
+        preprocessing_cache_size: int, optional, max size of the preprocessing cache in bytes (default 2 GiB)
+        preprocessing_chunk_size: int, optional, fit the scaler and an IncrementalPCA chunk by chunk of this number of
+            time series (default: full solver). The scaled and reduced matrices are computed chunk by chunk when they
+            are read, only the matrix of the ocean time series is held in memory
     """
     var_name_ds = args['var_name']
     k = args['k']
@@ -48,13 +55,17 @@ def main_fitpred_OR(args):
 
     logging.info("loading the dataset")
     start_time = time.time()
-    ds_init = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds_init = load_data(file_name=file_name, var_name_ds=var_name_ds, **get_load_options(args))
     load_time = time.time() - start_time
     logging.info("load finished in " + str(load_time) + "sec")
 
     logging.info("preprocess the dataset")
     start_time = time.time()
-    ds, mask = preprocessing_ds(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path)
+    ds, mask, transforms = preprocessing_ds(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path,
+                                            **get_cache_options(args), **get_preprocessing_options(args),
+                                            return_models=True)
+    # training weeks, saved with the model
+    transforms['features'] = ds['feature'].values
     load_time = time.time() - start_time
     logging.info("preprocessing finished in " + str(load_time) + "sec")
 
@@ -68,7 +79,8 @@ def main_fitpred_OR(args):
     start_time = time.time()
     ds = predict(model=model, ds=ds, var_name_ds=var_name_ds)
     ds = robustness(model=model, ds=ds, var_name_ds=var_name_ds)
-    ds = quantiles(ds=ds, var_name_ds=var_name_ds, k=k, mask=mask, ds_init=ds_init)
+    ds = quantiles(ds=ds, var_name_ds=var_name_ds, k=k, mask=mask, ds_init=ds_init,
+                   method=args.get('quantile_method', 'exact'))
     predict_time = time.time() - start_time
     logging.info("prediction finished in " + str(predict_time) + "sec")
 
@@ -77,9 +89,9 @@ def main_fitpred_OR(args):
     plot_time = time.time() - start_time
     logging.info("plots finished in " + str(plot_time) + "sec")
 
-    # save model
-    joblib.dump(model, 'modelOR.sav')
-    logging.info("model saved in  modelOR.sav")
+    # save model, with the fitted scaler and PCA used by the prediction
+    save_bundle('modelOR.sav', model=model, mask=mask, **transforms)
+    logging.info("model bundle saved in modelOR.sav")
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 from utils.data_loader_utils import *
 from utils.prediction_utils import generate_plots, predict, quantiles, robustness
-import joblib
+from utils.model_bundle import load_bundle, has_transforms
 import time
 from download.storagehubfacility import storagehubfacility as sthubf, check_json
 
@@ -34,15 +34,15 @@ def load_model(model_id):
 
     Returns
     -------
-    model: trained sklearn GMM model
+    bundle: dict with the trained sklearn GMM model ('model') and the fitted scaler and PCA (see model_bundle)
     k: number of class
     """
     myshfo = sthubf.StorageHubFacility(operation="Download", ItemId=model_id,
                                        localFile=f'./model{model_id}.sav')
     myshfo.main()
-    model = joblib.load(f'./model{model_id}.sav')
-    k = model.n_components
-    return model, k
+    bundle = load_bundle(f'./model{model_id}.sav')
+    k = bundle['model'].n_components
+    return bundle, k
 
 
 def main_predictOR(args):
@@ -51,11 +51,20 @@ def main_predictOR(args):
     Parameters
     ----------
     args : Dictionary with:
-        file: string, dataset path
+        file: string, dataset path. With a model saved with its scaler and PCA, the dataset must cover all the weeks
+            of the training period (e.g. 12 months for a model trained on 12 months), it is checked before the
+            preprocessing
         model: string, path to trained model
         var_name: string, name var in dataset
         id_field: string, standard name of var
-        mask: string, path to mask or 'auto'
+        mask: string, path to mask or 'auto' (mask saved with the model, if any)
+        lazy_load: bool, optional, keep the dataset dask-backed and select the working domain before reading
+        quantile_method: string, optional, 'exact' (default) or 'sketch' (approximate)
+        preprocessing_cache: string, optional, directory of the preprocessing cache (disabled by default)
+        preprocessing_cache_size: int, optional, max size of the preprocessing cache in bytes (default 2 GiB)
+        preprocessing_chunk_size: int, optional, fit the scaler and an IncrementalPCA chunk by chunk of this number of
+            time series (default: full solver). The scaled and reduced matrices are computed chunk by chunk when they
+            are read, only the matrix of the ocean time series is held in memory
     """
     var_name_ds = args['var_name']
     model_path = args['model']
@@ -69,27 +78,35 @@ def main_predictOR(args):
 
     logging.info("loading the dataset")
     start_time = time.time()
-    ds_init = load_data(file_name=file_name, var_name_ds=var_name_ds)
+    ds_init = load_data(file_name=file_name, var_name_ds=var_name_ds, **get_load_options(args))
     load_time = time.time() - start_time
     logging.info("load finished in " + str(load_time) + "sec")
 
-    logging.info("preprocess the dataset")
+    logging.info("loading the model")
     start_time = time.time()
-    ds, mask = preprocessing_ds(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path)
+    bundle, k = load_model(model_id=model_path)
+    model = bundle['model']
     load_time = time.time() - start_time
-    logging.info("preprocessing finished in " + str(load_time) + "sec")
+    logging.info("model loaded in " + str(load_time) + "sec")
 
-    logging.info("starting computation")
+    logging.info("preprocess the dataset")
     start_time = time.time()
-    model, k = load_model(model_id=model_path)
-    train_time = time.time() - start_time
-    logging.info("training finished in " + str(train_time) + "sec")
+    if has_transforms(bundle):
+        # scaler and PCA of the training: transform only, no refit
+        ds, mask = preprocessing_transform(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path, bundle=bundle,
+                                           **get_preprocessing_options(args))
+    else:
+        ds, mask = preprocessing_ds(ds=ds_init, var_name_ds=var_name_ds, mask_path=mask_path,
+                                    **get_cache_options(args), **get_preprocessing_options(args))
+    load_time = time.time() - start_time
+    logging.info("preprocessing finished in " + str(load_time) + "sec")
 
     logging.info("starting predictions")
     start_time = time.time()
     ds = predict(model=model, ds=ds, var_name_ds=var_name_ds)
     ds = robustness(model=model, ds=ds, var_name_ds=var_name_ds)
-    ds = quantiles(ds=ds, var_name_ds=var_name_ds, k=k, mask=mask, ds_init=ds_init)
+    ds = quantiles(ds=ds, var_name_ds=var_name_ds, k=k, mask=mask, ds_init=ds_init,
+                   method=args.get('quantile_method', 'exact'))
     predict_time = time.time() - start_time
     logging.info("prediction finished in " + str(predict_time) + "sec")
 
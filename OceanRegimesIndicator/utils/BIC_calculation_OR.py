@@ -1,4 +1,6 @@
 # BIC calculation functions file
+import logging
+
 import xarray as xr
 import numpy as np
 
@@ -16,132 +18,8 @@ from datetime import datetime
 
 import warnings
 
-
-def mapping_corr_dist(corr_dist, start_point, grid_extent):
-    '''Remapping longitude/latitude grid using a start point. It creates a new grid from the start point 
-       where each point is separated the given correlation distance.
-
-           Parameters
-           ----------
-               corr_dist: correlation distance
-               start_point: latitude and longitude of the start point 
-               grid_extent: max and min latitude and longitude of the grid to be remapped 
-                    [min lon, max lon, min let, max lat]
-
-           Returns
-           ------
-               new_lats: new latitude vector with points separeted the correlation distance 
-               new_lons: new longitude vector with points separeted the correlation distance
-
-               '''
-
-    # angular distance d/earth's radius (km)
-    delta = corr_dist/6371
-
-    # all in radians (conversion at the end)
-    grid_extent = grid_extent*np.pi/180
-    start_point = start_point*np.pi/180
-
-    ### while loop for lat nord ###
-    max_lat = grid_extent[3]
-    lat2 = -np.pi/2
-    lat1 = start_point[1]
-    # bearing = 0 donc cos(0)=1 and sin(0)=0
-    new_lats = [lat1]
-    while lat2 < max_lat:
-        lat2 = np.arcsin(np.sin(lat1)*np.cos(delta) +
-                         np.cos(lat1)*np.sin(delta))
-        new_lats.append(lat2)
-        lat1 = lat2
-
-    ### while loop for lat sud ###
-    min_lat = grid_extent[2]
-    lat2 = np.pi/2
-    lat1 = start_point[1]
-    # bearing = pi donc cos(pi)=-1 and sin(pi)=0
-    while lat2 > min_lat:
-        lat2 = np.arcsin(np.sin(lat1)*np.cos(delta) -
-                         np.cos(lat1)*np.sin(delta))
-        new_lats.append(lat2)
-        lat1 = lat2
-
-    new_lats = np.sort(new_lats)*180/np.pi
-
-    ### while loop for lon east ###
-    max_lon = grid_extent[1]
-    lon2 = -np.pi
-    lon1 = start_point[0]
-    lat1 = start_point[1]
-    # bearing = pi/2 donc cos(pi/2)=0 and sin(pi/2)=1
-    new_lons = [lon1]
-    dlon = np.arctan2(np.sin(delta)*np.cos(lat1),
-                      np.cos(delta)-np.sin(lat1)*np.sin(lat1))
-    while lon2 < max_lon:
-        lon2 = lon1 + dlon
-        new_lons.append(lon2)
-        lon1 = lon2
-
-    ### while loop for lon west ###
-    min_lon = grid_extent[0]
-    lon2 = np.pi
-    lon1 = start_point[0]
-    lat1 = start_point[1]
-    # bearing = -pi/2 donc cos(-pi/2)=0 and sin(-pi/2)=-1
-    dlon = np.arctan2(-np.sin(delta)*np.cos(lat1),
-                      np.cos(delta)-np.sin(lat1)*np.sin(lat1))
-    while lon2 > min_lon:
-        lon2 = lon1 + dlon
-        new_lons.append(lon2)
-        lon1 = lon2
-
-    new_lons = np.sort(new_lons)*180/np.pi
-
-    return new_lats, new_lons
-
-
-def mapping_corr_time(corr_time, start_point, time_extent):
-    '''Remapping time vector using a start point. It creates a new vector from the start point 
-       where elements are separated the time correlation.
-
-           Parameters
-           ----------
-               corr_time: correlation time
-               start_point: date of the start point 
-               time_extent: max and min time of the vector to be remapped 
-                    [min time, max time]
-
-           Returns
-           ------
-               new_time: new time vector with points separeted the time correlation
-
-               '''
-
-    # we are supossing that 1 month is 30 days for using np.timedelta64
-
-    ### while loop for bigger dates ###
-    max_time = time_extent[1]
-    time2 = time_extent[0]
-    time1 = start_point[0]
-    # bearing = 0 donc cos(0)=1 and sin(0)=0
-    new_time = [time1]
-    while time2 < max_time:
-        time2 = time1 + np.timedelta64(corr_time*30, 'D')
-        new_time.append(time2)
-        time1 = time2
-
-    ### while loop for smaller dates ###
-    min_time = time_extent[0]
-    time2 = time_extent[1]
-    time1 = start_point[0]
-    # bearing = pi donc cos(pi)=-1 and sin(pi)=0
-    while time2 > min_time:
-        time2 = time1 - np.timedelta64(corr_time*30, 'D')
-        new_time.append(time2)
-        time1 = time2
-
-    new_time = np.sort(new_time)
-
-    return new_time
+from utils.sampling_grid import mapping_corr_dist_index
+from utils.BIC_search import BIC_sweep, check_cold_start, early_stopping_search
 
 
 def BIC_cal(X, k):
@@ -169,7 +47,9 @@ def BIC_cal(X, k):
     return BIC, k
 
 
-def BIC_calculation(X, corr_dist, coords_dict, feature_name, var_name, Nrun=10, NK=20):
+def BIC_calculation(X, corr_dist, coords_dict, feature_name, var_name, Nrun=10, NK=20, warm_start=False,
+                    early_stopping=False, patience=3, band=1., coarse_step=1, random_state=0,
+                    validate_warm_start=False):
     '''Calculation of BIC (Bayesian Information Criteria) for a training dataset.
 
            Parameters
@@ -182,6 +62,14 @@ def BIC_calculation(X, corr_dist, coords_dict, feature_name, var_name, Nrun=10,
                var_name: name of the variable in dataset
                Nrun: number of runs
                NK: max number of classes
+               warm_start: if True, each run is a warm-started sweep over the number of classes (see BIC_sweep)
+                    instead of NK independent fits with random initialisation. Default: False
+               validate_warm_start: if True, the warm-started sweep of the first run is compared with NK cold-start
+                    fits (see check_cold_start), to be used to validate the warm start on a new dataset. Default: False
+               random_state: seed of the warm-started sweeps and of their cold-start comparison. Default: 0
+               early_stopping: if True, the number of classes is increased only until the BIC minimum is confirmed
+                    (see early_stopping_search), BIC values of the classes not evaluated are NaN. Default: False
+               patience, band, coarse_step: early stopping parameters (see early_stopping_search)
 
            Returns
            ------
@@ -200,32 +88,47 @@ def BIC_calculation(X, corr_dist, coords_dict, feature_name, var_name, Nrun=10,
     X_unstack = X_unstack.sortby(
         [coords_dict.get('latitude'), coords_dict.get('longitude')])
 
-    # grid extent
-    grid_extent = np.array([X_unstack[coords_dict.get('longitude')].values.min(), X_unstack[coords_dict.get('longitude')].values.max(
-    ), X_unstack[coords_dict.get('latitude')].values.min(), X_unstack[coords_dict.get('latitude')].values.max()])
+    # dataset coordinates, the sampling grid of each run is given as indices into them
+    lat_values = X_unstack[coords_dict.get('latitude')].values
+    lon_values = X_unstack[coords_dict.get('longitude')].values
 
     # this is the list of arguments to iterate over, for instance nb of classes for a PCM
     class_list = np.arange(0, NK)
 
+    if warm_start and early_stopping:
+        raise ValueError('warm_start and early_stopping options can not be used together.')
+
     BIC = np.zeros((NK, Nrun))
+    X_runs = []
     for run in range(Nrun):
 
         # random fist point
-        latp = np.random.choice(
-            X_unstack[coords_dict.get('latitude')].values, 1, replace=False)
-        lonp = np.random.choice(
-            X_unstack[coords_dict.get('longitude')].values, 1, replace=False)
+        latp = np.random.choice(lat_values, 1, replace=False)
+        lonp = np.random.choice(lon_values, 1, replace=False)
         # remapping
-        new_lats, new_lons = mapping_corr_dist(
-            corr_dist=corr_dist, start_point=np.concatenate((lonp, latp)), grid_extent=grid_extent)
+        lat_index, lon_index = mapping_corr_dist_index(
+            corr_dist=corr_dist, start_point=np.concatenate((lonp, latp)), lat_values=lat_values,
+            lon_values=lon_values)
 
-        ds_run_i = X_unstack.sel({coords_dict.get('latitude'): list(
-            new_lats), coords_dict.get('longitude'): list(new_lons)}, method='nearest')
+        ds_run_i = X_unstack.isel({coords_dict.get('latitude'): lat_index, coords_dict.get('longitude'): lon_index})
         X_run_i = ds_run_i.stack({'sampling': ('lat', 'lon')})
         X_run_i = X_run_i.transpose("sampling", feature_name)
         # no NaNs
         X_run_i = X_run_i.where(~X_run_i.isnull(), drop=True).to_dataset()
 
+        if early_stopping:
+            X_runs.append(X_run_i[var_name])
+            continue
+
+        if warm_start:
+            BIC[:, run], n_iter = BIC_sweep(X_run_i[var_name].values, NK, random_state=random_state)
+            logging.info(f"warm-started BIC sweep, run {run}: EM iterations per number of classes {n_iter}, "
+                         f"total {n_iter.sum()}")
+            if validate_warm_start and run == 0:
+                # iterations saved and BIC tolerance, against cold starts on the dataset of the first run
+                check_cold_start(X_run_i[var_name].values, BIC[:, run], n_iter, random_state=random_state)
+            continue
+
         # serial computation of BIC
         results = []
         for k in class_list:
@@ -235,7 +138,11 @@ def BIC_calculation(X, corr_dist, coords_dict, feature_name, var_name, Nrun=10,
         results.sort(key=lambda x: x[1])
         BIC[:, run] = np.array([i[0] for i in results])
 
-    BIC_min = np.argmin(np.mean(BIC, axis=1))+1
+    if early_stopping:
+        BIC = early_stopping_search(lambda k: [BIC_cal(X_run, k)[0] for X_run in X_runs], NK, Nrun,
+                                    patience=patience, band=band, coarse_step=coarse_step)
+
+    BIC_min = np.nanargmin(np.mean(BIC, axis=1))+1
 
     return BIC, BIC_min
 
@@ -255,7 +162,7 @@ def plot_BIC(BIC, NK):
                '''
     fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(10, 5), dpi=90)
     BICmean = np.mean(BIC, axis=1)
-    bic_min = np.argmin(BICmean)+1
+    bic_min = np.nanargmin(BICmean)+1
     BICstd = np.std(BIC, axis=1)
     normBICmean = (BICmean-np.mean(BICmean))/np.std(BICmean)
     #normBICstd = np.std(normBICmean)
@@ -0,0 +1,176 @@
+# Warm-started and early-stopped searches over the number of classes (shared by OceanPatterns and OceanRegimes BIC
+# calculation)
+import logging
+import warnings
+
+import numpy as np
+from sklearn import mixture
+
+
+def split_component(gmm, X):
+    ''' Initial parameters for K+1 classes, obtained from a fitted K classes model by splitting the component with the
+        largest contribution to the negative log-likelihood along its principal axis
+
+            Parameters
+            ----------
+                gmm: fitted GaussianMixture (covariance_type='full')
+                X: dataset after preprocessing
+
+            Returns
+            ------
+                weights, means, precisions: initial parameters for a GaussianMixture with one more component
+
+            '''
+
+    # share of the negative log-likelihood of each sample attributed to each component
+    nll_contribution = (gmm.predict_proba(X) * -gmm.score_samples(X)[:, np.newaxis]).sum(axis=0)
+    j = np.argmax(nll_contribution)
+
+    eigval, eigvec = np.linalg.eigh(gmm.covariances_[j])
+    shift = 0.5 * np.sqrt(eigval[-1]) * eigvec[:, -1]
+
+    weights = np.append(gmm.weights_, gmm.weights_[j] / 2)
+    weights[j] = weights[j] / 2
+    means = np.vstack([gmm.means_, gmm.means_[j] + shift])
+    means[j] = gmm.means_[j] - shift
+    precisions = np.concatenate([gmm.precisions_, gmm.precisions_[j][np.newaxis]])
+
+    return weights, means, precisions
+
+
+def BIC_sweep(X, NK, random_state=None, reg_covar=1e-6):
+    ''' Warm-started sweep over the number of classes: the fit for k+1 classes is initialised from the converged k
+        classes solution (see split_component), so each fit only needs a few EM iterations. The 1 class solution is
+        computed in closed form from the mean and covariance of the dataset.
+
+            Parameters
+            ----------
+                X: dataset after preprocessing
+                NK: max number of classes
+                random_state: seed given to GaussianMixture. Default: None
+                reg_covar: regularisation added to the covariances. Default: 1e-6
+
+            Returns
+            ------
+                BIC: vector with BIC value for each number of classes (1 to NK)
+                n_iter: vector with the number of EM iterations of each fit
+
+            '''
+
+    X = np.asarray(X)
+    n_features = X.shape[1]
+
+    # sufficient statistics of the dataset, computed once for the whole sweep
+    cov = np.atleast_2d(np.cov(X, rowvar=False, bias=True)) + reg_covar * np.eye(n_features)
+    weights = np.ones(1)
+    means = X.mean(axis=0)[np.newaxis]
+    precisions = np.linalg.inv(cov)[np.newaxis]
+
+    BIC = np.zeros(NK)
+    n_iter = np.zeros(NK, dtype=int)
+    gmm = None
+    for k in range(NK):
+        if gmm is not None:
+            weights, means, precisions = split_component(gmm, X)
+        gmm = mixture.GaussianMixture(n_components=k + 1, covariance_type='full', reg_covar=reg_covar,
+                                      weights_init=weights, means_init=means, precisions_init=precisions,
+                                      random_state=random_state)
+        gmm.fit(X)
+        BIC[k] = gmm.bic(X)
+        n_iter[k] = gmm.n_iter_
+
+    return BIC, n_iter
+
+
+def check_cold_start(X, BIC, n_iter, random_state=None, reg_covar=1e-6, rtol=0.01):
+    ''' Comparison of a warm-started sweep (see BIC_sweep) with independent cold-start fits on the same dataset: logs
+        the EM iterations saved by the warm start and warns when the warm-started BIC curve is not within rtol of the
+        cold-start curve (the iterations of the k-means initialisation of the cold starts are not counted).
+
+            Parameters
+            ----------
+                X: dataset after preprocessing
+                BIC: BIC values of the warm-started sweep (1 to NK classes)
+                n_iter: EM iterations of the warm-started sweep
+                random_state: seed given to GaussianMixture. Default: None
+                reg_covar: regularisation added to the covariances. Default: 1e-6
+                rtol: tolerance relative to the cold-start BIC. Default: 0.01
+
+            Returns
+            ------
+                iter_saved: number of EM iterations saved by the warm start
+                within_tol: True if the warm-started BIC curve is within rtol of the cold-start curve
+
+            '''
+
+    X = np.asarray(X)
+    BIC_cold = np.zeros(len(BIC))
+    n_iter_cold = np.zeros(len(BIC), dtype=int)
+    for k in range(len(BIC)):
+        gmm = mixture.GaussianMixture(n_components=k + 1, covariance_type='full', reg_covar=reg_covar,
+                                      random_state=random_state)
+        gmm.fit(X)
+        BIC_cold[k] = gmm.bic(X)
+        n_iter_cold[k] = gmm.n_iter_
+
+    iter_saved = int(n_iter_cold.sum() - np.sum(n_iter))
+    logging.info(f"warm-started BIC sweep: {np.sum(n_iter)} EM iterations against {n_iter_cold.sum()} for cold "
+                 f"starts ({iter_saved} saved)")
+    outside = np.flatnonzero(np.abs(BIC - BIC_cold) > rtol * np.abs(BIC_cold))
+    if outside.size:
+        warnings.warn(f"Warm-started BIC differs from the cold-start BIC by more than {rtol:.0%} for "
+                      f"{list(outside + 1)} classes")
+    return iter_saved, outside.size == 0
+
+
+def early_stopping_search(eval_k, NK, Nrun, patience=3, band=1., coarse_step=1):
+    ''' Adaptive search of the BIC minimum over the number of classes. The number of classes is increased until the
+        minimum of the mean BIC is confirmed: the runs share their dataset for all the numbers of classes, so the
+        BIC of k classes is compared with the minimum through the per-run differences BIC[k] - BIC[k_min], and the
+        search stops when, for patience consecutive evaluated values, the mean difference is larger than band
+        standard deviations of the differences. With coarse_step > 1 the search is first done on a coarse grid and
+        then refined around the coarse minimum.
+
+            Parameters
+            ----------
+                eval_k: function returning the BIC values of all the runs (vector of size Nrun) for k + 1 classes
+                NK: max number of classes
+                Nrun: number of runs
+                patience: number of consecutive evaluated values significantly above the minimum needed to stop.
+                    Default: 3
+                band: significance threshold in standard deviations of the per-run differences. Default: 1
+                coarse_step: step of the coarse grid. Default: 1, no coarse grid
+
+            Returns
+            ------
+                BIC: matrix with BIC value for each number of classes and run, NaN for the values not evaluated
+
+            '''
+
+    BIC = np.full((NK, Nrun), np.nan)
+
+    def evaluate(k_list):
+        k_min = None
+        count = 0
+        for k in k_list:
+            if np.isnan(BIC[k, 0]):
+                BIC[k, :] = eval_k(k)
+            if k_min is None or np.mean(BIC[k]) < np.mean(BIC[k_min]):
+                k_min = k
+                count = 0
+                continue
+            # paired differences: the variability shared by the runs cancels out
+            diff = BIC[k] - BIC[k_min]
+            if np.mean(diff) > band * np.std(diff):
+                count += 1
+                if count >= patience:
+                    break
+            else:
+                count = 0
+        return k_min
+
+    k_min = evaluate(range(0, NK, coarse_step))
+    if coarse_step > 1:
+        evaluate(range(max(k_min - coarse_step + 1, 0), min(k_min + coarse_step, NK)))
+
+    return BIC
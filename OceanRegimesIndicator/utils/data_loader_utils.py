@@ -2,25 +2,42 @@ import numpy as np
 import xarray as xr
 import logging
 from utils.preprocessing_OR import *
+from utils import preprocessing_cache
+from utils.weekly_mean import week_codes
 
+# parameters of preprocessing_ds, part of the preprocessing cache key
+PREPROCESSING_PARAMS = {'scaler_name': 'StandardScaler', 'n_components': 0.99, 'interp': False}
 
-def load_data(file_name, var_name_ds):
+
+def load_data(file_name, var_name_ds, lazy=False, box=None, depth_range=None, memory_budget='128MiB'):
     """
     Load dataset into a Xarray dataset
 
     Parameters
     ----------
     var_name_ds : name of variable in dataset
-    file_name : Path to the NetCDF dataset
+    file_name : Path (or glob pattern, or list of paths) to the NetCDF dataset
+    lazy : if True the dataset is kept dask-backed and only the selected variable/domain is read when needed,
+    otherwise the whole selection is loaded in memory (default)
+    box : optional working domain [lon_min, lat_min, lon_max, lat_max] selected before reading the data
+    depth_range : optional depth range [depth_min, depth_max] (positive values) selected before reading the data
+    memory_budget : target size of each dask chunk in lazy mode (e.g. '128MiB')
 
     Returns
     -------
     ds: Xarray dataset
     """
     logging.info(f"dataset to load: {file_name}")
-    ds = xr.open_mfdataset(file_name).load()
+    # open lazily: nothing is read from disk until the variable and domain are selected
+    ds = xr.open_mfdataset(file_name, chunks={})
     # select var
     ds = ds[[var_name_ds]]
+    ds = select_working_domain(ds, box=box, depth_range=depth_range)
+    if lazy:
+        ds = chunk_dataset(ds, memory_budget=memory_budget)
+        logging.info(f"lazy loading, dataset chunks: {dict(ds.chunks)}")
+    else:
+        ds = ds.load()
     # some format
     if not np.issubdtype(ds.indexes['time'].dtype, np.datetime64):
         logging.info("casting time to datetimeindex")
@@ -29,31 +46,277 @@ def load_data(file_name, var_name_ds):
     return ds
 
 
-def preprocessing_ds(ds, var_name_ds, mask_path):
+def get_coords_dict(ds):
+    """
+    create a dict of coordinates to mapping each dimension of the dataset
+    Parameters
+    ----------
+    ds : Xarray dataset
+
+    Returns
+    -------
+    coords_dict: dict mapping each dimension of the dataset
+    """
+    coords_dict = {}
+    for c in list(ds.coords.keys()):
+        axis_at = ds[c].attrs.get('axis')
+        if axis_at == 'Y':
+            coords_dict.update({'latitude': c})
+        if axis_at == 'X':
+            coords_dict.update({'longitude': c})
+        if axis_at == 'T':
+            coords_dict.update({'time': c})
+        if axis_at == 'Z':
+            coords_dict.update({'depth': c})
+    return coords_dict
+
+
+def select_working_domain(ds, box=None, depth_range=None):
+    """
+    Select the working domain using the 1D coordinates only, so that no data is read from disk
+
+    Parameters
+    ----------
+    ds : Xarray dataset
+    box : list [lon_min, lat_min, lon_max, lat_max] or None
+    depth_range : list [depth_min, depth_max] (positive values) or None
+
+    Returns
+    -------
+    ds: Xarray dataset restricted to the working domain
+    """
+    coords_dict = get_coords_dict(ds)
+    indexers = {}
+    if box is not None:
+        for coord, vmin, vmax in [('longitude', box[0], box[2]), ('latitude', box[1], box[3])]:
+            if coord in coords_dict:
+                values = ds[coords_dict[coord]].values
+                indexers[coords_dict[coord]] = np.flatnonzero((values >= vmin) & (values <= vmax))
+    if depth_range is not None and 'depth' in coords_dict:
+        values = np.abs(ds[coords_dict['depth']].values)
+        indexers[coords_dict['depth']] = np.flatnonzero((values >= min(depth_range)) & (values <= max(depth_range)))
+    for dim, index in indexers.items():
+        if index.size == 0:
+            raise ValueError(f"working domain selection is empty along {dim}")
+    return ds.isel(indexers)
+
+
+def chunk_dataset(ds, memory_budget='128MiB'):
+    """
+    Rechunk the dataset with chunk sizes computed automatically from a memory budget. The time axis is kept in a
+    single chunk because the weekly mean and the time series classification need complete time series.
+
+    Parameters
+    ----------
+    ds : Xarray dataset (dask-backed)
+    memory_budget : target size of each chunk (e.g. '128MiB')
+
+    Returns
+    -------
+    ds: rechunked Xarray dataset
+    """
+    import dask
+
+    coords_dict = get_coords_dict(ds)
+    chunks = {dim: 'auto' for dim in ds.dims}
+    if coords_dict.get('time') in ds.dims:
+        chunks[coords_dict['time']] = -1
+    with dask.config.set({'array.chunk-size': memory_budget}):
+        ds = ds.chunk(chunks)
+    return ds
+
+
+def get_load_options(args):
+    """
+    Build the load_data keyword arguments from the method arguments. Lazy loading is enabled with 'lazy_load': True,
+    in that case the working domain is also selected before reading the data.
+
+    Parameters
+    ----------
+    args : Dictionary of the method arguments (optional keys: lazy_load, memory_budget, working_domain)
+
+    Returns
+    -------
+    dict of keyword arguments for load_data
+    """
+    if not args.get('lazy_load', False):
+        return {}
+    working_domain = args.get('working_domain', {})
+    options = {'lazy': True, 'memory_budget': args.get('memory_budget', '128MiB')}
+    if working_domain.get('box'):
+        options['box'] = working_domain['box'][0]
+    if working_domain.get('depth_layers'):
+        options['depth_range'] = working_domain['depth_layers'][0]
+    return options
+
+
+def get_cache_options(args):
     """
-    5 steps of the preprocessing, detailed code in the preprocessing_OR.py script:
+    Build the preprocessing_ds cache keyword arguments from the method arguments. The cache is enabled with
+    'preprocessing_cache': path of the cache directory.
+
+    Parameters
+    ----------
+    args : Dictionary of the method arguments (optional keys: preprocessing_cache, preprocessing_cache_size)
+
+    Returns
+    -------
+    dict of keyword arguments for preprocessing_ds
+    """
+    if not args.get('preprocessing_cache'):
+        return {}
+    params = PREPROCESSING_PARAMS
+    if args.get('preprocessing_chunk_size'):
+        params = dict(PREPROCESSING_PARAMS, chunk_size=args['preprocessing_chunk_size'])
+    key = preprocessing_cache.cache_key(file_name=args['file'], var_name_ds=args['var_name'], mask_path=args['mask'],
+                                        working_domain=args.get('working_domain'), params=params,
+                                        load_options=get_load_options(args), cache_dir=args['preprocessing_cache'])
+    return {'cache_dir': args['preprocessing_cache'], 'cache_key': key,
+            'cache_max_size': args.get('preprocessing_cache_size', 2 * 1024 ** 3)}
+
+
+def get_preprocessing_options(args):
+    """
+    Build the preprocessing_ds keyword arguments from the method arguments. The streaming scaler and PCA are enabled
+    with 'preprocessing_chunk_size': number of time series per chunk.
+
+    Parameters
+    ----------
+    args : Dictionary of the method arguments (optional key: preprocessing_chunk_size)
+
+    Returns
+    -------
+    dict of keyword arguments for preprocessing_ds
+    """
+    if not args.get('preprocessing_chunk_size'):
+        return {}
+    return {'chunk_size': int(args['preprocessing_chunk_size'])}
+
+
+def preprocessing_ds(ds, var_name_ds, mask_path, cache_dir=None, cache_key=None, cache_max_size=2 * 1024 ** 3,
+                     chunk_size=None, return_models=False):
+    """
+    4 steps of the preprocessing, detailed code in the preprocessing_OR.py script:
     - Weekly mean
-    - Reduce latitude and longitude to sampling dim
-    - Delete all NaN values (using a mask that can be given as an input)
+    - Delete all NaN values (using a mask that can be given as an input): the time series of the ocean points are
+      gathered in the sampling dim
     - Scaler: default is scikit-learn StandardScaler
     - Principal Component Analysis (PCA): n_components default value is 0.99
+    With a cache directory and key (see get_cache_options), the preprocessed dataset, the mask and the fitted scaler
+    and PCA are read from the cache if they were already computed, and stored in it otherwise.
     Parameters
     ----------
     ds : input dataset (Xarray)
     var_name_ds : name of variable in dataset
     mask_path : path to mask, default is auto and the mask will be generated automatically
+    cache_dir : optional preprocessing cache directory
+    cache_key : key of the preprocessing in the cache (see preprocessing_cache.cache_key)
+    cache_max_size : max size of the cache in bytes, least recently used entries are evicted
+    chunk_size : optional number of time series per chunk: the scaler (partial_fit) and an IncrementalPCA are fitted
+        chunk by chunk (see get_preprocessing_options), default is the full solver on the whole matrix
+    return_models : if True, the dict with the fitted 'scaler' and 'pca' is also returned (to be saved with the model)
 
     Returns
     -------
-
+    x: preprocessed dataset (stacked on the sampling dimension)
+    mask: mask used to delete NaNs
+    models: dict with the fitted 'scaler' and 'pca' (only if return_models is True)
     """
+    if cache_dir is not None:
+        entry = preprocessing_cache.load_entry(cache_dir, cache_key)
+        if entry is not None:
+            logging.info(f"preprocessed dataset read from cache entry {cache_key}")
+            x, mask, models = entry
+            if return_models:
+                return x, mask, models
+            return x, mask
     x = OR_weekly_mean(ds=ds, var_name=var_name_ds)
-    x = OR_reduce_dims(X=x)
+    # the ocean points are gathered from the grid in OR_delate_NaNs: no stacking of the whole grid (OR_reduce_dims)
     try:
-        x, mask = OR_delate_NaNs(X=x, var_name=var_name_ds, mask_path=mask_path)
+        x, mask = OR_delate_NaNs(X=x, var_name=var_name_ds, mask_path=mask_path,
+                                 interp=PREPROCESSING_PARAMS['interp'])
     except FileNotFoundError as e:
         logging.exception("no mask was found, generating one: " + str(e.filename))
-        x, mask = OR_delate_NaNs(X=x, var_name=var_name_ds, mask_path='auto')
-    x = OR_scaler(X=x, var_name=var_name_ds)
-    x = OR_apply_PCA(X=x, var_name=var_name_ds)
-    return x, mask
\ No newline at end of file
+        x, mask = OR_delate_NaNs(X=x, var_name=var_name_ds, mask_path='auto', interp=PREPROCESSING_PARAMS['interp'])
+    x, scaler = OR_scaler(X=x, var_name=var_name_ds, scaler_name=PREPROCESSING_PARAMS['scaler_name'],
+                          return_model=True, chunk_size=chunk_size)
+    x, pca = OR_apply_PCA(X=x, var_name=var_name_ds, n_components=PREPROCESSING_PARAMS['n_components'],
+                          return_model=True, chunk_size=chunk_size)
+    if cache_dir is not None:
+        preprocessing_cache.save_entry(cache_dir, cache_key, x, mask, {'scaler': scaler, 'pca': pca},
+                                       max_size=cache_max_size)
+    if return_models:
+        return x, mask, {'scaler': scaler, 'pca': pca}
+    return x, mask
+
+
+def check_prediction_weeks(ds, bundle):
+    """
+    Check that the prediction period covers all the weeks the model was trained on: the PCA of the training projects
+    one value per training week, so a prediction dataset shorter than the training period (e.g. 6 months of data for
+    a model trained on 12 months) can not be transformed. Only the time coordinate is read, the check can be done
+    right after loading the dataset, before any computation.
+    Parameters
+    ----------
+    ds : input dataset (Xarray)
+    bundle : model bundle (see model_bundle.load_bundle), nothing is checked if it has no training weeks
+
+    Raises
+    ------
+    ValueError if weeks of the training are missing in the prediction period
+    """
+    features = bundle.get('features')
+    if features is None:
+        return
+    time_var = get_coords_dict(ds).get('time')
+    if time_var is None:
+        raise ValueError('Time variable could not be detected in the prediction dataset.')
+    _, weeks = week_codes(ds[time_var].values)
+    missing = sorted(set(np.asarray(features).tolist()) - set(weeks.tolist()))
+    if missing:
+        raise ValueError(f"the prediction period covers {len(weeks)} weeks but the model was trained on "
+                         f"{len(features)} weeks, weeks {missing} are missing: the prediction dataset must cover all "
+                         f"the weeks of the training period")
+
+
+def preprocessing_transform(ds, var_name_ds, mask_path, bundle, chunk_size=None):
+    """
+    Preprocessing of a prediction dataset with the scaler and the PCA fitted with the model (see model_bundle): the
+    same steps as preprocessing_ds, but the scaler and the PCA are only applied (transform), so the dataset is
+    projected in the feature space of the training without any refit. The preprocessing cache is not used, its
+    entries contain refitted transforms. The prediction period must cover all the weeks of the training (see
+    check_prediction_weeks), it is checked first, before any computation.
+    Parameters
+    ----------
+    ds : input dataset (Xarray)
+    var_name_ds : name of variable in dataset
+    mask_path : path to mask, 'auto' to use the mask saved with the model (a new mask is generated if the saved one
+        does not match the prediction grid, a mask given by path must match it)
+    bundle : model bundle with the fitted 'scaler' and 'pca' (see model_bundle.load_bundle)
+    chunk_size : optional number of time series per chunk for the transforms
+
+    Returns
+    -------
+    x: preprocessed dataset (stacked on the sampling dimension)
+    mask: mask used to delete NaNs
+    """
+    check_prediction_weeks(ds, bundle)
+    x = OR_weekly_mean(ds=ds, var_name=var_name_ds)
+    features = bundle.get('features')
+    if features is not None:
+        x = x.sel(feature=features)
+    saved_mask = 'auto' in mask_path and bundle.get('mask') is not None
+    mask = bundle['mask'] if saved_mask else mask_path
+    try:
+        x, mask = OR_delate_NaNs(X=x, var_name=var_name_ds, mask_path=mask, interp=PREPROCESSING_PARAMS['interp'])
+    except ValueError as e:
+        # a mask given by the user is not replaced: only the mask saved with the model can fall back
+        if not saved_mask:
+            raise
+        logging.warning("the mask saved with the model does not match the prediction grid, generating one: " + str(e))
+        x, mask = OR_delate_NaNs(X=x, var_name=var_name_ds, mask_path='auto', interp=PREPROCESSING_PARAMS['interp'])
+    if x.sizes['feature'] != bundle['scaler'].n_features_in_:
+        raise ValueError(f"the prediction dataset has {x.sizes['feature']} weeks after preprocessing, the model "
+                         f"was trained with {bundle['scaler'].n_features_in_}")
+    x = OR_transform(X=x, var_name=var_name_ds, scaler=bundle['scaler'], pca=bundle['pca'], chunk_size=chunk_size)
+    return x, mask
@@ -0,0 +1,159 @@
+# Grouped quantiles functions file (shared by OceanPatterns and OceanRegimes quantiles)
+import warnings
+
+import numpy as np
+
+
+class QuantileSketch:
+    '''Mergeable quantile sketch of several classes and features, with logarithmic buckets (DDSketch-like). Values
+       are counted in buckets [gamma^(i-1), gamma^i] (and their negative), so the memory does not depend on the
+       number of samples and two sketches are merged by adding their counts.
+
+       Error bound: for values with magnitude in [min_value, max_value], the returned quantile x' of the true
+       quantile x verifies |x' - x| <= relative_accuracy * |x|. Values with magnitude below min_value are counted as
+       0 (absolute error < min_value), values above max_value are counted in the last bucket.
+
+       Memory: n_classes * n_features * (2 * n_buckets + 1) counts, with
+       n_buckets ~ log(max_value / min_value) / log(gamma) (~1400 buckets with the default parameters)
+
+           Parameters
+           ----------
+               n_classes: number of classes
+               n_features: number of features (depth levels, weeks...)
+               relative_accuracy: relative error bound. Default: 0.01
+               min_value: smallest magnitude distinguished from 0. Default: 1e-6
+               max_value: biggest magnitude with the relative error bound. Default: 1e6
+
+               '''
+
+    def __init__(self, n_classes, n_features, relative_accuracy=0.01, min_value=1e-6, max_value=1e6):
+        self.n_classes = n_classes
+        self.n_features = n_features
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.offset = int(np.ceil(np.log(min_value) / self.log_gamma))
+        n_buckets = int(np.ceil(np.log(max_value) / self.log_gamma)) - self.offset + 1
+        self.positive = np.zeros((n_classes, n_features, n_buckets), dtype=np.int64)
+        self.negative = np.zeros((n_classes, n_features, n_buckets), dtype=np.int64)
+        self.zero = np.zeros((n_classes, n_features), dtype=np.int64)
+
+    def update(self, values, labels):
+        '''Add samples to the sketch.
+
+           Parameters
+           ----------
+               values: array (n_samples, n_features), NaNs are ignored
+               labels: class of each sample (n_samples), samples with a NaN or out of range label are ignored
+
+               '''
+
+        values = np.asarray(values, dtype=float)
+        labels = np.asarray(labels, dtype=float)
+        groups = np.where(np.isfinite(labels), labels, -1).astype(int)[:, np.newaxis] * self.n_features \
+            + np.arange(self.n_features)
+        valid = ~np.isnan(values) & (labels[:, np.newaxis] >= 0) & (labels[:, np.newaxis] < self.n_classes)
+        values = values[valid]
+        groups = groups[valid]
+
+        magnitude = np.abs(values)
+        small = magnitude < self.min_value
+        self.zero += np.bincount(groups[small], minlength=self.zero.size).reshape(self.zero.shape)
+
+        n_buckets = self.positive.shape[-1]
+        index = np.ceil(np.log(np.maximum(magnitude, self.min_value)) / self.log_gamma).astype(int) - self.offset
+        index = groups * n_buckets + np.clip(index, 0, n_buckets - 1)
+        for store, sign in ((self.positive, values > 0), (self.negative, values < 0)):
+            selection = sign & ~small
+            store += np.bincount(index[selection], minlength=store.size).reshape(store.shape)
+
+    def merge(self, other):
+        '''Add the counts of another sketch with the same parameters.
+
+           Parameters
+           ----------
+               other: QuantileSketch
+
+               '''
+
+        if self.positive.shape != other.positive.shape or self.gamma != other.gamma:
+            raise ValueError('Only sketches with the same parameters can be merged.')
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+
+    def quantiles(self, q):
+        '''Quantiles of each class and feature.
+
+           Parameters
+           ----------
+               q: list of quantiles (between 0 and 1)
+
+           Returns
+           ------
+               quantiles: array (n_classes, len(q), n_features), NaN for the classes without samples
+
+               '''
+
+        n_buckets = self.positive.shape[-1]
+        # representative value of each bucket: relative error below relative_accuracy in the whole bucket
+        bucket_values = 2 * self.gamma ** (np.arange(n_buckets) + self.offset) / (self.gamma + 1)
+        values = np.concatenate([-bucket_values[::-1], [0.], bucket_values])
+        counts = np.concatenate([self.negative[..., ::-1], self.zero[..., np.newaxis], self.positive], axis=-1)
+        cumulative = np.cumsum(counts, axis=-1)
+        total = cumulative[..., -1]
+
+        result = np.full((self.n_classes, len(q), self.n_features), np.nan)
+        for iq, quantile in enumerate(q):
+            rank = quantile * (total - 1)
+            index = np.argmax(cumulative > rank[..., np.newaxis], axis=-1)
+            result[:, iq, :] = np.where(total > 0, values[index], np.nan)
+        return result
+
+
+def grouped_quantiles(values, labels, q, n_classes, method='exact', **sketch_kwargs):
+    '''Quantiles of the samples of each class. Samples are sorted by class once (argsort) and split in contiguous
+       slices, instead of a masked copy of the whole dataset for each class.
+
+           Parameters
+           ----------
+               values: array (n_samples, n_features)
+               labels: class of each sample (n_samples), samples with a NaN or out of range label are ignored
+               q: list of quantiles (between 0 and 1)
+               n_classes: number of classes
+               method: 'exact' (same result as xarray quantile, NaNs skipped) or 'sketch' (approximate, see
+                    QuantileSketch). Default: 'exact'
+               sketch_kwargs: QuantileSketch parameters (relative_accuracy, min_value, max_value)
+
+           Returns
+           ------
+               quantiles: array (n_classes, len(q), n_features), NaN for the classes without samples
+
+               '''
+
+    values = np.asarray(values, dtype=float)
+    labels = np.asarray(labels, dtype=float)
+    if method == 'sketch':
+        sketch = QuantileSketch(n_classes, values.shape[1], **sketch_kwargs)
+        sketch.update(values, labels)
+        return sketch.quantiles(q)
+    elif method != 'exact':
+        raise ValueError('method is not valid. Please, chose between these options: "exact" or "sketch".')
+
+    valid = np.isfinite(labels) & (labels >= 0) & (labels < n_classes)
+    labels = labels[valid].astype(int)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(n_classes + 1))
+    sorted_values = values[valid][order]
+
+    result = np.full((n_classes, len(q), values.shape[1]), np.nan)
+    with warnings.catch_warnings():
+        # features with only NaNs in a class
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for yi in range(n_classes):
+            if bounds[yi + 1] > bounds[yi]:
+                result[yi] = np.nanquantile(sorted_values[bounds[yi]:bounds[yi + 1]], q, axis=0)
+    return result
@@ -0,0 +1,54 @@
+import logging
+
+import joblib
+
+# version of the model bundle format, saved in the bundle
+BUNDLE_VERSION = 1
+
+
+def save_bundle(path, model, scaler, pca, mask, features=None):
+    """
+    Save the trained GMM with everything needed to preprocess a new dataset in the same feature space, so the
+    prediction only applies the fitted transforms (no refit of the scaler and PCA)
+
+    Parameters
+    ----------
+    path : output file (joblib)
+    model : trained sklearn GMM
+    scaler : fitted scaler
+    pca : fitted PCA
+    mask : mask used to delete NaNs (Xarray dataset)
+    features : weeks (feature coordinate) of the training dataset
+    """
+    bundle = {'version': BUNDLE_VERSION, 'model': model, 'scaler': scaler, 'pca': pca, 'mask': mask,
+              'features': features}
+    joblib.dump(bundle, path)
+
+
+def load_bundle(path):
+    """
+    Load a model saved with save_bundle, or a GMM saved alone (previous format)
+
+    Parameters
+    ----------
+    path : model file (joblib)
+
+    Returns
+    -------
+    bundle: dict with 'model' and, for a bundle, the fitted 'scaler', 'pca', the 'mask' and the 'features' of the
+        training (None for a GMM saved alone)
+    """
+    content = joblib.load(path)
+    if isinstance(content, dict) and 'version' in content:
+        if content['version'] > BUNDLE_VERSION:
+            raise ValueError(f"Model bundle version {content['version']} is not supported (max {BUNDLE_VERSION})")
+        return content
+    logging.warning(f"{path} contains only the GMM: the scaler and the PCA will be fitted on the prediction dataset")
+    return {'version': 0, 'model': content, 'scaler': None, 'pca': None, 'mask': None, 'features': None}
+
+
+def has_transforms(bundle):
+    """
+    True if the bundle contains the fitted scaler and PCA
+    """
+    return bundle.get('scaler') is not None and bundle.get('pca') is not None
@@ -0,0 +1,104 @@
+# Compact ocean-point index functions file (valid cells of the (latitude, longitude) grid of the mask)
+import numpy as np
+
+
+def ocean_index(valid):
+    '''Flat index of the valid cells of a grid
+
+           Parameters
+           ----------
+               valid: boolean array (latitude, longitude)
+
+           Returns
+           ------
+               index: sorted flat indices (row major) of the True cells
+
+               '''
+
+    return np.flatnonzero(np.asarray(valid, dtype=bool).ravel())
+
+
+def gather(values, index):
+    '''Time series of the cells of index, without stacking the whole grid
+
+           Parameters
+           ----------
+               values: array (feature, latitude, longitude)
+               index: flat indices of the cells (see ocean_index)
+
+           Returns
+           ------
+               X: array (n_cells, feature)
+
+               '''
+
+    values = np.asarray(values)
+    flat = values.reshape(values.shape[0], -1)
+    return np.ascontiguousarray(np.take(flat, index, axis=1).T)
+
+
+def grid_coords(lat_values, lon_values, index):
+    '''Latitude and longitude of the cells of index
+
+           Parameters
+           ----------
+               lat_values: latitude values of the grid
+               lon_values: longitude values of the grid
+               index: flat indices of the cells (see ocean_index)
+
+           Returns
+           ------
+               lat: latitude of each cell
+               lon: longitude of each cell
+
+               '''
+
+    lat_index, lon_index = np.divmod(index, len(lon_values))
+    return np.asarray(lat_values)[lat_index], np.asarray(lon_values)[lon_index]
+
+
+def scatter(values, index, shape):
+    '''Grid of the values of the cells of index, allocated once and filled with direct integer indexing
+
+           Parameters
+           ----------
+               values: array (n_cells, ...)
+               index: flat indices of the cells (see ocean_index)
+               shape: (latitude, longitude) shape of the grid
+
+           Returns
+           ------
+               grid: array (..., latitude, longitude), NaN outside the cells of index (integer values are converted
+                     to float)
+
+               '''
+
+    values = np.asarray(values)
+    grid = np.full((shape[0] * shape[1],) + values.shape[1:], np.nan,
+                   dtype=np.result_type(values.dtype, np.float32))
+    grid[index] = values
+    grid = grid.reshape(tuple(shape) + values.shape[1:])
+    return np.ascontiguousarray(np.moveaxis(grid, (0, 1), (-2, -1)))
+
+
+def lazy_scatter(values, index, shape):
+    '''Dask array of the scatter of values: the grid is only allocated when it is computed (plot, NetCDF writer)
+
+           Parameters
+           ----------
+               values: array (n_cells, ...)
+               index: flat indices of the cells (see ocean_index)
+               shape: (latitude, longitude) shape of the grid
+
+           Returns
+           ------
+               grid: dask array (..., latitude, longitude)
+
+               '''
+
+    import dask
+    import dask.array as da
+
+    values = np.asarray(values)
+    return da.from_delayed(dask.delayed(scatter)(values, index, shape), values.shape[1:] + tuple(shape),
+                           dtype=np.result_type(values.dtype, np.float32))
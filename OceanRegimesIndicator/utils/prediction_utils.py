@@ -2,6 +2,7 @@ import logging
 
 from utils.preprocessing_OR import OR_unstack_dataset
 from utils.Plotter_OR import Plotter_OR
+from utils.grouped_quantiles import grouped_quantiles
 import numpy as np
 import matplotlib.pyplot as plt
 import xarray as xr
@@ -163,7 +164,7 @@ def robustness(model, ds, var_name_ds):
     return ds
 
 
-def quantiles(ds, var_name_ds, k, ds_init, mask):
+def quantiles(ds, var_name_ds, k, ds_init, mask, method='exact'):
     """
     compute quantiles and unstack dataset
     Parameters
@@ -173,19 +174,16 @@ def quantiles(ds, var_name_ds, k, ds_init, mask):
     k : number of class
     ds_init : initial dataset
     mask : mask used for preprocessing
+    method : 'exact' or 'sketch' (approximate), see grouped_quantiles
 
     Returns
     -------
     unstacked dataset with quantiles, Xarray dataset
     """
     q = [0.05, 0.5, 0.95]
-    k_values = np.unique(ds['GMM_labels'].values)
-    nan_matrix = np.empty((k, np.size(q), np.size(ds.feature)))
-    nan_matrix[:] = np.NaN
-    m_quantiles = xr.DataArray(nan_matrix, dims=['k', 'quantile', 'feature'])
-    for yi in range(k):
-        if yi in k_values:
-            m_quantiles[yi] = ds[var_name_ds].where(ds['GMM_labels'] == yi, drop=True).quantile(q, dim='sampling')
+    # time series are sorted by class once instead of a masked copy of the dataset for each class
+    m_quantiles = grouped_quantiles(ds[var_name_ds].transpose('sampling', 'feature').values,
+                                    ds['GMM_labels'].values, q, k, method=method)
     ds = ds.assign(variables={var_name_ds + "_Q": (('k', 'quantile', 'feature'), m_quantiles)})
     ds = ds.assign_coords(coords={'quantile': q})
 
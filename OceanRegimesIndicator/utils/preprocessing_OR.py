@@ -9,8 +9,11 @@ import matplotlib.pyplot as plt
 
 import warnings
 
+from utils.ocean_index import ocean_index, gather, grid_coords, lazy_scatter
+from utils.weekly_mean import weekly_mean
 
-def OR_weekly_mean(ds, var_name, time_var='auto'):
+
+def OR_weekly_mean(ds, var_name, time_var='auto', per_year=False):
     '''Weekly mean in dataset
 
            Parameters
@@ -18,6 +21,8 @@ def OR_weekly_mean(ds, var_name, time_var='auto'):
                ds: input dataset
                var_name: variable we want to use
                time_var: name of time varible. Default: 'auto', variable is automatically detected
+               per_year: if True, one feature per ISO year and week (YYYYWW). Default: False, weeks of all the years
+                         are averaged together (climatology)
 
            Returns
            ------
@@ -36,10 +41,8 @@ def OR_weekly_mean(ds, var_name, time_var='auto'):
             raise ValueError(
                 'Time variable could not be detected. Please, provide it using time_var input.')
 
-    #X = ds.groupby(time_var + ".week").mean()
-    X = ds.groupby(ds[time_var].dt.isocalendar().week).mean()
-    X = X.rename_dims({'week': 'feature'})
-    X = X.rename({'week': 'feature'})
+    # week codes computed once, every variable is reduced with a single scatter-add over the time axis
+    X = weekly_mean(ds, time_var, per_year=per_year)
 
     return X
 
@@ -162,95 +165,154 @@ def OR_check_mask(X, mask, sampling_dims):
     return m_ok
 
 
-def OR_delate_NaNs(X, var_name, mask_path='auto', interp=False):
+def OR_delate_NaNs(X, var_name, mask_path='auto', interp=False, sampling_dims='auto'):
     ''' Delate NaNs in dataset
 
+            The mask is computed once as the flat index of its valid cells (ocean points) and the time series of
+            these cells are gathered directly in a (sampling, feature) array: the whole grid is never stacked. The
+            index is kept in the 'ocean_index' coordinate, it is used in OR_unstack_dataset function.
+
             Parameters
             ----------
-                X: input dataset. It should be stacked including 'sampling' dimension
+                X: input dataset with 'feature', latitude and longitude dimensions. A dataset stacked with
+                   OR_reduce_dims is also accepted (it is unstacked first)
                 var_name: variable we want to use
                 mask_path: path to mask. It should be:
                             - a boolean dataset
                             - variable name should be "mask"
                             - lat and lon dimensition should have the same name than in dataset
                             - lat and lon values should be contained in dataset lat and lon values
-                           Default: 'auto', mask is created from input dataset
+                           Default: 'auto', mask is created from input dataset. A mask dataset (e.g. the mask
+                           saved with a model) can also be given
                 interp: if True interpolation is applied. Default: False
+                sampling_dims: latitude and longitude dimensions. Default: 'auto', dimensions are automatically
+                               detected
 
             Returns
             ------
-                X: dataset without NaNs
-                mask: mask used to delate NaNs. It will be used in OR_unstack_dataset function.
+                X: dataset without NaNs, with 'sampling' dimension and 'ocean_index' coordinate (flat index of each
+                   time series in the mask grid)
+                mask: mask used to delate NaNs, sorted by latitude and longitude. It will be used in
+                      OR_unstack_dataset function.
 
             '''
 
-    if 'sampling' not in list(X.coords.keys()):
-        raise ValueError(
-            'Dataset should contains sampling coordinate. Please, use function reduce_dims to stack coordinates in you dataset.')
     if 'feature' not in list(X.coords.keys()):
         raise ValueError(
             'Dataset should contains feature coordinate. Please, change the name of your feature coordinate to "feature" or use weekly_mean function.')
 
-    sampling_dims = X.get_index('sampling').names
+    if 'sampling' in X.dims:
+        sampling_dims = list(X.get_index('sampling').names)
+        X = X.unstack('sampling')
+    lat_dim, lon_dim = _grid_dims(X, sampling_dims)
+    X = _sort_grid(X[var_name], lat_dim, lon_dim)
 
     # check if we have a mask or not
-    if 'auto' in mask_path:
+    if isinstance(mask_path, xr.Dataset):
+        # mask already loaded (e.g. mask of a trained model)
+        X, mask = _restrict_to_mask(X, mask_path, lat_dim, lon_dim)
+    elif 'auto' in mask_path:
         # create mask
-        stacked_mask = X[var_name].isel(feature=0).notnull()  # 2D mask
-        mask = stacked_mask.unstack('sampling').to_dataset()
-        mask = mask.sortby([sampling_dims[0], sampling_dims[1]])
-        if 'lon' in sampling_dims[0]:
-            mask = mask.transpose(sampling_dims[1], sampling_dims[0], ...)
-        mask = mask.rename({var_name: 'mask'})
+        mask = X.isel(feature=0).notnull().transpose(lat_dim, lon_dim).to_dataset(name='mask')
+        mask = mask.drop_vars([c for c in mask.coords if c not in (lat_dim, lon_dim)])
     else:
         # use mask
         mask = xr.open_dataset(mask_path)
-        m_ok = OR_check_mask(X, mask, sampling_dims)
-        if m_ok:
-            # if mask is smaller than dataset
-            mask_extent = [mask[sampling_dims[0]].values.min(), mask[sampling_dims[0]].values.max(
-            ), mask[sampling_dims[1]].values.min(), mask[sampling_dims[1]].values.max()]
-            dataset_extent = [X[sampling_dims[0]].values.min(), X[sampling_dims[0]].values.max(
-            ), X[sampling_dims[1]].values.min(), X[sampling_dims[1]].values.max()]
-            # if mask smaller then dataset extent
-            if mask_extent != dataset_extent:
-                # I need to unstack and stack the dataset: not very performant
-                X = X.unstack('sampling')
-                X = X.sortby([sampling_dims[0], sampling_dims[1]])
-                X = X.sel({sampling_dims[0]: slice(
-                    mask_extent[0], mask_extent[1]), sampling_dims[1]: slice(mask_extent[2], mask_extent[3])})
-                X = X.stack({'sampling': sampling_dims})
-
-            stacked_mask = mask['mask'].stack({'sampling': sampling_dims})
-
-    # apply mask
-    X = X[var_name].where(stacked_mask == True, drop=True).to_dataset()
-
-    # delate time series all NaNs
-    if np.any(np.isnan(X[var_name].values)):
-        X = X[var_name].where(~X[var_name].isnull(), drop=True).to_dataset()
-
-    # delate time series with any NaN
-    if interp:
+        X, mask = _restrict_to_mask(X, mask, lat_dim, lon_dim)
+
+    # apply mask: ocean points of the mask grid
+    index = ocean_index(mask['mask'].values)
+    values = _gather_grid(X.transpose('feature', lat_dim, lon_dim).data, index)
+    features = X['feature'].values
+
+    nan = np.isnan(values)
+    if np.any(nan):
+        # delate time series all NaNs (and features all NaNs)
+        all_nan = nan.all(axis=1)
+        features_ok = ~nan.all(axis=0)
+        index, values = index[~all_nan], values[~all_nan][:, features_ok]
+        features = features[features_ok]
+        nan = nan[~all_nan][:, features_ok]
+        if not interp:
+            # delate time series with any NaN
+            any_nan = nan.any(axis=1)
+            index, values = index[~any_nan], values[~any_nan]
+            nan = nan[~any_nan]
+
+    lat, lon = grid_coords(mask[lat_dim].values, mask[lon_dim].values, index)
+    X_clean = xr.Dataset({var_name: (('sampling', 'feature'), values, X.attrs)},
+                         coords={'feature': features, lat_dim: ('sampling', lat), lon_dim: ('sampling', lon),
+                                 'ocean_index': ('sampling', index)})
+    X_clean = X_clean.set_index(sampling=[lat_dim, lon_dim])
+
+    if interp and np.any(nan):
         # interpolation
-        if np.any(np.isnan(X[var_name].values)):
-            logging.info('Interpolation is applied')
-            X = X[var_name].interpolate_na(
-                dim='feature', method="linear", fill_value="extrapolate").to_dataset(name=var_name)
-    else:
-        # delate time series with any NaN
-        if np.any(np.isnan(X[var_name].values)):
-            X = X.dropna('sampling', how='any')
+        logging.info('Interpolation is applied')
+        X_clean[var_name] = X_clean[var_name].interpolate_na(dim='feature', method="linear", fill_value="extrapolate")
 
     # check if NaNs in dataset
-    if np.any(np.isnan(X[var_name].values)):
+    if np.any(np.isnan(X_clean[var_name].values)):
         warnings.warn(
             'Dataset contains NaNs after preprocessing. Please, try the option mask_path="auto"')
 
+    return X_clean, mask
+
+
+def _grid_dims(X, sampling_dims='auto'):
+    '''Latitude and longitude dimensions of dataset, detected from the axis attributes if sampling_dims is 'auto'
+    '''
+
+    if 'auto' not in sampling_dims:
+        lat_dim, lon_dim = sampling_dims
+        if 'lon' in lat_dim:
+            lat_dim, lon_dim = lon_dim, lat_dim
+        return lat_dim, lon_dim
+    axis = {X[c].attrs.get('axis'): c for c in X.coords}
+    if 'Y' not in axis or 'X' not in axis:
+        raise ValueError(
+            'Sampling dimensions could not be detected. Please, provide them using sampling_dims input.')
+    return axis['Y'], axis['X']
+
+
+def _gather_grid(grid, index):
+    '''Time series of the cells of index (see gather). A dask-backed grid is gathered block by block in the output
+       array: only the ocean points are kept in memory, the whole grid is never loaded
+    '''
+
+    if isinstance(grid, np.ndarray):
+        return gather(grid, index)
+    import dask.array as da
+
+    values = np.empty((index.size, grid.shape[0]), dtype=grid.dtype)
+    da.store(grid.reshape(grid.shape[0], -1)[:, index].T, values)
+    return values
+
+
+def _restrict_to_mask(X, mask, lat_dim, lon_dim):
+    '''Check the mask, sort it and restrict the dataset to the mask grid
+    '''
+
+    m_ok = OR_check_mask(X, mask, [lat_dim, lon_dim])
+    if m_ok:
+        mask = _sort_grid(mask, lat_dim, lon_dim)
+        mask = mask.transpose(lat_dim, lon_dim, ...)
+        # dataset restricted to the mask grid (mask coordinates values are contained in the dataset ones)
+        X = X.isel({lat_dim: X.get_index(lat_dim).get_indexer(mask[lat_dim].values),
+                    lon_dim: X.get_index(lon_dim).get_indexer(mask[lon_dim].values)})
     return X, mask
 
 
-def OR_scaler(X, var_name, scaler_name='StandardScaler'):
+def _sort_grid(X, lat_dim, lon_dim):
+    '''Sort dataset by latitude and longitude, without copy if it is already sorted
+    '''
+
+    for dim in (lat_dim, lon_dim):
+        if not X.get_index(dim).is_monotonic_increasing:
+            X = X.sortby(dim)
+    return X
+
+
+def OR_scaler(X, var_name, scaler_name='StandardScaler', return_model=False, chunk_size=None):
     ''' Scale data
 
             Parameters
@@ -258,10 +320,15 @@ def OR_scaler(X, var_name, scaler_name='StandardScaler'):
                 X: input dataset. It should include 'sampling' and 'feature' dimensions
                 var_name: variable we want to use
                 scaler_name: options are 'StandardScaler', 'Normalizer' and 'MinMaxScaler'. Default: 'StandardScaler' 
+                return_model: if True, the fitted scaler is also returned. Default: False
+                chunk_size: if given, the scaler is fitted (partial_fit) chunk by chunk of chunk_size time series
+                            and the scaled variable is a dask array: each chunk is scaled when it is read, the scaled
+                            matrix is never held in memory. Default: None, the whole matrix is used at once
 
             Returns
             ------
                 X: dataset including scaled variable
+                scaler: fitted scaler (only if return_model is True)
 
             '''
 
@@ -277,24 +344,39 @@ def OR_scaler(X, var_name, scaler_name='StandardScaler'):
 
     if 'StandardScaler' in scaler_name:
         from sklearn.preprocessing import StandardScaler
-        X_scale = StandardScaler().fit_transform(X[var_name])
+        scaler = StandardScaler()
     elif 'Normalizer' in scaler_name:
         from sklearn.preprocessing import Normalizer
-        X_scale = Normalizer().fit_transform(X[var_name])
+        scaler = Normalizer()
     elif 'MinMaxScaler' in scaler_name:
         from sklearn.preprocessing import MinMaxScaler
-        X_scale = MinMaxScaler().fit_transform(X[var_name])
+        scaler = MinMaxScaler()
     else:
         raise ValueError(
             'scaler_name is not valid. Please, chose between these options: "StandardScaler",  "Normalizer" or "MinMaxScaler".')
+    if chunk_size is None:
+        X_scale = scaler.fit_transform(X[var_name])
+    else:
+        # numpy or dask array, only one chunk is loaded at a time
+        values = X[var_name].data
+        bounds = _chunk_bounds(values.shape[0], chunk_size)
+        if hasattr(scaler, 'partial_fit'):
+            for start, end in bounds:
+                scaler.partial_fit(np.asarray(values[start:end]))
+        else:
+            # Normalizer is stateless
+            scaler.fit(np.asarray(values[:1]))
+        X_scale = _lazy_transform(values, bounds, scaler.transform, values.shape[1])
 
     X = X.assign(
         variables={var_name + "_scaled": (('sampling', 'feature'), X_scale)})
 
+    if return_model:
+        return X, scaler
     return X
 
 
-def OR_apply_PCA(X, var_name, n_components=0.99, plot_var=False):
+def OR_apply_PCA(X, var_name, n_components=0.99, plot_var=False, return_model=False, chunk_size=None):
     ''' Principal components analysis
 
             Parameters
@@ -303,10 +385,18 @@ def OR_apply_PCA(X, var_name, n_components=0.99, plot_var=False):
                 var_name: variable we want to use
                 n_components: percentage of variance to be explained by all components. Default: 0.99
                 plot_var: if True, the percentage of variance explained by each of the components is plotted. Default: False.
+                return_model: if True, the fitted PCA is also returned. Default: False
+                chunk_size: if given, an IncrementalPCA is fitted chunk by chunk of chunk_size time series (a
+                            dask-backed scaled variable is read one chunk at a time) and the reduced variable is a
+                            dask array, each chunk is projected when it is read. The difference between the variance
+                            explained by the selected components and by the full solver is logged and saved in the
+                            'explained_variance_diff' attribute of the reduced variable. Default: None, PCA with the
+                            full solver
 
             Returns
             ------
                 X: dataset including reduced variable and new dimension feature_reduced
+                pca: fitted PCA (only if return_model is True)
 
             '''
 
@@ -320,12 +410,18 @@ def OR_apply_PCA(X, var_name, n_components=0.99, plot_var=False):
     # Check dimensions order
     X = X.transpose("sampling", "feature")
 
-    from sklearn.decomposition import PCA
-    pca = PCA(n_components=n_components, svd_solver='full')
-    pca = pca.fit(X[var_name + "_scaled"])
-    X_reduced = pca.transform(X[var_name + "_scaled"])
-    X = X.assign(
-        variables={var_name + "_reduced": (('sampling', 'feature_reduced'), X_reduced)})
+    if chunk_size is None:
+        from sklearn.decomposition import PCA
+        pca = PCA(n_components=n_components, svd_solver='full')
+        pca = pca.fit(X[var_name + "_scaled"])
+        X_reduced = pca.transform(X[var_name + "_scaled"])
+        X = X.assign(
+            variables={var_name + "_reduced": (('sampling', 'feature_reduced'), X_reduced)})
+    else:
+        pca, X_reduced, variance_diff = _incremental_PCA(X[var_name + "_scaled"].data, n_components, chunk_size)
+        X = X.assign(
+            variables={var_name + "_reduced": (('sampling', 'feature_reduced'), X_reduced)})
+        X[var_name + "_reduced"].attrs['explained_variance_diff'] = variance_diff
 
     if plot_var:
         fig, ax = plt.subplots()
@@ -335,9 +431,138 @@ def OR_apply_PCA(X, var_name, n_components=0.99, plot_var=False):
         ax.set_title(
             'Percentage of variance explained by each of the selected components')
 
+    if return_model:
+        return X, pca
     return X
 
 
+def OR_transform(X, var_name, scaler, pca, chunk_size=None):
+    ''' Scale data and apply principal components analysis with a fitted scaler and PCA (e.g. saved with a model):
+        nothing is fitted, the prediction dataset is projected in the feature space of the training
+
+            Parameters
+            ----------
+                X: input dataset. It should include 'sampling' and 'feature' dimensions
+                var_name: variable we want to use
+                scaler: fitted scaler (see OR_scaler)
+                pca: fitted PCA (see OR_apply_PCA)
+                chunk_size: if given, the scaled and reduced variables are dask arrays: each chunk of chunk_size
+                            time series is scaled and projected when it is read, without a scaled copy of the whole
+                            matrix. Default: None, the whole matrix is used at once
+
+            Returns
+            ------
+                X: dataset including scaled and reduced variables
+
+            '''
+
+    if 'sampling' not in list(X.coords.keys()):
+        raise ValueError(
+            'Dataset should contains sampling coordinate. Please, use function reduce_dims to stack coordinates in you dataset.')
+    if 'feature' not in list(X.coords.keys()):
+        raise ValueError(
+            'Dataset should contains feature coordinate. Please, change the name of your feature coordinate to "feature" or use weekly_mean function.')
+
+    # Check dimensions order
+    X = X.transpose("sampling", "feature")
+
+    if chunk_size is None:
+        X_scale = scaler.transform(X[var_name])
+        X_reduced = pca.transform(X_scale)
+    else:
+        # numpy or dask array, scale and projection of each chunk in a single step
+        values = X[var_name].data
+        bounds = _chunk_bounds(values.shape[0], chunk_size)
+        X_scale = _lazy_transform(values, bounds, scaler.transform, values.shape[1])
+        X_reduced = _lazy_transform(values, bounds, lambda chunk: pca.transform(scaler.transform(chunk)),
+                                    pca.n_components_)
+
+    X = X.assign(
+        variables={var_name + "_scaled": (('sampling', 'feature'), X_scale),
+                   var_name + "_reduced": (('sampling', 'feature_reduced'), X_reduced)})
+    return X
+
+
+def _chunk_bounds(n_samples, chunk_size):
+    '''(start, end) of the chunks of n_samples, a last chunk smaller than chunk_size is merged with the previous one
+    '''
+
+    starts = list(range(0, n_samples, chunk_size))
+    if len(starts) > 1 and n_samples - starts[-1] < chunk_size:
+        starts.pop()
+    return list(zip(starts, starts[1:] + [n_samples]))
+
+
+def _lazy_transform(values, bounds, transform, n_outputs):
+    '''Dask array of transform applied to the chunks (bounds) of the rows of values: nothing is computed until a chunk
+       is read, then only this chunk is loaded and transformed
+    '''
+
+    import dask.array as da
+
+    chunks = (tuple(end - start for start, end in bounds), values.shape[1])
+    if isinstance(values, np.ndarray):
+        values = da.from_array(values, chunks=chunks)
+    else:
+        values = values.rechunk(chunks)
+    return values.map_blocks(lambda chunk: transform(np.asarray(chunk)), dtype=float, chunks=(chunks[0], n_outputs))
+
+
+def _incremental_PCA(values, n_components, chunk_size):
+    '''IncrementalPCA fitted and applied chunk by chunk. With a float n_components, the components explaining this
+       fraction of the variance are kept, as PCA does. The explained variance of the full solver is computed from the
+       covariance matrix accumulated on the same chunks (feature x feature memory). values can be a numpy or a dask
+       array, only one chunk is loaded at a time.
+
+           Returns
+           ------
+               pca: fitted IncrementalPCA
+               X_reduced: reduced values, dask array computed chunk by chunk when it is read
+               variance_diff: variance explained by the kept components minus the one explained by the same number of
+                              components with the full solver
+
+               '''
+
+    from sklearn.decomposition import IncrementalPCA
+
+    n_samples, n_features = values.shape
+    integer_components = isinstance(n_components, (int, np.integer))
+    n_fit = n_components if integer_components else min(n_features, n_samples)
+    bounds = _chunk_bounds(n_samples, max(chunk_size, n_fit))
+
+    pca = IncrementalPCA(n_components=n_fit)
+    total = np.zeros(n_features)
+    gram = np.zeros((n_features, n_features))
+    for start, end in bounds:
+        chunk = np.asarray(values[start:end], dtype=float)
+        pca.partial_fit(chunk)
+        total += chunk.sum(axis=0)
+        gram += chunk.T @ chunk
+
+    if not integer_components:
+        k = int(np.searchsorted(np.cumsum(pca.explained_variance_ratio_), n_components, side='right') + 1)
+        k = min(k, n_fit)
+        pca.noise_variance_ = pca.explained_variance_[k:].mean() if k < n_fit else 0.
+        pca.components_ = pca.components_[:k]
+        pca.explained_variance_ = pca.explained_variance_[:k]
+        pca.explained_variance_ratio_ = pca.explained_variance_ratio_[:k]
+        pca.singular_values_ = pca.singular_values_[:k]
+        pca.n_components_ = pca.n_components = k
+
+    # explained variance of the full solver
+    mean = total / n_samples
+    cov = (gram - n_samples * np.outer(mean, mean)) / max(n_samples - 1, 1)
+    eigenvalues = np.clip(np.linalg.eigvalsh(cov)[::-1], 0, None)
+    full_ratio = eigenvalues / eigenvalues.sum()
+    variance_diff = float(pca.explained_variance_ratio_.sum() - full_ratio[:pca.n_components_].sum())
+    logging.info(f"IncrementalPCA: {pca.n_components_} components explain "
+                 f"{100 * pca.explained_variance_ratio_.sum():.4f}% of the variance, full solver "
+                 f"{100 * full_ratio[:pca.n_components_].sum():.4f}% (difference {variance_diff:.2e})")
+
+    X_reduced = _lazy_transform(values, bounds, pca.transform, pca.n_components_)
+    return pca, X_reduced, variance_diff
+
+
 def OR_unstack_dataset(ds, X, mask, time_var='auto'):
     ''' Unstack dataset and recover attributes
 
@@ -350,7 +575,9 @@ def OR_unstack_dataset(ds, X, mask, time_var='auto'):
 
             Returns
             ------
-                ds_labels: unstack dataset including ds attributes
+                ds_labels: unstack dataset including ds attributes. If X includes the 'ocean_index' coordinate, the
+                           variables with 'sampling' dimension are scattered lazily in the mask grid: they are
+                           computed only when they are used (plot, NetCDF writer)
 
             '''
 
@@ -359,11 +586,16 @@ def OR_unstack_dataset(ds, X, mask, time_var='auto'):
             'Dataset should contains sampling coordinate. Please, use function reduce_dims to stack coordinates in you dataset.')
 
     sampling_dims = X.get_index('sampling').names
-    ds_labels = X.unstack('sampling')
-    # same lat and lon values in mask and in results
-    ds_labels = ds_labels.reindex_like(mask)
-    # sometimes it is necessary to sort lat and lon
-    ds_labels = ds_labels.sortby([sampling_dims[0], sampling_dims[1]])
+    if 'ocean_index' in X.coords:
+        # grid allocated once per variable and filled with the ocean points index (see OR_delate_NaNs)
+        ds_labels = _scatter_dataset(X, mask)
+        sampling_dims = list(mask['mask'].dims)
+    else:
+        ds_labels = X.unstack('sampling')
+        # same lat and lon values in mask and in results
+        ds_labels = ds_labels.reindex_like(mask)
+        # sometimes it is necessary to sort lat and lon
+        ds_labels = ds_labels.sortby([sampling_dims[0], sampling_dims[1]])
 
     # copy atributtes from input dataset
     ds_labels.attrs = ds.attrs
@@ -385,3 +617,27 @@ def OR_unstack_dataset(ds, X, mask, time_var='auto'):
     ds_labels['time'].attrs = ds['time'].attrs
 
     return ds_labels
+
+
+def _scatter_dataset(X, mask):
+    '''Unstack X in the mask grid with the ocean points index, without MultiIndex operations
+    '''
+
+    lat_dim, lon_dim = mask['mask'].dims
+    shape = (mask.sizes[lat_dim], mask.sizes[lon_dim])
+    index = X['ocean_index'].values
+
+    data_vars = dict()
+    for name, var in X.data_vars.items():
+        if 'sampling' not in var.dims:
+            data_vars[name] = var.variable
+            continue
+        var = var.transpose('sampling', ...)
+        data_vars[name] = xr.Variable(var.dims[1:] + (lat_dim, lon_dim),
+                                      lazy_scatter(var.values, index, shape), attrs=var.attrs)
+
+    coords = {name: coord.variable for name, coord in X.coords.items()
+              if 'sampling' not in coord.dims and name not in (lat_dim, lon_dim)}
+    coords[lat_dim] = mask[lat_dim].values
+    coords[lon_dim] = mask[lon_dim].values
+    return xr.Dataset(data_vars, coords=coords, attrs=X.attrs)
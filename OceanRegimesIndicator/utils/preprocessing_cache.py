@@ -0,0 +1,227 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+import xarray as xr
+
+# files of a cache entry
+DATASET_FILE = 'preprocessed.nc'
+MASK_FILE = 'mask.nc'
+MODELS_FILE = 'models.sav'
+ACCESS_FILE = 'last_access'
+
+
+# block size used to read the input files for their content digest
+DIGEST_BLOCK = 4 * 1024 ** 2
+# digests of the input files, kept in the cache directory with the (size, modification time) they were computed for
+DIGESTS_FILE = 'digests.json'
+
+
+def file_digest(path, digests=None):
+    """
+    Content digest of a file, so a file downloaded again with the same content (new modification time) gives the
+    same digest. The file is read sequentially block by block, only if its size or modification time changed since
+    the digest saved in digests.
+
+    Parameters
+    ----------
+    path : file path
+    digests : optional dict abspath -> {'size', 'mtime', 'sha256'} of the digests already computed, updated in place
+
+    Returns
+    -------
+    digest: hexadecimal sha256 string
+    """
+    stat = os.stat(path)
+    abspath = os.path.abspath(path)
+    known = (digests or {}).get(abspath)
+    if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+        return known['sha256']
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DIGEST_BLOCK), b''):
+            sha.update(block)
+    if digests is not None:
+        digests[abspath] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+    return sha.hexdigest()
+
+
+def load_digests(cache_dir):
+    """
+    Read the file digests saved in the cache directory (see file_digest), empty if there are none
+    """
+    try:
+        with open(os.path.join(cache_dir, DIGESTS_FILE)) as digests_file:
+            return json.load(digests_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_digests(cache_dir, digests):
+    """
+    Write the file digests in the cache directory, through a temporary file so a partial file is never read
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp_')
+        with os.fdopen(fd, 'w') as digests_file:
+            json.dump(digests, digests_file)
+        os.replace(tmp_path, os.path.join(cache_dir, DIGESTS_FILE))
+    except OSError as e:
+        logging.warning(f"file digests not saved in the preprocessing cache: {e}")
+
+
+def input_files(file_name):
+    """
+    Input files of load_data: a path, a glob pattern or a list of them
+
+    Returns
+    -------
+    paths: sorted list of the existing files
+    """
+    patterns = [file_name] if isinstance(file_name, (str, os.PathLike)) else list(file_name)
+    return sorted({path for pattern in patterns for path in glob.glob(str(pattern))})
+
+
+def cache_key(file_name, var_name_ds, mask_path, working_domain=None, params=None, load_options=None, cache_dir=None):
+    """
+    Content-addressed key of a preprocessing: hash of the content of the input files (see file_digest), the
+    variable, the mask, the working domain, the load options and the preprocessing parameters
+
+    Parameters
+    ----------
+    file_name : path, glob pattern or list of paths of the NetCDF input files (see load_data)
+    var_name_ds : name of variable in dataset
+    mask_path : path to mask or 'auto'
+    working_domain : working domain dict of the method arguments (box, depth_layers)
+    params : dict of preprocessing parameters
+    load_options : load_data keyword arguments (see data_loader_utils.get_load_options): a lazy load already
+        restricted to the box and the depth range does not hold the same data as a full load
+    cache_dir : optional cache directory, where the digests of the files are kept so an unchanged file is not
+        read again
+
+    Returns
+    -------
+    key: hexadecimal sha256 string
+    """
+    digests = load_digests(cache_dir) if cache_dir else None
+    known = dict(digests) if digests is not None else None
+    files = []
+    for path in input_files(file_name):
+        files.append([os.path.basename(path), file_digest(path, digests)])
+    mask = file_digest(mask_path, digests) if os.path.exists(mask_path) else mask_path
+    if digests is not None and digests != known:
+        save_digests(cache_dir, digests)
+    load_options = load_options or {}
+    load = {'lazy': bool(load_options.get('lazy', False)), 'box': load_options.get('box'),
+            'depth_range': load_options.get('depth_range')}
+    content = json.dumps({'files': files, 'var_name': var_name_ds, 'mask': mask, 'working_domain': working_domain,
+                          'load': load, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def load_entry(cache_dir, key):
+    """
+    Read a cache entry
+
+    Parameters
+    ----------
+    cache_dir : cache directory
+    key : entry key (see cache_key)
+
+    Returns
+    -------
+    x: preprocessed dataset (stacked on the sampling dimension)
+    mask: mask used to delete NaNs
+    models: dict with the fitted 'scaler' and 'pca'
+    None if the entry does not exist
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        return None
+    with xr.open_dataset(os.path.join(entry_dir, DATASET_FILE)) as x:
+        x = x.load()
+    x = x.set_index(sampling=x.attrs.pop('sampling_dims').split(','))
+    with xr.open_dataset(os.path.join(entry_dir, MASK_FILE)) as mask:
+        mask = mask.load()
+    models = joblib.load(os.path.join(entry_dir, MODELS_FILE))
+    # last access time, used for the LRU eviction
+    with open(os.path.join(entry_dir, ACCESS_FILE), 'w') as access_file:
+        access_file.write(str(time.time()))
+    return x, mask, models
+
+
+def save_entry(cache_dir, key, x, mask, models, max_size=2 * 1024 ** 3):
+    """
+    Write a cache entry, then evict the least recently used entries if the cache is bigger than max_size
+
+    Parameters
+    ----------
+    cache_dir : cache directory
+    key : entry key (see cache_key)
+    x : preprocessed dataset (stacked on the sampling dimension)
+    mask : mask used to delete NaNs
+    models : dict with the fitted 'scaler' and 'pca'
+    max_size : max size of the cache in bytes
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # the entry is written in a temporary directory and moved, so a partial entry is never read
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp_')
+    try:
+        sampling_dims = list(x.get_index('sampling').names)
+        x = x.reset_index('sampling')
+        x.attrs['sampling_dims'] = ','.join(sampling_dims)
+        x.to_netcdf(os.path.join(tmp_dir, DATASET_FILE))
+        mask.to_netcdf(os.path.join(tmp_dir, MASK_FILE))
+        joblib.dump(models, os.path.join(tmp_dir, MODELS_FILE))
+        with open(os.path.join(tmp_dir, ACCESS_FILE), 'w') as access_file:
+            access_file.write(str(time.time()))
+        os.rename(tmp_dir, os.path.join(cache_dir, key))
+    except OSError as e:
+        # entry already written by another process, or not writable cache
+        logging.warning(f"preprocessing cache entry {key} not saved: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    evict(cache_dir, max_size=max_size, keep=key)
+
+
+def entry_size(entry_dir):
+    """
+    Size in bytes of a cache entry
+    """
+    return sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+
+
+def evict(cache_dir, max_size, keep=None):
+    """
+    Remove the least recently used entries until the cache size is below max_size
+
+    Parameters
+    ----------
+    cache_dir : cache directory
+    max_size : max size of the cache in bytes
+    keep : key of an entry that is never removed (the one just written)
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, key)
+        if key.startswith('.') or not os.path.isdir(entry_dir):
+            continue
+        access_path = os.path.join(entry_dir, ACCESS_FILE)
+        last_access = os.path.getmtime(access_path) if os.path.exists(access_path) else 0
+        entries.append((last_access, key, entry_size(entry_dir)))
+    total_size = sum(size for _, _, size in entries)
+    for _, key, size in sorted(entries):
+        if total_size <= max_size:
+            break
+        if key == keep:
+            continue
+        logging.info(f"preprocessing cache: evicting entry {key} ({size} bytes)")
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total_size -= size
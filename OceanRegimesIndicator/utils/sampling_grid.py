@@ -0,0 +1,122 @@
+# Decorrelated sampling grid functions file (shared by OceanPatterns and OceanRegimes BIC calculation)
+import numpy as np
+
+
+def mapping_corr_dist(corr_dist, start_point, grid_extent):
+    '''Remapping longitude/latitude grid using a start point. It creates a new grid from the start point
+       where each point is separated the given correlation distance. The grid is computed in closed form:
+       along a meridian (bearing 0 or pi) the latitude step is the angular distance, and along the parallel
+       of the start point the longitude step is constant.
+
+           Parameters
+           ----------
+               corr_dist: correlation distance
+               start_point: latitude and longitude of the start point
+               grid_extent: max and min latitude and longitude of the grid to be remapped
+                    [min lon, max lon, min let, max lat]
+
+           Returns
+           ------
+               new_lats: new latitude vector with points separeted the correlation distance
+               new_lons: new longitude vector with points separeted the correlation distance
+
+               '''
+
+    # angular distance d/earth's radius (km)
+    delta = corr_dist / 6371
+
+    # all in radians (conversion at the end)
+    grid_extent = np.asarray(grid_extent, dtype=float) * np.pi / 180
+    start_point = np.asarray(start_point, dtype=float) * np.pi / 180
+    lon0, lat0 = start_point[0], start_point[1]
+
+    # lat: start point plus n steps north and south, the first point out of the extent is included
+    n_north = max(int(np.ceil((grid_extent[3] - lat0) / delta)), 1)
+    n_south = max(int(np.ceil((lat0 - grid_extent[2]) / delta)), 1)
+    new_lats = lat0 + delta * np.arange(-n_south, n_north + 1)
+    new_lats = np.clip(new_lats, -np.pi / 2, np.pi / 2)
+
+    # lon: bearing pi/2 (east) and -pi/2 (west) from the start point
+    dlon = np.arctan2(np.sin(delta) * np.cos(lat0),
+                      np.cos(delta) - np.sin(lat0) * np.sin(lat0))
+    n_east = max(int(np.ceil((grid_extent[1] - lon0) / dlon)), 1)
+    n_west = max(int(np.ceil((lon0 - grid_extent[0]) / dlon)), 1)
+    new_lons = lon0 + dlon * np.arange(-n_west, n_east + 1)
+
+    return new_lats * 180 / np.pi, new_lons * 180 / np.pi
+
+
+def mapping_corr_time(corr_time, start_point, time_extent):
+    '''Remapping time vector using a start point. It creates a new vector from the start point
+       where elements are separated the time correlation.
+
+           Parameters
+           ----------
+               corr_time: correlation time (months)
+               start_point: date of the start point
+               time_extent: max and min time of the vector to be remapped
+                    [min time, max time]
+
+           Returns
+           ------
+               new_time: new time vector with points separeted the time correlation
+
+               '''
+
+    # we are supossing that 1 month is 30 days for using np.timedelta64
+    step = np.timedelta64(corr_time * 30, 'D')
+    start = np.datetime64(start_point[0])
+    n_after = max(int(np.ceil((np.datetime64(time_extent[1]) - start) / step)), 1)
+    n_before = max(int(np.ceil((start - np.datetime64(time_extent[0])) / step)), 1)
+
+    return start + step * np.arange(-n_before, n_after + 1)
+
+
+def nearest_index(coord_values, targets):
+    '''Index of the nearest coordinate value for each target, ties go to the larger value (same result as xarray
+       sel with method='nearest' on an increasing coordinate).
+
+           Parameters
+           ----------
+               coord_values: 1D coordinate values of the dataset (not necessarily sorted)
+               targets: values to be located
+
+           Returns
+           ------
+               index: integer array with the index in coord_values of the nearest value of each target
+
+               '''
+
+    coord_values = np.asarray(coord_values)
+    targets = np.asarray(targets)
+    if coord_values.size == 1:
+        return np.zeros(targets.shape, dtype=int)
+    order = np.argsort(coord_values)
+    sorted_values = coord_values[order]
+    pos = np.clip(np.searchsorted(sorted_values, targets), 1, sorted_values.size - 1)
+    # choose the left neighbour only when it is strictly nearer (pandas keeps the right one on ties)
+    pos = pos - ((targets - sorted_values[pos - 1]) < (sorted_values[pos] - targets))
+    return order[pos]
+
+
+def mapping_corr_dist_index(corr_dist, start_point, lat_values, lon_values):
+    '''Decorrelated grid (see mapping_corr_dist) given as nearest-neighbour indices into the dataset coordinates,
+       to be used with an integer isel gather.
+
+           Parameters
+           ----------
+               corr_dist: correlation distance
+               start_point: latitude and longitude of the start point
+               lat_values: latitude values of the dataset
+               lon_values: longitude values of the dataset
+
+           Returns
+           ------
+               lat_index: index of the nearest dataset latitude for each point of the new grid
+               lon_index: index of the nearest dataset longitude for each point of the new grid
+
+               '''
+
+    grid_extent = np.array([lon_values.min(), lon_values.max(), lat_values.min(), lat_values.max()])
+    new_lats, new_lons = mapping_corr_dist(corr_dist=corr_dist, start_point=start_point, grid_extent=grid_extent)
+    return nearest_index(lat_values, new_lats), nearest_index(lon_values, new_lons)
@@ -0,0 +1,129 @@
+# Weekly aggregation functions file (climatological and per year weekly means of OceanRegimes)
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def week_codes(times, per_year=False):
+    '''Integer week code of each time step, computed once for all the variables
+
+           Parameters
+           ----------
+               times: time values (datetime64)
+               per_year: if True, weeks of different ISO years are different groups. Default: False, weeks of all
+                         the years are grouped together (climatology)
+
+           Returns
+           ------
+               codes: group of each time step, in [0, n_groups)
+               labels: label of each group, ISO week (1..53) or ISO year * 100 + ISO week if per_year is True
+
+               '''
+
+    iso = pd.DatetimeIndex(times).isocalendar()
+    keys = iso['week'].values.astype(np.int64)
+    if per_year:
+        keys = iso['year'].values.astype(np.int64) * 100 + keys
+    labels, codes = np.unique(keys, return_inverse=True)
+    return codes.ravel(), labels
+
+
+def _group_sums(values, codes, n_groups):
+    '''Sums and counts of the non NaN values of each group along the first axis, with a single reduceat (scatter-add
+       of contiguous groups) over the time steps sorted by group
+
+           Parameters
+           ----------
+               values: numpy array (time, ...)
+               codes: group of each time step (time) or (time, 1, ...)
+               n_groups: number of groups
+
+           Returns
+           ------
+               sums_counts: array (2 * n_groups, ...), sums of the groups followed by the counts
+
+               '''
+
+    codes = np.asarray(codes).ravel()
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    out = np.zeros((2 * n_groups,) + values.shape[1:])
+    if codes.size == 0:
+        return out
+    order = np.argsort(codes, kind='stable')
+    present, starts = np.unique(codes[order], return_index=True)
+    if np.any(order != np.arange(codes.size)):
+        values = values[order]
+        valid = valid[order]
+    out[present] = np.add.reduceat(np.where(valid, values, 0.), starts, axis=0)
+    out[n_groups + present] = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+    return out
+
+
+def group_mean(data, codes, n_groups):
+    '''Mean of the non NaN values of each group along the first axis. Dask arrays are reduced chunk by chunk: each
+       time chunk gives partial sums and counts, which are added, so the memory does not depend on the number of days
+
+           Parameters
+           ----------
+               data: numpy or dask array (time, ...)
+               codes: group of each time step, in [0, n_groups)
+               n_groups: number of groups
+
+           Returns
+           ------
+               mean: array (n_groups, ...), NaN for the groups without valid values
+
+               '''
+
+    if isinstance(data, np.ndarray):
+        sums_counts = _group_sums(data, codes, n_groups)
+        sums, counts = sums_counts[:n_groups], sums_counts[n_groups:]
+    else:
+        import dask.array as da
+
+        shape = (-1,) + (1,) * (data.ndim - 1)
+        codes = da.from_array(np.asarray(codes).reshape(shape), chunks=(data.chunks[0],) + (1,) * (data.ndim - 1))
+        partials = da.map_blocks(_group_sums, data, codes, n_groups, dtype=float,
+                                 chunks=((2 * n_groups,) * len(data.chunks[0]),) + data.chunks[1:])
+        blocks = [partials.blocks[i] for i in range(len(data.chunks[0]))]
+        sums_counts = da.stack(blocks).sum(axis=0)
+        sums, counts = sums_counts[:n_groups], sums_counts[n_groups:]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def weekly_mean(ds, time_var, per_year=False):
+    '''Weekly mean of the variables of ds with a time dimension
+
+           Parameters
+           ----------
+               ds: input dataset
+               time_var: name of time variable
+               per_year: if True, one feature per ISO year and week. Default: False, one feature per ISO week
+
+           Returns
+           ------
+               X: dataset with a new dimension 'feature' instead of time, labelled by the ISO week (or ISO year * 100
+                  + ISO week if per_year is True)
+
+               '''
+
+    time_dim = ds[time_var].dims[0]
+    codes, labels = week_codes(ds[time_var].values, per_year=per_year)
+
+    data_vars = dict()
+    for name, var in ds.data_vars.items():
+        if time_dim not in var.dims:
+            data_vars[name] = var
+            continue
+        var = var.transpose(time_dim, ...)
+        mean = group_mean(var.data, codes, len(labels))
+        if np.issubdtype(var.dtype, np.floating):
+            mean = mean.astype(var.dtype)
+        data_vars[name] = xr.Variable(('feature',) + var.dims[1:], mean, attrs=var.attrs)
+
+    coords = {name: coord for name, coord in ds.coords.items() if time_dim not in coord.dims}
+    coords['feature'] = labels
+    return xr.Dataset(data_vars, coords=coords, attrs=ds.attrs)